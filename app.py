@@ -1,31 +1,184 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, Response, stream_with_context, abort, send_file
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+from werkzeug.datastructures import CallbackDict
+from werkzeug.security import safe_join
+from markupsafe import Markup
 import json
+import base64
+import gzip
+import io
+import mimetypes
+import re
+import shutil
 from datetime import datetime, timedelta
 import random
 import sqlite3
 import os
 import time
+import hashlib
+import hmac
+import heapq
+import math
+import secrets
+import queue
+import threading
+import weakref
+import click
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from functools import lru_cache, wraps
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional; the indexed engine is used without it
+    np = None
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; flight responses fall back to the json module
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; catalog responses fall back to gzip
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:  # rjsmin is optional; build-assets uses minify_js's own pass
+    rjsmin = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    from PIL import Image, features as image_features
+except ImportError:  # Pillow is optional; build-images then only minifies SVGs
+    Image = None
 
 app = Flask(__name__)
 app.secret_key = 'airline_demo_secret_key'
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(BASE_DIR, 'tables.db')
+FLIGHTS_DB_PATH = os.path.join(BASE_DIR, 'flights.db')
+
+# Hour of day at which the flight schedule rolls over to the next service date
+FLIGHT_SCHEDULE_REFRESH_HOUR = int(os.environ.get('FLIGHT_SCHEDULE_REFRESH_HOUR', '0'))
+
+# Days ahead (after today's service date) that flights can be searched and booked
+FLIGHT_BOOKING_HORIZON_DAYS = int(os.environ.get('FLIGHT_BOOKING_HORIZON_DAYS', '330'))
+
+# Service-date partitions each worker keeps in memory; older ones reload from flights.db
+FLIGHT_PARTITIONS_MAX = int(os.environ.get('FLIGHT_PARTITIONS_MAX', '32'))
+
+# Widest +/- window, in days, a flexible-date search on /api/flights may ask for
+FLEXIBLE_DATE_MAX_DAYS = 7
+
+# Optional JSON file overriding entries of FARE_RULES (see PricingEngine)
+FARE_RULES_PATH = os.environ.get('FARE_RULES_PATH')
+
+# Schedules at least this large are searched with the NumPy column store
+FLIGHT_COLUMNAR_MIN_FLIGHTS = int(os.environ.get('FLIGHT_COLUMNAR_MIN_FLIGHTS', '5000'))
+
+# Width in dollars of each bar in the /api/flights price histogram facet
+FLIGHT_PRICE_HISTOGRAM_STEP = 100
+
+# Browser/CDN lifetime of the pre-serialized catalog responses
+CATALOG_MAX_AGE = 3600
+
+# Fingerprinted, minified and precompressed copies of static/js and
+# static/css, written by `flask build-assets` and served from /assets/
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+ASSET_DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+ASSET_SOURCE_DIRS = ('js', 'css')
+ASSET_MAX_AGE = 365 * 24 * 3600
+
+# Responsive variants written by `flask build-images`: widths below the
+# source width, plus the source width itself, in the source format and in
+# each modern format Pillow can encode
+IMAGE_VARIANT_WIDTHS = (160, 320)
+IMAGE_MODERN_FORMATS = ('AVIF', 'WEBP')
+IMAGE_QUALITY = 80
+IMAGE_FORMATS = {
+    'JPEG': ('.jpg', 'image/jpeg'),
+    'PNG': ('.png', 'image/png'),
+    'GIF': ('.gif', 'image/gif'),
+    'WEBP': ('.webp', 'image/webp'),
+    'AVIF': ('.avif', 'image/avif'),
+}
+for _extension, _mimetype in IMAGE_FORMATS.values():
+    mimetypes.add_type(_mimetype, _extension)
+
+# Computed /api/flights result pages kept per worker, and for how many seconds
+SEARCH_CACHE_SIZE = int(os.environ.get('SEARCH_CACHE_SIZE', '512'))
+SEARCH_CACHE_TTL = float(os.environ.get('SEARCH_CACHE_TTL', '30'))
+
+# Connection rules for multi-leg itineraries on /api/itineraries
+MIN_CONNECTION_MINUTES = 45
+MAX_CONNECTION_MINUTES = 6 * 60
+MAX_ITINERARY_CONNECTIONS = 2
+ITINERARY_CACHE_SIZE = 256
+# Connection graphs kept per schedule version (one per service date searched)
+ITINERARY_GRAPH_CACHE_SIZE = 8
+
+# Server-side sessions: 'sqlite' (tables.db, shared by all workers) or
+# 'memory' (per-process LRU, for single-process development servers)
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'sqlite')
+SESSION_MEMORY_MAX = 10000
+SESSION_PURGE_INTERVAL = 300
+
+# scrypt cost for stored passwords (~50 ms per hash) and how many hashes may
+# run or wait at once before sign-ins are turned away
+PASSWORD_SCRYPT_N = 2 ** 14
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', '2'))
+PASSWORD_HASH_MAX_PENDING = 32
+
+# Failed sign-ins allowed in a sliding window: per account from one client
+# IP, and across all accounts from one client IP
+LOGIN_WINDOW_SECONDS = 300
+LOGIN_FAILURES_PER_ACCOUNT = 5
+LOGIN_FAILURES_PER_IP = 50
+
+# Seat holds taken when a traveller opens the booking page; expired holds
+# are released in batches by a background sweeper
+SEAT_HOLD_MINUTES = int(os.environ.get('SEAT_HOLD_MINUTES', '10'))
+SEAT_HOLD_SWEEP_INTERVAL = 5
+SEAT_HOLD_SWEEP_BATCH = 500
+
+# Seconds /api/flights may serve seat counts without re-reading tables.db
+# (writes made by this process show up immediately)
+SEAT_COUNTS_MAX_AGE = 1.0
 
 # Lazy-loaded card grid on /data
-DATA_LAZY_TOTAL_PAGES = 10
+DATA_LAZY_TOTAL_PAGES = int(os.environ.get('DATA_LAZY_TOTAL_PAGES', '10'))
 DATA_ITEMS_PER_PAGE = 12
 
+# Simulated latency of /api/data-page in seconds, off by default. The delay
+# is a blocking time.sleep that holds a sync worker for its whole length, so
+# only turn it on for demos of the lazy-loading grid.
+DATA_PAGE_LATENCY = float(os.environ.get('DATA_PAGE_LATENCY', '0'))
+
+# Rendered /api/data-page bodies kept in memory; pages are deterministic
+DATA_PAGE_CACHE_SIZE = 4096
+
+# Most pages /api/data-pages returns in one response
+DATA_PAGE_BATCH_MAX = 10
+
 DATA_IMAGE_POOL = [
-    '/static/images/svg1.svg',
-    '/static/images/svg2.svg',
-    '/static/images/svg3.svg',
-    '/static/images/svg4.svg',
-    '/static/images/svg5.svg',
-    '/static/images/favicon1.svg',
-    '/static/images/WB.svg',
+    'images/svg1.svg',
+    'images/svg2.svg',
+    'images/svg3.svg',
+    'images/svg4.svg',
+    'images/svg5.svg',
+    'images/favicon1.svg',
+    'images/WB.svg',
 ]
 
 DATA_LABEL_PREFIXES = [
@@ -125,371 +278,3412 @@ COMPANY_CUSTOM_TABLE_ROWS = [
 ]
 
 
+# Airport registry shared by the catalog, the schedule generator and bookings
+AIRPORTS = [
+    {'code': 'JFK', 'name': 'New York (JFK)', 'city': 'New York'},
+    {'code': 'LAX', 'name': 'Los Angeles (LAX)', 'city': 'Los Angeles'},
+    {'code': 'ORD', 'name': 'Chicago (ORD)', 'city': 'Chicago'},
+    {'code': 'DFW', 'name': 'Dallas (DFW)', 'city': 'Dallas'},
+    {'code': 'ATL', 'name': 'Atlanta (ATL)', 'city': 'Atlanta'},
+    {'code': 'MIA', 'name': 'Miami (MIA)', 'city': 'Miami'},
+    {'code': 'SEA', 'name': 'Seattle (SEA)', 'city': 'Seattle'},
+    {'code': 'DEN', 'name': 'Denver (DEN)', 'city': 'Denver'},
+    {'code': 'SFO', 'name': 'San Francisco (SFO)', 'city': 'San Francisco'},
+    {'code': 'BOS', 'name': 'Boston (BOS)', 'city': 'Boston'},
+    {'code': 'LAS', 'name': 'Las Vegas (LAS)', 'city': 'Las Vegas'},
+    {'code': 'PHX', 'name': 'Phoenix (PHX)', 'city': 'Phoenix'},
+    {'code': 'IAH', 'name': 'Houston (IAH)', 'city': 'Houston'},
+    {'code': 'CLT', 'name': 'Charlotte (CLT)', 'city': 'Charlotte'},
+    {'code': 'MCO', 'name': 'Orlando (MCO)', 'city': 'Orlando'},
+    {'code': 'DTW', 'name': 'Detroit (DTW)', 'city': 'Detroit'},
+    {'code': 'FLL', 'name': 'Fort Lauderdale (FLL)', 'city': 'Fort Lauderdale'},
+    {'code': 'BWI', 'name': 'Baltimore (BWI)', 'city': 'Baltimore'},
+    {'code': 'IAD', 'name': 'Washington (IAD)', 'city': 'Washington'},
+    {'code': 'PHL', 'name': 'Philadelphia (PHL)', 'city': 'Philadelphia'}
+]
+
+AIRPORTS_BY_CODE = {a['code']: a for a in AIRPORTS}
+
+# Annual passengers (millions), used to rank autocomplete suggestions
+AIRPORT_TRAFFIC = {
+    'ATL': 104.7, 'DFW': 81.8, 'DEN': 77.8, 'LAX': 75.1, 'ORD': 73.9,
+    'JFK': 62.5, 'MCO': 57.7, 'LAS': 57.6, 'CLT': 53.4, 'MIA': 52.3,
+    'SEA': 50.9, 'SFO': 50.2, 'PHX': 48.8, 'IAH': 46.1, 'BOS': 40.8,
+    'FLL': 35.3, 'DTW': 32.3, 'PHL': 28.3, 'BWI': 26.9, 'IAD': 25.0,
+}
+
+AIRPORT_SUGGEST_LIMIT = 8
+
+
+def _edit_distance(a, b, limit):
+    """Levenshtein distance, giving up (returning ``limit + 1``) once it exceeds ``limit``."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1,
+                               previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class AirportIndex:
+    """Autocomplete over airport code, city and name.
+
+    Every searchable term (code, full city/name and each of their words) is
+    kept in one sorted list, so a prefix lookup is a bisect range. Queries
+    with too few prefix hits fall back to trigram candidates checked with a
+    bounded edit distance. Ties rank by passenger traffic, and answers are
+    memoized since autocomplete traffic repeats the same short prefixes.
+    """
+
+    # Match tiers, best first
+    EXACT_CODE, PREFIX, WORD_PREFIX, FUZZY = range(4)
+
+    def __init__(self, airports, traffic, cache_size=4096):
+        self.airports = airports
+        self.by_code = {a['code'].lower(): i for i, a in enumerate(airports)}
+        by_traffic = sorted(range(len(airports)), key=lambda i: -traffic.get(airports[i]['code'], 0.0))
+        self.rank = [0] * len(airports)
+        for position, i in enumerate(by_traffic):
+            self.rank[i] = position
+        self.trigrams = defaultdict(set)
+        terms = []
+        for i, airport in enumerate(airports):
+            for term in {airport['code'].lower(), airport['city'].lower(), airport['name'].lower()}:
+                terms.append((term, self.PREFIX, i))
+                for word in term.replace('(', ' ').replace(')', ' ').split()[1:]:
+                    terms.append((word, self.WORD_PREFIX, i))
+                for gram in self._grams(term):
+                    self.trigrams[gram].add(i)
+        terms.sort()
+        self.keys = [term for term, _, _ in terms]
+        self.tiers = [tier for _, tier, _ in terms]
+        self.ids = [i for _, _, i in terms]
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _grams(text):
+        padded = f'  {text} '
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def _fuzzy_matches(self, q):
+        overlap = defaultdict(int)
+        for gram in self._grams(q):
+            for i in self.trigrams.get(gram, ()):
+                overlap[i] += 1
+        max_edits = 1 if len(q) <= 4 else 2
+        for i in heapq.nlargest(50, overlap, key=overlap.get):
+            airport = self.airports[i]
+            # Compare against term prefixes a few characters either side of the
+            # query length so dropped and doubled letters count as one edit
+            terms = (airport['city'], airport['name'])
+            if len(q) <= 3:
+                terms += (airport['code'],)
+            if any(_edit_distance(q, term.lower()[:length], max_edits) <= max_edits
+                   for term in terms
+                   for length in range(len(q) - max_edits, len(q) + max_edits + 1)):
+                yield i
+
+    def _rank(self, q, limit):
+        if not q:
+            return sorted(range(len(self.airports)), key=self.rank.__getitem__)[:limit]
+        best = {}
+        lo = bisect_left(self.keys, q)
+        hi = bisect_left(self.keys, q + '\uffff', lo)
+        for tier, i in zip(self.tiers[lo:hi], self.ids[lo:hi]):
+            if best.get(i, self.FUZZY) > tier:
+                best[i] = tier
+        if q in self.by_code:
+            best[self.by_code[q]] = self.EXACT_CODE
+        if len(best) < limit and len(q) >= 2:
+            for i in self._fuzzy_matches(q):
+                best.setdefault(i, self.FUZZY)
+        return heapq.nsmallest(limit, best, key=lambda i: (best[i], self.rank[i]))
+
+    def suggest(self, query, limit=AIRPORT_SUGGEST_LIMIT):
+        key = (' '.join(query.lower().split()), limit)
+        with self._lock:
+            ranked = self._cache.get(key)
+            if ranked is not None:
+                self._cache.move_to_end(key)
+        if ranked is None:
+            ranked = self._rank(key[0], limit)
+            with self._lock:
+                self._cache[key] = ranked
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return [self.airports[i] for i in ranked]
+
+
+airport_index = AirportIndex(AIRPORTS, AIRPORT_TRAFFIC)
+
+
+class PrecompressedJSON:
+    """A JSON payload serialized once, with gzip/brotli variants and strong ETags.
+
+    Serialization matches ``jsonify`` (sorted keys, compact separators).
+    ``If-None-Match`` is answered with 304 only when it names the ETag of
+    the variant the request would get; every response varies on
+    ``Accept-Encoding``.
+    """
+
+    ENCODINGS = ('br', 'gzip')
+
+    def __init__(self, payload, max_age=CATALOG_MAX_AGE):
+        self.max_age = max_age
+        body = json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.variants = {'identity': (body, digest)}
+        self.variants['gzip'] = (gzip.compress(body, 9, mtime=0), f'{digest}-gz')
+        if brotli is not None:
+            self.variants['br'] = (brotli.compress(body), f'{digest}-br')
+
+    def _headers(self, response):
+        response.headers['Cache-Control'] = f'public, max-age={self.max_age}'
+        response.vary.add('Accept-Encoding')
+
+    def response(self, req):
+        encoding = 'identity'
+        for candidate in self.ENCODINGS:
+            if candidate in self.variants and req.accept_encodings[candidate]:
+                encoding = candidate
+                break
+        body, etag = self.variants[encoding]
+        if req.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            self._headers(response)
+            return response
+
+        response = Response(body, mimetype='application/json')
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.set_etag(etag)
+        self._headers(response)
+        return response
+
+
+def precomputed_json(view):
+    """Serve a view's constant return value from pre-serialized bytes.
+
+    The view runs once, at import; requests only pick a variant.
+    """
+    payload = PrecompressedJSON(view())
+
+    @wraps(view)
+    def wrapper():
+        return payload.response(request)
+
+    wrapper.payload = payload
+    return wrapper
+
+
+_JS_WORD = re.compile(r'[\w$\\]')
+_JS_TOKEN = re.compile(r"""
+    (?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+  | (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<space>\s+)
+  | (?P<word>[\w$\\]+)
+  | (?P<other>.)
+""", re.S | re.X)
+_JS_REGEX = re.compile(r'/(?:\\.|\[(?:\\.|[^\]\\\n])*\]|[^/\\\n\[])+/[a-z]*')
+_JS_REGEX_KEYWORDS = {'return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'new', 'delete',
+                      'void', 'throw', 'instanceof', 'yield', 'await'}
+
+
+def _js_template_end(source, pos):
+    """Index just past the template literal opening at ``pos``, nested ones included."""
+    i = pos + 1
+    depth = 0  # open braces inside the current ${...}
+    while i < len(source):
+        char = source[i]
+        if depth == 0:
+            if char == '\\':
+                i += 2
+                continue
+            if char == '`':
+                return i + 1
+            if source.startswith('${', i):
+                depth, i = 1, i + 2
+                continue
+        elif char in '"\'':
+            i = _JS_TOKEN.match(source, i).end()
+            continue
+        elif char == '`':
+            i = _js_template_end(source, i)
+            continue
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+        i += 1
+    return len(source)
+
+
+def minify_js(source):
+    """Strip comments and indentation from JavaScript.
+
+    Uses rjsmin when it is installed. The fallback keeps a newline wherever
+    a line break could matter for semicolon insertion, and leaves strings,
+    template literals and regex literals untouched.
+    """
+    if rjsmin is not None:
+        return rjsmin.jsmin(source)
+    out = []
+    last = ''  # last significant token, to tell a regex from a division
+    space = ''
+    pos = 0
+    while pos < len(source):
+        match = None
+        if source[pos] == '/' and not source.startswith(('//', '/*'), pos) and (
+                not last or last in _JS_REGEX_KEYWORDS or last[-1] in '(,=:[!&|?{};+-*%<>~^'):
+            match = _JS_REGEX.match(source, pos)
+        if match is not None:
+            kind, end = 'regex', match.end()
+        elif source[pos] == '`':
+            kind, end = 'string', _js_template_end(source, pos)
+        else:
+            match = _JS_TOKEN.match(source, pos)
+            kind, end = match.lastgroup, match.end()
+        token = source[pos:end]
+        pos = end
+        if kind in ('space', 'comment'):
+            if '\n' in token:
+                space = '\n'
+            elif not space:
+                space = ' '
+            continue
+        if space and out:
+            prev = out[-1][-1]
+            if space == '\n' and prev not in '{;,' and token[0] != '}':
+                out.append('\n')
+            elif (_JS_WORD.match(prev) and _JS_WORD.match(token[0])) or (prev in '+-' and token[0] in '+-'):
+                out.append(' ')
+        space = ''
+        out.append(token)
+        last = token
+    return ''.join(out) + '\n'
+
+
+_CSS_TOKEN = re.compile(r"""
+    (?P<string>"(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')
+  | (?P<comment>/\*.*?\*/)
+  | (?P<space>\s+)
+  | (?P<punct>[{};,>])
+  | (?P<text>[^"'/\s{};,>]+|/)
+""", re.S | re.X)
+
+
+def minify_css(source):
+    """Strip comments and collapse whitespace in CSS (rcssmin when installed)."""
+    if rcssmin is not None:
+        return rcssmin.cssmin(source)
+    out = []
+    space = False
+    for match in _CSS_TOKEN.finditer(source):
+        kind, token = match.lastgroup, match.group()
+        if kind in ('space', 'comment'):
+            space = True
+            continue
+        if token == '}' and out and out[-1] == ';':
+            out.pop()
+        elif space and out and kind != 'punct' and out[-1] not in '{};,>':
+            out.append(' ')
+        space = False
+        out.append(token)
+    return ''.join(out) + '\n'
+
+
+ASSET_MINIFIERS = {'.js': minify_js, '.css': minify_css}
+
+
+def load_asset_manifest(path=os.path.join(ASSET_DIST_DIR, 'manifest.json')):
+    try:
+        with open(path) as manifest:
+            return json.load(manifest)
+    except FileNotFoundError:
+        return {}
+
+
+def save_asset_manifest(path, manifest):
+    with open(path, 'w') as out:
+        json.dump(manifest, out, indent=2, sort_keys=True)
+
+
+def write_built_asset(dist_dir, folder, name, ext, body, compress=True):
+    """Write ``body`` as ``folder/name.<hash>ext`` under ``dist_dir`` and return that name.
+
+    With ``compress``, ``.gz`` (and ``.br`` when brotli is installed)
+    siblings are written too if they come out smaller.
+    """
+    built = f'{folder}/{name}.{hashlib.sha256(body).hexdigest()[:12]}{ext}'
+    variants = {'': body}
+    if compress:
+        variants['.gz'] = gzip.compress(body, 9, mtime=0)
+        if brotli is not None:
+            variants['.br'] = brotli.compress(body)
+    for suffix, data in variants.items():
+        if suffix and len(data) >= len(body):
+            continue
+        with open(os.path.join(dist_dir, built + suffix), 'wb') as out:
+            out.write(data)
+    return built
+
+
+def build_assets(static_dir=STATIC_DIR, dist_dir=ASSET_DIST_DIR):
+    """Minify, fingerprint and precompress the JS/CSS sources into ``dist_dir``.
+
+    Each ``js/name.js`` becomes ``js/name.<hash>.js`` with ``.gz`` (and,
+    with brotli installed, ``.br``) siblings when those are smaller, and
+    ``manifest.json`` maps source names to built ones. Pages load only
+    their own script, so every file is its own chunk. Manifest entries
+    outside ``ASSET_SOURCE_DIRS`` are kept. Returns the manifest.
+    """
+    manifest_path = os.path.join(dist_dir, 'manifest.json')
+    manifest = load_asset_manifest(manifest_path)
+    for folder in ASSET_SOURCE_DIRS:
+        shutil.rmtree(os.path.join(dist_dir, folder), ignore_errors=True)
+        os.makedirs(os.path.join(dist_dir, folder))
+        manifest = {name: built for name, built in manifest.items() if not name.startswith(f'{folder}/')}
+        for filename in sorted(os.listdir(os.path.join(static_dir, folder))):
+            stem, ext = os.path.splitext(filename)
+            if ext not in ASSET_MINIFIERS:
+                continue
+            with open(os.path.join(static_dir, folder, filename), encoding='utf-8') as source:
+                body = ASSET_MINIFIERS[ext](source.read()).encode('utf-8')
+            manifest[f'{folder}/{filename}'] = write_built_asset(dist_dir, folder, stem, ext, body)
+    save_asset_manifest(manifest_path, manifest)
+    return manifest
+
+
+_SVG_PRESERVE = re.compile(r'(<(text|style|script)\b.*?</\2>)', re.S)
+_SVG_GEOMETRY = re.compile(r'(\s(?:d|points)=")([^"]*)(")')
+
+
+def _compact_path_data(data):
+    data = ' '.join(data.split())
+    data = re.sub(r'(\.\d*?)0+(?![\de])', r'\1', data)  # 21.750 -> 21.75
+    data = re.sub(r'(\d)\.(?!\d)', r'\1', data)  # 196. -> 196
+    data = re.sub(r'(?<![\d.])0\.(?=\d)', '.', data)  # 0.5 -> .5
+    data = re.sub(r'\s*([A-DF-Za-df-z])\s*', r'\1', data)  # no spaces around commands
+    data = re.sub(r'[\s,]+(?=-)', '', data)  # a minus sign already separates numbers
+    return data.strip()
+
+
+def minify_svg(source):
+    """Drop comments, doctype and indentation from SVG and tighten path data.
+
+    ``<text>``, ``<style>`` and ``<script>`` bodies are left exactly as they
+    are, since whitespace can be significant there. Numbers only lose
+    redundant zeros, so the geometry is unchanged.
+    """
+    source = re.sub(r'<!--.*?-->', '', source, flags=re.S)
+    source = re.sub(r'<\?xml\b(?:(?!encoding)[^?])*(?:encoding="utf-8"[^?]*)?\?>', '', source, flags=re.I)
+    source = re.sub(r'<!DOCTYPE[^\[>]*>', '', source)
+    parts = _SVG_PRESERVE.split(source)
+    out = []
+    for i in range(0, len(parts), 3):
+        chunk = re.sub(r'(^|>)\s+(<|$)', r'\1\2', parts[i])
+        out.append(_SVG_GEOMETRY.sub(lambda m: m.group(1) + _compact_path_data(m.group(2)) + m.group(3), chunk))
+        if i + 1 < len(parts):
+            out.append(parts[i + 1])
+    return ''.join(out).strip() + '\n'
+
+
+def _encode_image(image, image_format):
+    buffer = io.BytesIO()
+    if image_format == 'JPEG':
+        image.convert('RGB').save(buffer, 'JPEG', quality=IMAGE_QUALITY, optimize=True, progressive=True)
+    elif image_format == 'PNG':
+        image.save(buffer, 'PNG', optimize=True)
+    else:
+        image.save(buffer, image_format, quality=IMAGE_QUALITY)
+    return buffer.getvalue()
+
+
+def build_images(static_dir=STATIC_DIR, dist_dir=ASSET_DIST_DIR):
+    """Fingerprint static/images into ``dist_dir`` with optimized, responsive variants.
+
+    SVGs are minified and precompressed. With Pillow installed, each still
+    raster image is re-encoded in its own format and in AVIF/WebP at every
+    ``IMAGE_VARIANT_WIDTHS`` width below its size plus its full size, and
+    metadata is dropped. The source bytes are kept whenever a re-encode
+    comes out larger, and a modern format is left out when it isn't
+    smaller than that. Without Pillow raster files are copied as they are.
+    ``manifest.json`` gets each image's full-size URL and ``images.json``
+    its width, height and srcset candidates per MIME type. Returns the
+    ``images.json`` data.
+    """
+    folder = 'images'
+    shutil.rmtree(os.path.join(dist_dir, folder), ignore_errors=True)
+    os.makedirs(os.path.join(dist_dir, folder))
+    manifest_path = os.path.join(dist_dir, 'manifest.json')
+    manifest = {name: built for name, built in load_asset_manifest(manifest_path).items()
+                if not name.startswith(f'{folder}/')}
+    images = {}
+    for filename in sorted(os.listdir(os.path.join(static_dir, folder))):
+        stem, ext = os.path.splitext(filename)
+        path = os.path.join(static_dir, folder, filename)
+        if filename.startswith('.') or not os.path.isfile(path):
+            continue
+        with open(path, 'rb') as source:
+            original = source.read()
+        key = f'{folder}/{filename}'
+        if ext.lower() == '.svg':
+            body = minify_svg(original.decode('utf-8')).encode('utf-8')
+            manifest[key] = write_built_asset(dist_dir, folder, stem, '.svg', body)
+            continue
+        image = Image.open(io.BytesIO(original)) if Image is not None else None
+        if image is None or image.format not in IMAGE_FORMATS or getattr(image, 'n_frames', 1) > 1:
+            manifest[key] = write_built_asset(dist_dir, folder, stem, ext, original, compress=False)
+            continue
+        width, height = image.size
+        widths = [w for w in IMAGE_VARIANT_WIDTHS if w < width] + [width]
+        formats = [image.format] + [f for f in IMAGE_MODERN_FORMATS
+                                    if f != image.format and image_features.check(f.lower())]
+        resized = {w: image if w == width else image.resize((w, round(height * w / width)), Image.LANCZOS)
+                   for w in widths}
+        srcset = {}
+        fallback_size = None
+        for image_format in formats:
+            extension, mimetype = IMAGE_FORMATS[image_format]
+            bodies = {w: _encode_image(resized[w], image_format) for w in widths}
+            if image_format == image.format:
+                if len(bodies[width]) >= len(original):
+                    bodies[width] = original
+                fallback_size = len(bodies[width])
+            elif len(bodies[width]) >= fallback_size:
+                continue  # a modern format that isn't smaller isn't worth a <source>
+            srcset[mimetype] = [[w, write_built_asset(dist_dir, folder, f'{stem}-{w}w', extension, body, compress=False)]
+                                for w, body in bodies.items()]
+        manifest[key] = srcset[IMAGE_FORMATS[image.format][1]][-1][1]
+        images[key] = {'width': width, 'height': height, 'type': IMAGE_FORMATS[image.format][1],
+                       'srcset': srcset}
+    save_asset_manifest(manifest_path, manifest)
+    save_asset_manifest(os.path.join(dist_dir, 'images.json'), images)
+    return images
+
+
+asset_manifest = load_asset_manifest()
+image_manifest = load_asset_manifest(os.path.join(ASSET_DIST_DIR, 'images.json'))
+
+
+@app.template_global()
+def asset_url(filename):
+    """URL for a file under static/, fingerprinted once ``flask build-assets`` has run.
+
+    Debug mode always serves the sources so edits show up without a rebuild.
+    """
+    built = None if app.debug else asset_manifest.get(filename)
+    if built is None:
+        return url_for('static', filename=filename)
+    return url_for('serve_asset', filename=built)
+
+
+@app.template_global()
+def image_srcset(filename, mimetype=None):
+    """``srcset`` for a built image in one format (its own by default).
+
+    Falls back to the plain ``asset_url`` when there are no variants.
+    """
+    entry = None if app.debug else image_manifest.get(filename)
+    candidates = entry['srcset'].get(mimetype or entry['type']) if entry else None
+    if not candidates:
+        return asset_url(filename)
+    return ', '.join(f"{url_for('serve_asset', filename=built)} {width}w" for width, built in candidates)
+
+
+@app.template_global()
+def picture(filename, alt='', sizes=None, **attrs):
+    """``<picture>`` with AVIF/WebP sources and an ``<img>`` fallback for a built image.
+
+    ``sizes`` defaults to the image's own width; extra keyword arguments
+    become ``<img>`` attributes. Unbuilt images render a plain ``<img>``.
+    """
+    entry = None if app.debug else image_manifest.get(filename)
+    attributes = {'src': asset_url(filename), 'alt': alt}
+    sources = []
+    if entry:
+        sizes = sizes or f"{entry['width']}px"
+        attributes.update(srcset=image_srcset(filename), sizes=sizes,
+                          width=entry['width'], height=entry['height'])
+        for mimetype in entry['srcset']:
+            if mimetype != entry['type']:
+                sources.append(Markup('<source type="{}" srcset="{}" sizes="{}">').format(
+                    mimetype, image_srcset(filename, mimetype), sizes))
+    attributes.update(attrs)
+    img = Markup('<img {}>').format(Markup(' ').join(
+        Markup('{}="{}"').format(name, value) for name, value in attributes.items()))
+    return Markup('<picture>{}{}</picture>').format(Markup('').join(sources), img)
+
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Minify, fingerprint and precompress static/js and static/css."""
+    manifest = build_assets()
+    for folder in ASSET_SOURCE_DIRS:
+        built = sorted(value for key, value in manifest.items() if key.startswith(f'{folder}/'))
+        click.echo(f"{folder}: {', '.join(built)}")
+
+
+@app.cli.command('build-images')
+def build_images_command():
+    """Fingerprint static/images with minified SVGs and responsive raster variants."""
+    if Image is None:
+        click.echo('Pillow is not installed; raster images are copied without variants.')
+    images = build_images()
+    for name, entry in sorted(images.items()):
+        formats = ', '.join(mimetype.split('/')[1] for mimetype in entry['srcset'])
+        click.echo(f"{name}: {entry['width']}x{entry['height']} ({formats})")
+
+
 def get_db_connection():
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     return conn
 
 
-def init_company_tables():
-    """Create and seed SQLite tables for both table views."""
-    conn = get_db_connection()
-    cur = conn.cursor()
+class SQLitePool:
+    """Reusable SQLite connections for one database file.
+
+    Connections are opened once with WAL and read-friendly pragmas, so
+    requests skip connection setup and keep sqlite3's per-connection
+    statement cache warm. The pool is dropped after a fork so worker
+    processes never share a connection.
+    """
+
+    PRAGMAS = (
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        'PRAGMA mmap_size=268435456',
+        'PRAGMA cache_size=-16000',
+        'PRAGMA temp_store=MEMORY',
+    )
+
+    def __init__(self, path, max_idle=8, setup=None):
+        self.path = path
+        self.max_idle = max_idle
+        self._pid = None
+        self._idle = None
+        # Runs once per process before the first connection is handed out
+        self._setup = setup
+        self._setup_lock = threading.Lock()
+
+    def _open(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=256)
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        if self._setup is not None:
+            with self._setup_lock:
+                if self._setup is not None:
+                    self._setup()
+                    self._setup = None
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle = queue.LifoQueue(self.max_idle)
+        idle = self._idle
+        try:
+            conn = idle.get_nowait()
+        except queue.Empty:
+            conn = self._open()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+
+table_db = SQLitePool(DB_PATH, setup=lambda: init_company_tables())
+
+# JSON keys for the company table columns, in SELECT order
+COMPANY_ROW_KEYS = ('company', 'city', 'address', 'phone', 'employeeCount')
+
+COMPANY_TABLES = ('company_table', 'company_custom_table')
+
+# Query parameter -> column for server-side sorting and contains-filters
+COMPANY_COLUMNS = {
+    'company': 'company',
+    'city': 'city',
+    'address': 'address',
+    'phone': 'phone',
+    'employeeCount': 'employee_count',
+}
+COMPANY_FTS_COLUMNS = ('company', 'city', 'address')
+COMPANY_PAGE_MAX = 1000
+
+
+def _company_table_indexes(table):
+    """DDL for a company table's secondary indexes and FTS sync triggers.
+
+    Kept separate from the table DDL so bulk seeding can drop them, load,
+    and rebuild them once afterwards.
+    """
+    statements = [
+        f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table} ({column} COLLATE NOCASE, id)"
+        for column in ('company', 'city', 'address', 'phone')
+    ]
+    statements.append(f"CREATE INDEX IF NOT EXISTS idx_{table}_employee_count ON {table} (employee_count, id)")
+    statements.append(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+            INSERT INTO {table}_fts (rowid, company, city, address)
+            VALUES (new.id, new.company, new.city, new.address);
+        END
+        """
+    )
+    statements.append(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+            INSERT INTO {table}_fts ({table}_fts, rowid, company, city, address)
+            VALUES ('delete', old.id, old.company, old.city, old.address);
+        END
+        """
+    )
+    statements.append(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE ON {table} BEGIN
+            INSERT INTO {table}_fts ({table}_fts, rowid, company, city, address)
+            VALUES ('delete', old.id, old.company, old.city, old.address);
+            INSERT INTO {table}_fts (rowid, company, city, address)
+            VALUES (new.id, new.company, new.city, new.address);
+        END
+        """
+    )
+    return statements
+
+
+def _drop_company_table_indexes(cur, table):
+    for column in ('company', 'city', 'address', 'phone', 'employee_count'):
+        cur.execute(f"DROP INDEX IF EXISTS idx_{table}_{column}")
+    for event in ('insert', 'delete', 'update'):
+        cur.execute(f"DROP TRIGGER IF EXISTS {table}_fts_{event}")
+
+
+def _migrate_company_tables(cur):
+    # Two separate tables (one for each visual table on /tables)
+    for table in COMPANY_TABLES:
+        cur.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                company TEXT NOT NULL,
+                city TEXT NOT NULL,
+                address TEXT NOT NULL,
+                phone TEXT NOT NULL,
+                employee_count INTEGER NOT NULL
+            )
+            """
+        )
+
+
+def _migrate_company_search(cur):
+    # Indexes for server-side sorting/keyset paging, plus trigram FTS for
+    # the substring filters on company/city/address
+    for table in COMPANY_TABLES:
+        cur.execute(
+            f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5(
+                company, city, address, content='{table}', content_rowid='id', tokenize='trigram'
+            )
+            """
+        )
+        cur.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')")
+        for statement in _company_table_indexes(table):
+            cur.execute(statement)
+
+
+def _migrate_seed_state(cur):
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS seed_state (
+            name TEXT PRIMARY KEY,
+            checksum TEXT NOT NULL,
+            row_count INTEGER NOT NULL,
+            seeded_at TEXT NOT NULL
+        )
+        """
+    )
+
 
-    # Create two separate tables (one for each visual table on /tables)
+def _migrate_bookings(cur):
+    # Airports are stored by code and resolved through AIRPORTS_BY_CODE
     cur.execute(
         """
-        CREATE TABLE IF NOT EXISTS company_table (
+        CREATE TABLE IF NOT EXISTS bookings (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            company TEXT NOT NULL,
-            city TEXT NOT NULL,
-            address TEXT NOT NULL,
-            phone TEXT NOT NULL,
-            employee_count INTEGER NOT NULL
+            user_email TEXT NOT NULL,
+            airline TEXT NOT NULL,
+            departure_code TEXT NOT NULL,
+            arrival_code TEXT NOT NULL,
+            departure_date TEXT NOT NULL,
+            departure_time TEXT NOT NULL,
+            duration TEXT NOT NULL,
+            aircraft TEXT NOT NULL,
+            price INTEGER NOT NULL,
+            stops INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            seat TEXT NOT NULL,
+            confirmation_number TEXT NOT NULL
         )
         """
     )
+    # Past/upcoming pages are range scans on (user, date); status lookups
+    # stay per user as well
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_bookings_user_date "
+        "ON bookings (user_email, departure_date, departure_time)"
+    )
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_bookings_user_status "
+        "ON bookings (user_email, status, departure_date)"
+    )
+
+
+def _migrate_flight_seats(cur):
+    # Seats sold per scheduled flight; version bumps on every change so
+    # clients can make a booking conditional on what they last saw
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS flight_seats (
+            service_date TEXT NOT NULL,
+            flight_id TEXT NOT NULL,
+            capacity INTEGER NOT NULL,
+            sold INTEGER NOT NULL DEFAULT 0 CHECK (sold <= capacity),
+            version INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (service_date, flight_id)
+        ) WITHOUT ROWID
+        """
+    )
 
+
+def _migrate_seat_holds(cur):
+    # Held seats count against availability until booked, released or expired
+    cur.execute("ALTER TABLE flight_seats ADD COLUMN held INTEGER NOT NULL DEFAULT 0")
     cur.execute(
         """
-        CREATE TABLE IF NOT EXISTS company_custom_table (
+        CREATE TABLE IF NOT EXISTS seat_holds (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            company TEXT NOT NULL,
-            city TEXT NOT NULL,
-            address TEXT NOT NULL,
-            phone TEXT NOT NULL,
-            employee_count INTEGER NOT NULL
+            token TEXT NOT NULL UNIQUE,
+            service_date TEXT NOT NULL,
+            flight_id TEXT NOT NULL,
+            seats INTEGER NOT NULL,
+            user_email TEXT,
+            expires_at REAL NOT NULL
         )
         """
     )
+    # The sweeper walks holds in expiry order
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_seat_holds_expires ON seat_holds (expires_at)")
+
 
-    # Clear and seed first table with primary dataset
-    cur.execute("DELETE FROM company_table")
-    cur.executemany(
+def _migrate_sessions(cur):
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID
         """
-        INSERT INTO company_table (company, city, address, phone, employee_count)
-        VALUES (:company, :city, :address, :phone, :employee_count)
-        """,
-        COMPANY_TABLE_ROWS,
     )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)")
 
-    # Clear and seed second table with a different dataset
-    cur.execute("DELETE FROM company_custom_table")
-    cur.executemany(
+
+def _migrate_fare_calendar(cur):
+    # Lowest fare with seats left per route and day; min_price is NULL when
+    # every flight on the route is sold out
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS fare_calendar (
+            origin TEXT NOT NULL,
+            destination TEXT NOT NULL,
+            service_date TEXT NOT NULL,
+            min_price INTEGER,
+            flights INTEGER NOT NULL,
+            PRIMARY KEY (origin, destination, service_date)
+        ) WITHOUT ROWID
+        """
+    )
+    # Days whose schedule has been folded into fare_calendar
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS fare_calendar_days (
+            service_date TEXT PRIMARY KEY,
+            version TEXT NOT NULL
+        ) WITHOUT ROWID
         """
-        INSERT INTO company_custom_table (company, city, address, phone, employee_count)
-        VALUES (:company, :city, :address, :phone, :employee_count)
-        """,
-        COMPANY_CUSTOM_TABLE_ROWS,
     )
 
-    conn.commit()
-    conn.close()
 
-# Initialize SQLite tables once at import time
-init_company_tables()
+# Schema migrations for tables.db; PRAGMA user_version records how many ran
+DB_MIGRATIONS = [
+    _migrate_company_tables,
+    _migrate_company_search,
+    _migrate_seed_state,
+    _migrate_bookings,
+    _migrate_flight_seats,
+    _migrate_seat_holds,
+    _migrate_sessions,
+    _migrate_fare_calendar,
+]
+
+# Seed data for each company table
+COMPANY_SEEDS = {
+    'company_table': COMPANY_TABLE_ROWS,
+    'company_custom_table': COMPANY_CUSTOM_TABLE_ROWS,
+}
+
+
+def migrate_db(conn):
+    """Apply any migrations newer than the database's ``user_version``."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        cur = conn.cursor()
+        for number, migration in enumerate(DB_MIGRATIONS[version:], version + 1):
+            migration(cur)
+            cur.execute(f"PRAGMA user_version = {number}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def seed_company_table(conn, table, rows, force=False):
+    """Load ``rows`` into ``table`` unless the same seed is already there.
+
+    The seed is checksummed; a matching ``seed_state`` entry means nothing
+    changed and the table is left alone. Otherwise the table is reloaded in
+    one transaction with its indexes and FTS triggers dropped, and those
+    are rebuilt once at the end. Returns whether the table was reloaded.
+    """
+    payload = json.dumps(rows, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    checksum = hashlib.sha256(payload).hexdigest()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT checksum FROM seed_state WHERE name = ?", (table,)).fetchone()
+        if row is not None and row[0] == checksum and not force:
+            conn.rollback()
+            return False
+        cur = conn.cursor()
+        _drop_company_table_indexes(cur, table)
+        cur.execute(f"DELETE FROM {table}")
+        cur.executemany(
+            f"""
+            INSERT INTO {table} (company, city, address, phone, employee_count)
+            VALUES (:company, :city, :address, :phone, :employee_count)
+            """,
+            rows,
+        )
+        for statement in _company_table_indexes(table):
+            cur.execute(statement)
+        cur.execute(f"INSERT INTO {table}_fts ({table}_fts) VALUES ('rebuild')")
+        cur.execute(
+            "INSERT OR REPLACE INTO seed_state (name, checksum, row_count, seeded_at) VALUES (?, ?, ?, ?)",
+            (table, checksum, len(rows), datetime.now().isoformat(timespec='seconds')),
+        )
+        conn.commit()
+        return True
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def init_company_tables(conn=None, force=False):
+    """Migrate tables.db and (re)seed the company tables if their seed changed."""
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    conn.isolation_level = None  # transactions are managed explicitly
+    try:
+        migrate_db(conn)
+        return [table for table, rows in COMPANY_SEEDS.items()
+                if seed_company_table(conn, table, rows, force=force)]
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def company_tables_pool(db_path, **pool_options):
+    """A ``SQLitePool`` on a tables.db at ``db_path`` that migrates and seeds it on first use."""
+    def setup():
+        with closing(sqlite3.connect(db_path)) as conn:
+            init_company_tables(conn)
+    return SQLitePool(db_path, setup=setup, **pool_options)
+
+
+@app.cli.command('init-db')
+@click.option('--force', is_flag=True, help='Reload seed data even if it is unchanged.')
+def init_db_command(force):
+    """Apply migrations and seed tables.db."""
+    reseeded = init_company_tables(force=force)
+    click.echo(f"Reseeded: {', '.join(reseeded)}" if reseeded else 'Seed data unchanged.')
+
+
+@app.cli.command('build-fare-calendar')
+@click.option('--days', type=int, help='Days ahead to fill (default: the whole booking horizon).')
+def build_fare_calendar_command(days):
+    """Materialize the lowest-fare calendar for the booking horizon."""
+    today = flight_inventory.today()
+    if days is None:
+        days = flight_inventory.horizon_days
+    written = sum(fare_calendar.materialize(today + timedelta(days=offset))
+                  for offset in range(min(days, flight_inventory.horizon_days) + 1))
+    click.echo(f'Materialized {written} day(s).')
+
+
+@app.cli.command('reprice')
+@click.option('--date', 'day', help='Service date to reprice, YYYY-MM-DD (default: today).')
+@click.option('--origin', default='', help='Only reprice flights from this airport.')
+@click.option('--destination', default='', help='Only reprice flights to this airport.')
+def reprice_command(day, origin, destination):
+    """Apply the current fare rules (FARE_RULES_PATH) to an already-built schedule."""
+    service_date = datetime.strptime(day, '%Y-%m-%d').date() if day else None
+    try:
+        service_date, changed = reprice_schedule(service_date, origin.upper(), destination.upper())
+    except KeyError:
+        raise click.ClickException('date is outside the booking horizon')
+    click.echo(f'{service_date}: {len(changed)} fare(s) changed')
+
+
+@app.cli.command('pricing-benchmark')
+@click.option('--legs', default=1000000, show_default=True, help='Flight legs to price per batch.')
+@click.option('--rounds', default=3, show_default=True, help='Batches to time.')
+def pricing_benchmark_command(legs, rounds):
+    """Reprice today's schedule, repeated up to ``--legs`` legs, and report legs per second."""
+    columns = PricingEngine.columns(flight_inventory.flights)
+    repeats = -(-legs // len(columns['hours']))
+    for name in ('route_ids', 'hours', 'durations', 'variation_draws', 'adjust_draws'):
+        column = columns[name]
+        columns[name] = np.tile(column, repeats)[:legs] if np is not None else (column * repeats)[:legs]
+    engine = PricingEngine(pricing_engine.rules)
+    for _ in range(rounds):
+        engine.prices(columns)
+    for key, value in engine.stats().items():
+        click.echo(f'{key}: {value:,.1f}' if isinstance(value, float) else f'{key}: {value:,}')
+
+
+@app.cli.command('loadtest-bookings')
+@click.option('--workers', default=32, show_default=True, help='Concurrent booking threads.')
+@click.option('--attempts', default=1000, show_default=True, help='Single-seat bookings to attempt.')
+@click.option('--capacity', type=int, help='Seats on the flight (default: half the attempts).')
+@click.option('--optimistic', is_flag=True, help='Book against the last-read row version and retry.')
+def loadtest_bookings_command(workers, attempts, capacity, optimistic):
+    """Book one flight from many threads and check for lost updates."""
+    import tempfile
+    with tempfile.TemporaryDirectory() as db_dir:
+        result = run_booking_load_test(db_dir, workers, attempts, capacity, optimistic)
+    for key, value in result.items():
+        click.echo(f'{key}: {value:.1f}' if isinstance(value, float) else f'{key}: {value}')
+    if not result['consistent']:
+        raise click.ClickException('seat counts and bookings disagree')
+
+
+def fetch_company_rows(table):
+    """Rows of one of the company tables, keyed for the /tables front end."""
+    with table_db.connection() as conn:
+        rows = conn.execute(
+            f"SELECT company, city, address, phone, employee_count FROM {table} ORDER BY company ASC"
+        ).fetchall()
+    return [dict(zip(COMPANY_ROW_KEYS, row)) for row in rows]
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def query_company_rows(table, args):
+    """Sorted, filtered and paged rows of a company table.
+
+    ``sort``/``dir`` pick the order, each column name in ``COMPANY_COLUMNS``
+    is a case-insensitive contains-filter, and paging is either
+    ``limit``/``offset`` or keyset via the ``after`` token from the previous
+    page. Company/city/address filters of three or more characters go
+    through the trigram FTS index.
+    """
+    where, params = [], []
+    for key, column in COMPANY_COLUMNS.items():
+        needle = args.get(key, '').strip()
+        if not needle:
+            continue
+        if column in COMPANY_FTS_COLUMNS and len(needle) >= 3:
+            where.append(f"id IN (SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH ?)")
+            params.append('{} : "{}"'.format(column, needle.replace('"', '""')))
+        else:
+            where.append(f"CAST({column} AS TEXT) LIKE ? ESCAPE '\\'")
+            params.append(f'%{_escape_like(needle)}%')
+
+    with table_db.connection() as conn:
+        where_sql = f"WHERE {' AND '.join(where)}" if where else ''
+        total = conn.execute(f"SELECT COUNT(*) FROM {table} {where_sql}", params).fetchone()[0]
+
+        column = COMPANY_COLUMNS.get(args.get('sort'), 'company')
+        sort_expr = column if column == 'employee_count' else f'{column} COLLATE NOCASE'
+        direction = 'DESC' if args.get('dir', 'asc').lower() == 'desc' else 'ASC'
+        page_where, page_params = list(where), list(params)
+        after = args.get('after')
+        if after:
+            try:
+                value, last_id = json.loads(base64.urlsafe_b64decode(after + '=' * (-len(after) % 4)))
+            except (ValueError, TypeError):
+                return None
+            page_where.append(f"({sort_expr}, id) {'<' if direction == 'DESC' else '>'} (?, ?)")
+            page_params.extend([value, last_id])
+
+        try:
+            limit = min(max(int(args.get('limit', COMPANY_PAGE_MAX)), 1), COMPANY_PAGE_MAX)
+            offset = 0 if after else max(int(args.get('offset', 0)), 0)
+        except ValueError:
+            return None
+        page_where_sql = f"WHERE {' AND '.join(page_where)}" if page_where else ''
+        rows = conn.execute(
+            f"SELECT company, city, address, phone, employee_count, {column}, id FROM {table} "
+            f"{page_where_sql} ORDER BY {sort_expr} {direction}, id {direction} LIMIT ? OFFSET ?",
+            page_params + [limit, offset],
+        ).fetchall()
+
+    next_after = None
+    if len(rows) == limit:
+        token = json.dumps(rows[-1][-2:], separators=(',', ':')).encode('utf-8')
+        next_after = base64.urlsafe_b64encode(token).decode('ascii').rstrip('=')
+    return {
+        'rows': [dict(zip(COMPANY_ROW_KEYS, row[:5])) for row in rows],
+        'total': total,
+        'next_after': next_after,
+    }
+
+
+def company_table_response(table):
+    # Without query parameters keep the original full-table array response
+    if not request.args:
+        return jsonify(fetch_company_rows(table))
+    result = query_company_rows(table, request.args)
+    if result is None:
+        return jsonify({'error': 'Invalid paging parameters'}), 400
+    return jsonify(result)
+
 
 # APIs for table data
 @app.route('/api/company-table')
 def api_company_table():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT company, city, address, phone, employee_count FROM company_table ORDER BY company ASC"
-    )
-    rows = [
-        {
-            'company': r['company'],
-            'city': r['city'],
-            'address': r['address'],
-            'phone': r['phone'],
-            'employeeCount': r['employee_count'],
-        }
-        for r in cur.fetchall()
-    ]
-    conn.close()
-    return jsonify(rows)
+    return company_table_response('company_table')
 
 
 @app.route('/api/company-custom-table')
 def api_company_custom_table():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT company, city, address, phone, employee_count FROM company_custom_table ORDER BY company ASC"
-    )
-    rows = [
-        {
-            'company': r['company'],
-            'city': r['city'],
-            'address': r['address'],
-            'phone': r['phone'],
-            'employeeCount': r['employee_count'],
-        }
-        for r in cur.fetchall()
-    ]
-    conn.close()
-    return jsonify(rows)
+    return company_table_response('company_custom_table')
 
 
-# Mock user data
-MOCK_USERS = {
-    'demo@example.com': {
-        'password': 'demo123',
-        'name': 'John Smith',
-        'email': 'demo@example.com',
-        'phone': '+1-555-0123',
-        'address': '123 Main St, New York, NY 10001',
-        'date_of_birth': '1985-03-15',
-        'passport_number': 'US123456789',
-        'aadvantage_number': 'AA123456789'
-    }
-}
+class ServerSession(CallbackDict, SessionMixin):
+    """Session data held by a session store; the cookie only carries ``sid``."""
 
-# Mock booking data
-def generate_mock_bookings(user_email):
-    airports = [
-        {'code': 'JFK', 'name': 'New York (JFK)', 'city': 'New York'},
-        {'code': 'LAX', 'name': 'Los Angeles (LAX)', 'city': 'Los Angeles'},
-        {'code': 'ORD', 'name': 'Chicago (ORD)', 'city': 'Chicago'},
-        {'code': 'DFW', 'name': 'Dallas (DFW)', 'city': 'Dallas'},
-        {'code': 'ATL', 'name': 'Atlanta (ATL)', 'city': 'Atlanta'},
-        {'code': 'MIA', 'name': 'Miami (MIA)', 'city': 'Miami'},
-        {'code': 'SEA', 'name': 'Seattle (SEA)', 'city': 'Seattle'},
-        {'code': 'DEN', 'name': 'Denver (DEN)', 'city': 'Denver'},
-        {'code': 'SFO', 'name': 'San Francisco (SFO)', 'city': 'San Francisco'},
-        {'code': 'BOS', 'name': 'Boston (BOS)', 'city': 'Boston'}
-    ]
-    
-    airlines = ['American Airlines', 'American Eagle', 'American Connection']
-    aircraft_types = ['Boeing 737', 'Boeing 777', 'Boeing 787', 'Airbus A320', 'Airbus A321']
-    
+    def __init__(self, initial=None, sid=None, expires_at=None):
+        def on_update(session):
+            session.modified = True
+            session.accessed = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.new = sid is None
+        self.previous_sid = None
+        self.modified = False
+        # Reads are tracked so only responses that used the session vary on Cookie
+        self.accessed = False
+
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def __contains__(self, key):
+        self.accessed = True
+        return super().__contains__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+    def setdefault(self, key, default=None):
+        self.accessed = True
+        return super().setdefault(key, default)
+
+    def regenerate(self):
+        """Move the data to a fresh id, e.g. on sign-in, so an old cookie can't ride along."""
+        self.previous_sid = self.previous_sid or self.sid
+        self.sid = None
+        self.modified = True
+
+
+class SQLiteSessionStore:
+    """Sessions in tables.db, shared by every worker process.
+
+    Lookups are primary-key reads. Expired rows are deleted with a single
+    statement on the ``expires_at`` index, at most every ``purge_interval``
+    seconds as a side effect of a write.
+    """
+
+    def __init__(self, db, purge_interval=SESSION_PURGE_INTERVAL, clock=time.time):
+        self.db = db
+        self.purge_interval = purge_interval
+        self.clock = clock
+        self._next_purge = 0.0
+
+    def get(self, sid):
+        """Return ``(payload, expires_at)`` for a live session, else ``None``."""
+        with self.db.connection() as conn:
+            return conn.execute(
+                "SELECT data, expires_at FROM sessions WHERE id = ? AND expires_at > ?",
+                (sid, self.clock()),
+            ).fetchone()
+
+    def save(self, sid, payload, expires_at):
+        with self.db.connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, data, expires_at) VALUES (?, ?, ?)",
+                (sid, payload, expires_at),
+            )
+            conn.commit()
+        if self.clock() >= self._next_purge:
+            self.purge()
+
+    def touch(self, sid, expires_at):
+        with self.db.connection() as conn:
+            conn.execute("UPDATE sessions SET expires_at = ? WHERE id = ?", (expires_at, sid))
+            conn.commit()
+
+    def delete(self, sid):
+        with self.db.connection() as conn:
+            conn.execute("DELETE FROM sessions WHERE id = ?", (sid,))
+            conn.commit()
+
+    def purge(self):
+        """Drop every expired session. Returns how many were removed."""
+        now = self.clock()
+        self._next_purge = now + self.purge_interval
+        with self.db.connection() as conn:
+            removed = conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,)).rowcount
+            conn.commit()
+        return removed
+
+
+class MemorySessionStore:
+    """Per-process LRU of sessions with the same interface as ``SQLiteSessionStore``.
+
+    Only suitable when one process serves every request; the least
+    recently used sessions are evicted past ``max_entries``.
+    """
+
+    def __init__(self, max_entries=SESSION_MEMORY_MAX, purge_interval=SESSION_PURGE_INTERVAL, clock=time.time):
+        self.max_entries = max_entries
+        self.purge_interval = purge_interval
+        self.clock = clock
+        self._next_purge = 0.0
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            entry = self._sessions.get(sid)
+            if entry is None:
+                return None
+            if entry[1] <= self.clock():
+                del self._sessions[sid]
+                return None
+            self._sessions.move_to_end(sid)
+            return entry
+
+    def save(self, sid, payload, expires_at):
+        with self._lock:
+            self._sessions[sid] = (payload, expires_at)
+            self._sessions.move_to_end(sid)
+            while len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+        if self.clock() >= self._next_purge:
+            self.purge()
+
+    def touch(self, sid, expires_at):
+        with self._lock:
+            entry = self._sessions.get(sid)
+            if entry is not None:
+                self._sessions[sid] = (entry[0], expires_at)
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+    def purge(self):
+        now = self.clock()
+        self._next_purge = now + self.purge_interval
+        with self._lock:
+            expired = [sid for sid, (_, expires_at) in self._sessions.items() if expires_at <= now]
+            for sid in expired:
+                del self._sessions[sid]
+        return len(expired)
+
+
+class ServerSessionInterface(SessionInterface):
+    """Flask session interface backed by a session store.
+
+    The cookie is a random 256-bit id with no signature to check, and the
+    data stays on the server. A session is written only when it changes;
+    otherwise its expiry is pushed out once less than half of
+    ``permanent_session_lifetime`` is left. Static files never touch the
+    store.
+    """
+
+    serializer = session_json_serializer
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if not sid or request.path.startswith(f'{app.static_url_path}/'):
+            return ServerSession()
+        entry = self.store.get(sid)
+        if entry is None:
+            return ServerSession()
+        return ServerSession(self.serializer.loads(entry[0]), sid=sid, expires_at=entry[1])
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add('Cookie')
+        if session.previous_sid:
+            self.store.delete(session.previous_sid)
+        if not session:
+            if session.modified and session.sid:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        expires_at = time.time() + lifetime
+        if session.modified:
+            session.sid = session.sid or secrets.token_urlsafe(32)
+            self.store.save(session.sid, self.serializer.dumps(dict(session)), expires_at)
+        elif session.expires_at - time.time() < lifetime / 2:
+            self.store.touch(session.sid, expires_at)
+        else:
+            return
+        response.set_cookie(
+            name,
+            session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+session_stores = {
+    'sqlite': lambda: SQLiteSessionStore(table_db),
+    'memory': lambda: MemorySessionStore(),
+}
+app.session_interface = ServerSessionInterface(session_stores[SESSION_BACKEND]())
+
+
+# Mock user data
+MOCK_USERS = {
+    'demo@example.com': {
+        # demo123
+        'password_hash': 'scrypt$16384$8$1$Ti8LA+GXXyKOnjtFMl3VCg==$xeJGKC5L2YwAFtfxu5UYyn7FVqgbxv6vhFH4DlMkTf8=',
+        'name': 'John Smith',
+        'email': 'demo@example.com',
+        'phone': '+1-555-0123',
+        'address': '123 Main St, New York, NY 10001',
+        'date_of_birth': '1985-03-15',
+        'passport_number': 'US123456789',
+        'aadvantage_number': 'AA123456789'
+    }
+}
+
+
+class HasherBusy(Exception):
+    """Every password hashing slot is taken."""
+
+
+class PasswordHasher:
+    """scrypt password hashes computed on a small, bounded thread pool.
+
+    ``hashlib.scrypt`` releases the GIL, so hashing doesn't stall other
+    request threads, and the pool caps how many CPUs sign-ins can burn. At
+    most ``workers`` hashes run and ``max_pending`` more wait; past that
+    ``hash``/``verify`` raise ``HasherBusy`` instead of queueing more work.
+    Encoded hashes carry their own parameters: ``scrypt$n$r$p$salt$hash``.
+    """
+
+    def __init__(self, workers=PASSWORD_HASH_WORKERS, max_pending=PASSWORD_HASH_MAX_PENDING,
+                 n=PASSWORD_SCRYPT_N, r=8, p=1):
+        self.workers = workers
+        self.n, self.r, self.p = n, r, p
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._pid = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _derive(password, salt, n, r, p):
+        return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * n * r + 1024 * 1024, dklen=32)
+
+    @staticmethod
+    def encode(salt, digest, n, r, p):
+        return '$'.join(['scrypt', str(n), str(r), str(p),
+                         base64.b64encode(salt).decode('ascii'), base64.b64encode(digest).decode('ascii')])
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy()
+        try:
+            if self._pid != os.getpid():
+                with self._lock:
+                    if self._pid != os.getpid():
+                        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='password-hash')
+                        self._pid = os.getpid()
+            return self._executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        salt = os.urandom(16)
+        digest = self._run(self._derive, password, salt, self.n, self.r, self.p)
+        return self.encode(salt, digest, self.n, self.r, self.p)
+
+    def verify(self, password, encoded):
+        """Check ``password`` against ``encoded``.
+
+        With no ``encoded`` hash (unknown email) a hash is still computed,
+        so the answer takes as long as a wrong password would.
+        """
+        if encoded is None:
+            self.hash(password)
+            return False
+        scheme, n, r, p, salt, digest = encoded.split('$')
+        if scheme != 'scrypt':
+            return False
+        candidate = self._run(self._derive, password, base64.b64decode(salt), int(n), int(r), int(p))
+        return hmac.compare_digest(candidate, base64.b64decode(digest))
+
+
+class SlidingWindowLimiter:
+    """Approximate sliding-window counter per key.
+
+    Each key keeps just ``[window_index, previous_count, current_count]``;
+    the previous window's count is weighted by how much of it still
+    overlaps the sliding window. Keys idle for two windows are dropped by a
+    compaction pass that runs at most once per window.
+    """
+
+    def __init__(self, limit, window, clock=time.monotonic):
+        self.limit = limit
+        self.window = window
+        self.clock = clock
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._next_compaction = 0.0
+
+    def _estimate(self, counter, now):
+        index = int(now // self.window)
+        if counter is None or counter[0] < index - 1:
+            return index, 0, 0, 0.0
+        previous, current = (counter[2], 0) if counter[0] == index - 1 else (counter[1], counter[2])
+        overlap = 1.0 - (now % self.window) / self.window
+        return index, previous, current, previous * overlap + current
+
+    def retry_after(self, key):
+        """Seconds until ``key`` may try again, or 0 if it is under the limit."""
+        now = self.clock()
+        with self._lock:
+            _, _, _, used = self._estimate(self._counters.get(key), now)
+        if used < self.limit:
+            return 0
+        return max(1, int(self.window - now % self.window))
+
+    def hit(self, key):
+        now = self.clock()
+        with self._lock:
+            index, previous, current, _ = self._estimate(self._counters.get(key), now)
+            self._counters[key] = [index, previous, current + 1]
+            if now >= self._next_compaction:
+                self._compact(index)
+                self._next_compaction = now + self.window
+
+    def reset(self, key):
+        with self._lock:
+            self._counters.pop(key, None)
+
+    def _compact(self, index):
+        stale = [key for key, counter in self._counters.items() if counter[0] < index - 1]
+        for key in stale:
+            del self._counters[key]
+
+    def __len__(self):
+        return len(self._counters)
+
+
+password_hasher = PasswordHasher()
+# Failed sign-ins per (email, client IP), so neither a shared NAT address nor
+# someone else's guesses lock an account out; plus failures per client IP,
+# so one address can't spray guesses over many accounts
+login_failures = SlidingWindowLimiter(LOGIN_FAILURES_PER_ACCOUNT, LOGIN_WINDOW_SECONDS)
+login_ip_failures = SlidingWindowLimiter(LOGIN_FAILURES_PER_IP, LOGIN_WINDOW_SECONDS)
+
+
+@app.cli.command('hash-password')
+@click.password_option()
+def hash_password_command(password):
+    """Print the password_hash value for a MOCK_USERS entry."""
+    click.echo(password_hasher.hash(password))
+
+# Mock booking data
+def generate_mock_bookings(user_email, rng=None, now=None):
+    """Mock booking history for ``user_email``.
+
+    ``rng`` and ``now`` default to the module-level ``random`` and
+    ``datetime.now()``; the booking store passes an RNG seeded with the
+    email so a user's history is the same every time it is backfilled.
+    """
+    rng = rng or random
+    now = now or datetime.now()
+    # Bookings only use the first ten (largest) markets
+    airports = AIRPORTS[:10]
+    
+    airlines = ['American Airlines', 'American Eagle', 'American Connection']
+    aircraft_types = ['Boeing 737', 'Boeing 777', 'Boeing 787', 'Airbus A320', 'Airbus A321']
+    
     # Generate 3-5 past bookings and 1-2 upcoming bookings
     bookings = []
     
     # Past bookings
-    for i in range(random.randint(3, 5)):
-        departure_airport = random.choice(airports)
-        arrival_airport = random.choice([a for a in airports if a['code'] != departure_airport['code']])
+    for i in range(rng.randint(3, 5)):
+        departure_airport = rng.choice(airports)
+        arrival_airport = rng.choice([a for a in airports if a['code'] != departure_airport['code']])
         
         # Past date (within last 6 months)
-        days_ago = random.randint(30, 180)
-        departure_date = datetime.now() - timedelta(days=days_ago)
+        days_ago = rng.randint(30, 180)
+        departure_date = now - timedelta(days=days_ago)
         
         # Flight duration between 1-6 hours
-        duration_hours = random.randint(1, 6)
-        duration_minutes = random.randint(0, 59)
+        duration_hours = rng.randint(1, 6)
+        duration_minutes = rng.randint(0, 59)
         
         # Price between $150-$800
-        base_price = random.randint(150, 800)
+        base_price = rng.randint(150, 800)
         
         booking = {
-            'id': f'BK{random.randint(10000, 99999)}',
+            'id': f'BK{rng.randint(10000, 99999)}',
             'type': 'past',
-            'airline': random.choice(airlines),
+            'airline': rng.choice(airlines),
             'departure_airport': departure_airport,
             'arrival_airport': arrival_airport,
             'departure_date': departure_date.strftime('%Y-%m-%d'),
-            'departure_time': f'{random.randint(6, 22):02d}:{random.choice([0, 15, 30, 45]):02d}',
+            'departure_time': f'{rng.randint(6, 22):02d}:{rng.choice([0, 15, 30, 45]):02d}',
             'duration': f'{duration_hours}h {duration_minutes}m',
-            'aircraft': random.choice(aircraft_types),
+            'aircraft': rng.choice(aircraft_types),
             'price': base_price,
-            'stops': random.choice([0, 1]),
+            'stops': rng.choice([0, 1]),
             'status': 'completed',
-            'seat': f'{random.choice(["A", "B", "C", "D", "E", "F"])}{random.randint(1, 30)}',
-            'confirmation_number': f'AA{random.randint(100000, 999999)}'
+            'seat': f'{rng.choice(["A", "B", "C", "D", "E", "F"])}{rng.randint(1, 30)}',
+            'confirmation_number': f'AA{rng.randint(100000, 999999)}'
+        }
+        bookings.append(booking)
+    
+    # Upcoming bookings
+    for i in range(rng.randint(1, 2)):
+        departure_airport = rng.choice(airports)
+        arrival_airport = rng.choice([a for a in airports if a['code'] != departure_airport['code']])
+        
+        # Future date (within next 3 months)
+        days_ahead = rng.randint(7, 90)
+        departure_date = now + timedelta(days=days_ahead)
+        
+        # Flight duration between 1-6 hours
+        duration_hours = rng.randint(1, 6)
+        duration_minutes = rng.randint(0, 59)
+        
+        # Price between $150-$800
+        base_price = rng.randint(150, 800)
+        
+        booking = {
+            'id': f'BK{rng.randint(10000, 99999)}',
+            'type': 'upcoming',
+            'airline': rng.choice(airlines),
+            'departure_airport': departure_airport,
+            'arrival_airport': arrival_airport,
+            'departure_date': departure_date.strftime('%Y-%m-%d'),
+            'departure_time': f'{rng.randint(6, 22):02d}:{rng.choice([0, 15, 30, 45]):02d}',
+            'duration': f'{duration_hours}h {duration_minutes}m',
+            'aircraft': rng.choice(aircraft_types),
+            'price': base_price,
+            'stops': rng.choice([0, 1]),
+            'status': 'confirmed',
+            'seat': f'{rng.choice(["A", "B", "C", "D", "E", "F"])}{rng.randint(1, 30)}',
+            'confirmation_number': f'AA{rng.randint(100000, 999999)}'
+        }
+        bookings.append(booking)
+    
+    return bookings
+
+# Columns of the bookings table, in SELECT/INSERT order
+BOOKING_COLUMNS = (
+    'id', 'airline', 'departure_code', 'arrival_code', 'departure_date', 'departure_time',
+    'duration', 'aircraft', 'price', 'stops', 'status', 'seat', 'confirmation_number',
+)
+BOOKING_TYPES = ('upcoming', 'past')
+BOOKING_PAGE_SIZE = 20
+BOOKING_PAGE_MAX = 200
+
+
+class BookingStore:
+    """Bookings per user in tables.db.
+
+    Rows are keyed by user email and split into upcoming/past by comparing
+    ``departure_date`` with today, so each page is a range scan on the
+    (user_email, departure_date) index however long the history is. A user
+    with no bookings gets a deterministic mock history on first access.
+    """
+
+    def __init__(self, db, clock=datetime.now):
+        self.db = db
+        self.clock = clock
+
+    def _today(self):
+        return self.clock().strftime('%Y-%m-%d')
+
+    def _row_to_booking(self, row, today):
+        booking = dict(zip(BOOKING_COLUMNS, row))
+        booking['id'] = f"BK{booking['id']:05d}"
+        booking['type'] = 'upcoming' if booking['departure_date'] >= today else 'past'
+        booking['departure_airport'] = AIRPORTS_BY_CODE[booking.pop('departure_code')]
+        booking['arrival_airport'] = AIRPORTS_BY_CODE[booking.pop('arrival_code')]
+        return booking
+
+    def _insert(self, conn, user_email, bookings):
+        conn.executemany(
+            f"""
+            INSERT INTO bookings (user_email, {', '.join(BOOKING_COLUMNS[1:])})
+            VALUES (?{', ?' * (len(BOOKING_COLUMNS) - 1)})
+            """,
+            [
+                (user_email, b['airline'], b['departure_airport']['code'], b['arrival_airport']['code'],
+                 b['departure_date'], b['departure_time'], b['duration'], b['aircraft'], b['price'],
+                 b['stops'], b['status'], b['seat'], b['confirmation_number'])
+                for b in bookings
+            ],
+        )
+
+    def add(self, user_email, bookings):
+        """Store booking dicts shaped like ``generate_mock_bookings`` output."""
+        with self.db.connection() as conn:
+            self._insert(conn, user_email, bookings)
+            conn.commit()
+
+    def ensure_seeded(self, user_email):
+        """Backfill a mock history for a user who has no bookings yet."""
+        with self.db.connection() as conn:
+            if conn.execute("SELECT 1 FROM bookings WHERE user_email = ? LIMIT 1", (user_email,)).fetchone():
+                return False
+            conn.execute("BEGIN IMMEDIATE")
+            # Re-check under the write lock so concurrent first visits seed once
+            if conn.execute("SELECT 1 FROM bookings WHERE user_email = ? LIMIT 1", (user_email,)).fetchone():
+                conn.rollback()
+                return False
+            rng = random.Random(user_email)
+            self._insert(conn, user_email, generate_mock_bookings(user_email, rng=rng, now=self.clock()))
+            conn.commit()
+            return True
+
+    def counts(self, user_email):
+        today = self._today()
+        with self.db.connection() as conn:
+            upcoming = conn.execute(
+                "SELECT COUNT(*) FROM bookings WHERE user_email = ? AND departure_date >= ?",
+                (user_email, today),
+            ).fetchone()[0]
+            past = conn.execute(
+                "SELECT COUNT(*) FROM bookings WHERE user_email = ? AND departure_date < ?",
+                (user_email, today),
+            ).fetchone()[0]
+        return {'upcoming': upcoming, 'past': past, 'total': upcoming + past}
+
+    def page(self, user_email, kind, limit=BOOKING_PAGE_SIZE, offset=0):
+        """One page of upcoming (soonest first) or past (latest first) bookings."""
+        if kind not in BOOKING_TYPES:
+            raise ValueError(f'unknown booking type {kind!r}')
+        today = self._today()
+        if kind == 'upcoming':
+            condition, direction = 'departure_date >= ?', 'ASC'
+        else:
+            condition, direction = 'departure_date < ?', 'DESC'
+        with self.db.connection() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT {', '.join(BOOKING_COLUMNS)} FROM bookings
+                WHERE user_email = ? AND {condition}
+                ORDER BY departure_date {direction}, departure_time {direction}, id {direction}
+                LIMIT ? OFFSET ?
+                """,
+                (user_email, today, limit, offset),
+            ).fetchall()
+        return [self._row_to_booking(row, today) for row in rows]
+
+
+booking_store = BookingStore(table_db)
+
+# Common flight routes: base fare, flight length in hours and flights per day
+COMMON_ROUTES = {
+    ('JFK', 'LAX'): {'base_price': 350, 'duration_range': (5, 6), 'freq': 8},
+    ('JFK', 'SFO'): {'base_price': 380, 'duration_range': (6, 7), 'freq': 6},
+    ('JFK', 'MIA'): {'base_price': 220, 'duration_range': (3, 4), 'freq': 12},
+    ('JFK', 'ORD'): {'base_price': 180, 'duration_range': (2, 3), 'freq': 15},
+    ('LAX', 'ORD'): {'base_price': 280, 'duration_range': (4, 5), 'freq': 10},
+    ('LAX', 'DFW'): {'base_price': 250, 'duration_range': (3, 4), 'freq': 12},
+    ('ORD', 'DFW'): {'base_price': 160, 'duration_range': (2, 3), 'freq': 18},
+    ('ATL', 'LAX'): {'base_price': 320, 'duration_range': (4, 5), 'freq': 8},
+    ('ATL', 'SFO'): {'base_price': 350, 'duration_range': (5, 6), 'freq': 6},
+    ('MIA', 'LAX'): {'base_price': 300, 'duration_range': (5, 6), 'freq': 6},
+    ('SEA', 'JFK'): {'base_price': 400, 'duration_range': (5, 6), 'freq': 4},
+    ('DEN', 'JFK'): {'base_price': 280, 'duration_range': (3, 4), 'freq': 10},
+    ('BOS', 'LAX'): {'base_price': 380, 'duration_range': (6, 7), 'freq': 4},
+    ('LAS', 'JFK'): {'base_price': 320, 'duration_range': (4, 5), 'freq': 6},
+    ('PHX', 'JFK'): {'base_price': 300, 'duration_range': (4, 5), 'freq': 8}
+}
+
+# Fare rules as data. Routes listed in route_base_fares start from that fare,
+# scaled by the departure-hour multiplier and a per-flight variation draw;
+# any other route is priced from its duration and never goes below floor.
+# The floor only applies to those duration-priced (regional) fares, as it
+# always has; listed routes keep whatever their base fare works out to.
+FARE_RULES = {
+    'route_base_fares': {f'{origin}-{destination}': info['base_price']
+                         for (origin, destination), info in COMMON_ROUTES.items()},
+    'hour_multipliers': {6: 1.2, 7: 1.2, 8: 1.2, 19: 1.2, 20: 1.2, 21: 1.2,  # peak
+                         10: 0.9, 11: 0.9, 14: 0.9, 15: 0.9},  # off-peak
+    'variation': (0.8, 1.3),
+    'duration_base': 150,
+    'duration_per_hour': 50,
+    'duration_adjust': (-30, 50),
+    'floor': 120,
+}
+
+
+def _mix64(x):
+    """splitmix64 finalizer on Python ints."""
+    x = (x + 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+    return x ^ (x >> 31)
+
+
+def _mix64_array(x):
+    """splitmix64 finalizer on a uint64 array; wraps exactly like :func:`_mix64`."""
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+class PricingEngine:
+    """Prices flights from a fare-rules dict in one batch.
+
+    :meth:`columns` pulls what pricing needs out of the flight dicts once
+    (route, departure hour, whole flight hours and two uniform draws keyed
+    by departure date and flight number, so a flight always gets the same
+    draws); :meth:`prices` then evaluates the rules over those columns with
+    NumPy array operations, or a plain loop giving identical prices when
+    NumPy is missing. Changing ``rules`` and repricing needs no new draws.
+    Time spent in :meth:`prices` is counted for :meth:`stats`.
+    """
+
+    def __init__(self, rules=FARE_RULES):
+        self.rules = rules
+        self._lock = threading.Lock()
+        self._legs = 0
+        self._seconds = 0.0
+
+    @staticmethod
+    def columns(flights):
+        routes, route_ids, hours, durations, keys = {}, [], [], [], []
+        ordinals = {}
+        for flight in flights:
+            route = f"{flight['departure_airport']['code']}-{flight['arrival_airport']['code']}"
+            route_ids.append(routes.setdefault(route, len(routes)))
+            hours.append(int(flight['departure_time'][:2]))
+            durations.append(parse_duration_minutes(flight['duration']) // 60)
+            day = flight['departure_date']
+            if day not in ordinals:
+                ordinals[day] = datetime.strptime(day, '%Y-%m-%d').toordinal()
+            keys.append((ordinals[day] << 33) | (int(flight['id'][2:]) << 1))
+        if np is not None:
+            keys = np.array(keys, dtype=np.uint64)
+            draws = [(_mix64_array(keys | np.uint64(k)) >> np.uint64(11)) * 2.0 ** -53 for k in (0, 1)]
+            route_ids, hours, durations = (np.array(column, dtype=np.int64)
+                                           for column in (route_ids, hours, durations))
+        else:
+            draws = [[(_mix64(key | k) >> 11) * 2.0 ** -53 for key in keys] for k in (0, 1)]
+        return {'routes': list(routes), 'route_ids': route_ids, 'hours': hours,
+                'durations': durations, 'variation_draws': draws[0], 'adjust_draws': draws[1]}
+
+    def prices(self, columns):
+        """Integer fares for every row of ``columns`` under the current rules."""
+        rules = self.rules
+        started = time.perf_counter()
+        base_fares = [rules['route_base_fares'].get(route) for route in columns['routes']]
+        hour_multipliers = [rules['hour_multipliers'].get(hour, 1.0) for hour in range(24)]
+        low, high = rules['variation']
+        adjust_low, adjust_high = rules['duration_adjust']
+        if np is not None:
+            base = np.array([float('nan') if fare is None else fare for fare in base_fares])[columns['route_ids']]
+            fixed = base * np.array(hour_multipliers)[columns['hours']] \
+                * (low + columns['variation_draws'] * (high - low))
+            by_duration = rules['duration_base'] + rules['duration_per_hour'] * columns['durations'] \
+                + (adjust_low + np.floor(columns['adjust_draws'] * (adjust_high - adjust_low + 1)))
+            by_duration = np.maximum(by_duration, rules['floor'])
+            result = np.where(np.isnan(base), by_duration, fixed).astype(np.int64).tolist()
+        else:
+            result = []
+            for route_id, hour, hours, variation, adjust in zip(
+                    columns['route_ids'], columns['hours'], columns['durations'],
+                    columns['variation_draws'], columns['adjust_draws']):
+                base = base_fares[route_id]
+                if base is None:
+                    fare = max(int(rules['duration_base'] + rules['duration_per_hour'] * hours
+                                   + (adjust_low + math.floor(adjust * (adjust_high - adjust_low + 1)))),
+                               rules['floor'])
+                else:
+                    fare = int(base * hour_multipliers[hour] * (low + variation * (high - low)))
+                result.append(fare)
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._legs += len(result)
+            self._seconds += elapsed
+        return result
+
+    def reprice(self, flights, rows=None):
+        """Price ``flights`` (or just the indices in ``rows``) under the current rules.
+
+        Returns ``(flights, changed)``: a new list in which only flights whose
+        fare moved are new dicts, and the indices of those flights.
+        """
+        rows = range(len(flights)) if rows is None else list(rows)
+        fares = self.prices(self.columns([flights[i] for i in rows]))
+        repriced = list(flights)
+        changed = []
+        for i, fare in zip(rows, fares):
+            if flights[i]['price'] != fare:
+                repriced[i] = {**flights[i], 'price': fare}
+                changed.append(i)
+        return repriced, changed
+
+    def stats(self):
+        """``{legs, seconds, legs_per_second}`` priced by this engine so far."""
+        with self._lock:
+            legs, seconds = self._legs, self._seconds
+        return {'legs': legs, 'seconds': seconds, 'legs_per_second': legs / seconds if seconds else 0.0}
+
+
+def load_fare_rules(path=None):
+    """FARE_RULES with the top-level entries of the JSON file at ``path`` swapped in."""
+    rules = dict(FARE_RULES)
+    if path:
+        with open(path) as source:
+            rules.update(json.load(source))
+        rules['hour_multipliers'] = {int(hour): value for hour, value in rules['hour_multipliers'].items()}
+    return rules
+
+
+pricing_engine = PricingEngine(load_fare_rules(FARE_RULES_PATH))
+
+
+# Mock flight data
+def generate_mock_flights(rng=None, base_time=None, pricing=None):
+    """Build a day's worth of mock flights.
+
+    ``rng`` and ``base_time`` default to the module-level ``random`` and
+    ``datetime.now()``; the flight inventory passes a seeded RNG and the
+    service date so the schedule is reproducible. Every flight records
+    ``base_time``'s date as its ``departure_date``. Fares come from
+    ``pricing`` (the module's ``pricing_engine`` by default) in one batch
+    once the schedule is laid out.
+    """
+    if rng is None:
+        rng = random
+    if base_time is None:
+        base_time = datetime.now()
+    departure_date = base_time.date().isoformat()
+    airports = AIRPORTS
+    
+    airlines = ['American Airlines', 'American Eagle', 'American Connection']
+    aircraft_types = ['Boeing 737-800', 'Boeing 737 MAX 8', 'Boeing 777-200', 'Boeing 777-300ER', 'Boeing 787-8', 'Boeing 787-9', 'Airbus A320', 'Airbus A321', 'Airbus A321neo', 'Embraer E175', 'Embraer E190']
+    
+    common_routes = COMMON_ROUTES
+    
+    flights = []
+    flight_id_counter = 1000
+    
+    # Generate flights for common routes
+    for (origin_code, dest_code), route_info in common_routes.items():
+        origin_airport = AIRPORTS_BY_CODE[origin_code]
+        dest_airport = AIRPORTS_BY_CODE[dest_code]
+        
+        # Generate multiple flights per route based on frequency
+        for flight_num in range(route_info['freq']):
+            # Generate departure time between 6 AM and 10 PM
+            departure_hour = rng.randint(6, 22)
+            departure_minute = rng.choice([0, 15, 30, 45])
+            
+            # Flight duration based on route
+            duration_hours = rng.randint(*route_info['duration_range'])
+            duration_minutes = rng.randint(0, 59)
+            
+            # Calculate arrival time
+            departure_time = base_time.replace(hour=departure_hour, minute=departure_minute, second=0, microsecond=0)
+            arrival_time = departure_time + timedelta(hours=duration_hours, minutes=duration_minutes)
+            
+            # Stops (mostly nonstop for major routes, some with stops)
+            stops = 0 if rng.random() > 0.2 else 1
+            
+            # Available seats
+            available_seats = rng.randint(5, 50)
+            
+            flight = {
+                'id': f'AA{flight_id_counter}',
+                'airline': rng.choice(airlines),
+                'departure_airport': origin_airport,
+                'arrival_airport': dest_airport,
+                'departure_time': departure_time.strftime('%H:%M'),
+                'arrival_time': arrival_time.strftime('%H:%M'),
+                'duration': f'{duration_hours}h {duration_minutes}m',
+                'aircraft': rng.choice(aircraft_types),
+                'price': None,  # priced below, with the rest of the schedule
+                'stops': stops,
+                'available_seats': available_seats,
+                'route_type': 'major',
+                'departure_date': departure_date
+            }
+            flights.append(flight)
+            flight_id_counter += 1
+    
+    # Generate additional random flights for variety
+    for i in range(100):
+        origin_airport = rng.choice(airports)
+        dest_airport = rng.choice([a for a in airports if a['code'] != origin_airport['code']])
+        
+        # Skip if this route already exists
+        route_key = (origin_airport['code'], dest_airport['code'])
+        if route_key in common_routes:
+            continue
+        
+        # Generate departure time
+        departure_hour = rng.randint(6, 22)
+        departure_minute = rng.choice([0, 15, 30, 45])
+        departure_time = base_time.replace(hour=departure_hour, minute=departure_minute, second=0, microsecond=0)
+        
+        # Flight duration based on distance (estimate); fares follow from it
+        duration_hours = rng.randint(1, 6)
+        duration_minutes = rng.randint(0, 59)
+        arrival_time = departure_time + timedelta(hours=duration_hours, minutes=duration_minutes)
+        
+        # Stops (more likely for longer flights)
+        stops = 0 if duration_hours <= 3 or rng.random() > 0.3 else 1
+        
+        # Available seats
+        available_seats = rng.randint(5, 50)
+        
+        flight = {
+            'id': f'AA{flight_id_counter}',
+            'airline': rng.choice(airlines),
+            'departure_airport': origin_airport,
+            'arrival_airport': dest_airport,
+            'departure_time': departure_time.strftime('%H:%M'),
+            'arrival_time': arrival_time.strftime('%H:%M'),
+            'duration': f'{duration_hours}h {duration_minutes}m',
+            'aircraft': rng.choice(aircraft_types),
+            'price': None,
+            'stops': stops,
+            'available_seats': available_seats,
+            'route_type': 'regional',
+            'departure_date': departure_date
+        }
+        flights.append(flight)
+        flight_id_counter += 1
+    
+    pricing = pricing or pricing_engine
+    for flight, fare in zip(flights, pricing.prices(pricing.columns(flights))):
+        flight['price'] = fare
+    return flights
+
+
+# Departure-time buckets used by the search filters, as inclusive minute ranges
+DEPARTURE_TIME_BUCKETS = {
+    'morning': (6 * 60, 12 * 60 - 1),
+    'afternoon': (12 * 60, 18 * 60 - 1),
+    'evening': (18 * 60, 23 * 60 - 1),
+}
+
+
+def parse_clock_minutes(value):
+    """'14:45' -> 885"""
+    hours, minutes = value.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def parse_duration_minutes(value):
+    """'5h 20m' -> 320"""
+    hours, _, minutes = value.partition('h')
+    minutes = minutes.strip().rstrip('m')
+    return int(hours) * 60 + (int(minutes) if minutes else 0)
+
+
+def departure_time_bucket(minute):
+    for name, (low, high) in DEPARTURE_TIME_BUCKETS.items():
+        if low <= minute <= high:
+            return name
+    return None
+
+
+def price_histogram(counts):
+    """Turn ``{bucket_index: count}`` into sorted histogram bars."""
+    return [
+        {
+            'min': bucket * FLIGHT_PRICE_HISTOGRAM_STEP,
+            'max': (bucket + 1) * FLIGHT_PRICE_HISTOGRAM_STEP - 1,
+            'count': counts[bucket],
+        }
+        for bucket in sorted(counts)
+    ]
+
+
+class FlightQueryEngine:
+    """Indexed, read-only search over one inventory snapshot.
+
+    Numeric fields are parsed once, routes are hash-indexed and price,
+    duration and departure minute are kept as sorted arrays so range filters
+    become bisect slices. A query starts from its most selective candidate
+    list, checks the remaining predicates against the pre-parsed columns and
+    uses a top-k selection for sort + limit.
+    """
+
+    SORT_COLUMNS = {
+        'price': 'price',
+        'duration': 'duration_minutes',
+        'departure': 'departure_minutes',
+        'arrival': 'arrival_minutes',
+        'stops': 'stops',
+    }
+
+    def __init__(self, flights):
+        self.flights = flights
+        self.origin_codes = [f['departure_airport']['code'] for f in flights]
+        self.destination_codes = [f['arrival_airport']['code'] for f in flights]
+        self.airlines = [f['airline'] for f in flights]
+        self.price = [f['price'] for f in flights]
+        self.stops = [f['stops'] for f in flights]
+        self.duration_minutes = [parse_duration_minutes(f['duration']) for f in flights]
+        self.departure_minutes = [parse_clock_minutes(f['departure_time']) for f in flights]
+        self.arrival_minutes = [parse_clock_minutes(f['arrival_time']) for f in flights]
+
+        self.by_id = {f['id']: i for i, f in enumerate(flights)}
+        self.by_route = defaultdict(list)
+        self.by_origin = defaultdict(list)
+        self.by_destination = defaultdict(list)
+        self.by_stops = defaultdict(list)
+        self.by_airline = defaultdict(list)
+        for i in range(len(flights)):
+            self.by_route[(self.origin_codes[i], self.destination_codes[i])].append(i)
+            self.by_origin[self.origin_codes[i]].append(i)
+            self.by_destination[self.destination_codes[i]].append(i)
+            self.by_stops[self.stops[i]].append(i)
+            self.by_airline[self.airlines[i]].append(i)
+
+        self.price_index = self._sorted_index(self.price)
+        self.duration_index = self._sorted_index(self.duration_minutes)
+        self.departure_index = self._sorted_index(self.departure_minutes)
+
+    def __len__(self):
+        return len(self.flights)
+
+    @staticmethod
+    def _sorted_index(values):
+        order = sorted(range(len(values)), key=values.__getitem__)
+        return [values[i] for i in order], order
+
+    @staticmethod
+    def _range(sorted_index, low=None, high=None):
+        keys, order = sorted_index
+        lo = 0 if low is None else bisect_left(keys, low)
+        hi = len(keys) if high is None else bisect_right(keys, high)
+        return order[lo:hi]
+
+    def _candidate_sources(self, origin, destination, min_price, max_price, stops,
+                           airlines, departure_times):
+        """Yield ``(candidates, predicate)`` pairs, one per active filter."""
+        if origin and destination:
+            yield (self.by_route.get((origin, destination), []),
+                   lambda i: self.origin_codes[i] == origin and self.destination_codes[i] == destination)
+        elif origin:
+            yield self.by_origin.get(origin, []), lambda i: self.origin_codes[i] == origin
+        elif destination:
+            yield self.by_destination.get(destination, []), lambda i: self.destination_codes[i] == destination
+
+        if min_price is not None or max_price is not None:
+            low = float('-inf') if min_price is None else min_price
+            high = float('inf') if max_price is None else max_price
+            yield (self._range(self.price_index, min_price, max_price),
+                   lambda i, low=low, high=high: low <= self.price[i] <= high)
+
+        if stops:
+            stops = set(stops)
+            yield ([i for value in stops for i in self.by_stops.get(value, [])],
+                   lambda i: self.stops[i] in stops)
+
+        if airlines:
+            needles = [airline.lower() for airline in airlines]
+            names = {name for name in self.by_airline
+                     if any(needle in name.lower() for needle in needles)}
+            yield ([i for name in names for i in self.by_airline[name]],
+                   lambda i: self.airlines[i] in names)
+
+        buckets = [DEPARTURE_TIME_BUCKETS[name] for name in set(departure_times or ())
+                   if name in DEPARTURE_TIME_BUCKETS]
+        if buckets:
+            yield ([i for low, high in buckets for i in self._range(self.departure_index, low, high)],
+                   lambda i: any(low <= self.departure_minutes[i] <= high for low, high in buckets))
+
+    def candidates(self, origin='', destination='', min_price=None, max_price=None,
+                   stops=(), airlines=(), departure_times=()):
+        """Return the indices of flights matching the filters, unordered.
+
+        ``stops``, ``airlines`` and ``departure_times`` are collections; a
+        flight matches when it matches any of the values given.
+        """
+        sources = sorted(
+            self._candidate_sources(origin, destination, min_price, max_price,
+                                    stops, airlines, departure_times),
+            key=lambda source: len(source[0]),
+        )
+        if not sources:
+            return range(len(self.flights))
+        seed, _ = sources[0]
+        predicates = [predicate for _, predicate in sources[1:]]
+        return [i for i in seed if all(p(i) for p in predicates)]
+
+    def sort_key(self, i, sort_by):
+        """``(key, index)`` position of flight ``i``; unknown sorts keep schedule order."""
+        column = self.SORT_COLUMNS.get(sort_by)
+        return (getattr(self, column)[i] if column else 0, i)
+
+    def order(self, candidates, sort_by='price', limit=50, after=None):
+        """Return the first ``limit`` candidates in ``sort_by`` order.
+
+        ``after`` is a :meth:`sort_key` position to resume from (keyset
+        paging); ``limit=None`` returns every remaining candidate.
+        """
+        column = self.SORT_COLUMNS.get(sort_by)
+        keys = getattr(self, column) if column else None
+        key = (lambda i: (keys[i], i)) if keys is not None else (lambda i: (0, i))
+        if after is not None:
+            candidates = [i for i in candidates if key(i) > after]
+        if limit is None:
+            return sorted(candidates, key=key)
+        return heapq.nsmallest(max(limit, 0), candidates, key=key)
+
+    def select(self, sort_by='price', limit=50, **filters):
+        """Return the indices of matching flights in result order."""
+        return self.order(self.candidates(**filters), sort_by=sort_by, limit=limit)
+
+    def facets(self, candidates):
+        """Count airlines, stops, departure buckets and prices in one pass."""
+        airlines = defaultdict(int)
+        stops = defaultdict(int)
+        departure_times = dict.fromkeys(DEPARTURE_TIME_BUCKETS, 0)
+        prices = defaultdict(int)
+        for i in candidates:
+            airlines[self.airlines[i]] += 1
+            stops[self.stops[i]] += 1
+            bucket = departure_time_bucket(self.departure_minutes[i])
+            if bucket:
+                departure_times[bucket] += 1
+            prices[int(self.price[i] // FLIGHT_PRICE_HISTOGRAM_STEP)] += 1
+        return {
+            'airlines': dict(sorted(airlines.items())),
+            'stops': {str(value): count for value, count in sorted(stops.items())},
+            'departure_times': departure_times,
+            'price_histogram': price_histogram(prices),
+        }
+
+    def search(self, **query):
+        return [self.flights[i] for i in self.select(**query)]
+
+
+class FlightColumnStore:
+    """Columnar NumPy representation of an inventory snapshot.
+
+    Same ``candidates``/``order``/``select``/``search`` interface as
+    :class:`FlightQueryEngine`, but filters run as boolean masks over typed
+    arrays and sort + limit uses ``argpartition``. Airport and airline names
+    are interned to small ints; dicts are only materialized for the rows
+    that survive ``limit``.
+    """
+
+    SORT_COLUMNS = FlightQueryEngine.SORT_COLUMNS
+
+    def __init__(self, flights):
+        if np is None:
+            raise RuntimeError('FlightColumnStore requires numpy')
+        self.flights = flights
+        self.airport_codes = sorted(
+            {f['departure_airport']['code'] for f in flights}
+            | {f['arrival_airport']['code'] for f in flights}
+        )
+        airport_ids = {code: i for i, code in enumerate(self.airport_codes)}
+        self.airline_names = sorted({f['airline'] for f in flights})
+        airline_ids = {name: i for i, name in enumerate(self.airline_names)}
+
+        count = len(flights)
+        self.origin_ids = np.fromiter(
+            (airport_ids[f['departure_airport']['code']] for f in flights), np.int16, count)
+        self.destination_ids = np.fromiter(
+            (airport_ids[f['arrival_airport']['code']] for f in flights), np.int16, count)
+        self.airline_ids = np.fromiter((airline_ids[f['airline']] for f in flights), np.int16, count)
+        self.price = np.fromiter((f['price'] for f in flights), np.float64, count)
+        self.stops = np.fromiter((f['stops'] for f in flights), np.int8, count)
+        self.duration_minutes = np.fromiter(
+            (parse_duration_minutes(f['duration']) for f in flights), np.int32, count)
+        self.departure_minutes = np.fromiter(
+            (parse_clock_minutes(f['departure_time']) for f in flights), np.int16, count)
+        self.arrival_minutes = np.fromiter(
+            (parse_clock_minutes(f['arrival_time']) for f in flights), np.int16, count)
+        self._airport_ids = airport_ids
+        self.by_id = {f['id']: i for i, f in enumerate(flights)}
+
+    def __len__(self):
+        return len(self.flights)
+
+    def _airport_mask(self, column, code):
+        airport_id = self._airport_ids.get(code)
+        if airport_id is None:
+            return np.zeros(len(self), dtype=bool)
+        return column == airport_id
+
+    def mask(self, origin='', destination='', min_price=None, max_price=None,
+             stops=(), airlines=(), departure_times=()):
+        """Return a boolean mask of matching rows (``None`` when unfiltered)."""
+        masks = []
+        if origin:
+            masks.append(self._airport_mask(self.origin_ids, origin))
+        if destination:
+            masks.append(self._airport_mask(self.destination_ids, destination))
+        if min_price is not None:
+            masks.append(self.price >= min_price)
+        if max_price is not None:
+            masks.append(self.price <= max_price)
+        if stops:
+            masks.append(np.isin(self.stops, list(stops)))
+        if airlines:
+            needles = [airline.lower() for airline in airlines]
+            ids = [i for i, name in enumerate(self.airline_names)
+                   if any(needle in name.lower() for needle in needles)]
+            masks.append(np.isin(self.airline_ids, ids))
+        buckets = [DEPARTURE_TIME_BUCKETS[name] for name in set(departure_times or ())
+                   if name in DEPARTURE_TIME_BUCKETS]
+        if buckets:
+            bucket_mask = np.zeros(len(self), dtype=bool)
+            for low, high in buckets:
+                bucket_mask |= (self.departure_minutes >= low) & (self.departure_minutes <= high)
+            masks.append(bucket_mask)
+        if not masks:
+            return None
+        mask = masks[0]
+        for other in masks[1:]:
+            mask &= other
+        return mask
+
+    def candidates(self, **filters):
+        mask = self.mask(**filters)
+        if mask is None:
+            return np.arange(len(self))
+        return np.flatnonzero(mask)
+
+    def sort_key(self, i, sort_by):
+        column = self.SORT_COLUMNS.get(sort_by)
+        return (getattr(self, column)[i].item() if column else 0, i)
+
+    def order(self, candidates, sort_by='price', limit=50, after=None):
+        candidates = np.asarray(candidates, dtype=np.int64)
+        column = self.SORT_COLUMNS.get(sort_by)
+        # Composite key keeps ties in schedule order, matching the indexed engine
+        if column is None:
+            keys = candidates.copy()
+        else:
+            keys = getattr(self, column)[candidates].astype(np.int64) * len(self) + candidates
+        if after is not None:
+            keep = keys > int(after[0]) * len(self) + after[1]
+            keys, candidates = keys[keep], candidates[keep]
+        if limit is None:
+            limit = len(candidates)
+        limit = max(limit, 0)
+        if limit < len(candidates):
+            top = np.argpartition(keys, limit)[:limit] if limit else np.empty(0, np.int64)
+            keys, candidates = keys[top], candidates[top]
+        return candidates[np.argsort(keys, kind='stable')].tolist()
+
+    def select(self, sort_by='price', limit=50, **filters):
+        return self.order(self.candidates(**filters), sort_by=sort_by, limit=limit)
+
+    def facets(self, candidates):
+        candidates = np.asarray(candidates, dtype=np.int64)
+        airline_counts = np.bincount(self.airline_ids[candidates], minlength=len(self.airline_names))
+        stop_counts = np.bincount(self.stops[candidates])
+        departures = self.departure_minutes[candidates]
+        price_counts = np.bincount((self.price[candidates] // FLIGHT_PRICE_HISTOGRAM_STEP).astype(np.int64))
+        return {
+            'airlines': {name: int(count) for name, count in zip(self.airline_names, airline_counts) if count},
+            'stops': {str(value): int(count) for value, count in enumerate(stop_counts) if count},
+            'departure_times': {
+                name: int(np.count_nonzero((departures >= low) & (departures <= high)))
+                for name, (low, high) in DEPARTURE_TIME_BUCKETS.items()
+            },
+            'price_histogram': price_histogram(
+                {bucket: int(count) for bucket, count in enumerate(price_counts) if count}),
+        }
+
+    def search(self, **query):
+        return [self.flights[i] for i in self.select(**query)]
+
+
+def build_query_engine(flights):
+    """Pick the search backend for an inventory snapshot."""
+    if np is not None and len(flights) >= FLIGHT_COLUMNAR_MIN_FLIGHTS:
+        return FlightColumnStore(flights)
+    return FlightQueryEngine(flights)
+
+
+class _PendingResult:
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class FlightInventory:
+    """Pre-built flight schedules shared by all requests, one partition per service date.
+
+    The schedule for a service date is generated once with a date-seeded RNG
+    (or loaded from ``flights.db`` if another worker already built it) and is
+    then served read-only. Partitions live in a dict keyed by date, so any
+    day in the booking horizon (today's service date plus ``horizon_days``)
+    is one lookup away; at most ``max_partitions`` stay in memory, least
+    recently used first out. Days that fall behind today are dropped lazily,
+    from memory when the service date rolls over and from ``flights.db``
+    whenever a new partition is written.
+    """
+
+    def __init__(self, db_path, refresh_hour=0, clock=datetime.now,
+                 horizon_days=FLIGHT_BOOKING_HORIZON_DAYS, max_partitions=FLIGHT_PARTITIONS_MAX):
+        self.db_path = db_path
+        self.refresh_hour = refresh_hour
+        self.clock = clock
+        self.horizon_days = horizon_days
+        self.max_partitions = max_partitions
+        self._lock = threading.Lock()
+        # service_date -> (service_date, version, flights, engine), in LRU order
+        self._partitions = OrderedDict()
+        # service_date -> _PendingResult while one thread builds that partition
+        self._loading = {}
+        self._today = None
+
+    def service_date_for(self, moment):
+        return (moment - timedelta(hours=self.refresh_hour)).date()
+
+    def today(self):
+        return self.service_date_for(self.clock())
+
+    def in_horizon(self, service_date):
+        today = self.today()
+        return today <= service_date <= today + timedelta(days=self.horizon_days)
+
+    def partition(self, service_date=None):
+        """``(service_date, version, flights, engine)`` for a day; today's by default.
+
+        A cold day is loaded outside the lock, so warm days stay available
+        meanwhile; concurrent requests for the same cold day wait for one
+        load. Raises ``KeyError`` for a date outside the booking horizon.
+        """
+        today = self.today()
+        if service_date is None:
+            service_date = today
+        elif not today <= service_date <= today + timedelta(days=self.horizon_days):
+            raise KeyError(service_date)
+        with self._lock:
+            if self._today != today:
+                self._today = today
+                for stale in [day for day in self._partitions if day < today]:
+                    del self._partitions[stale]
+            current = self._partitions.get(service_date)
+            if current is not None:
+                self._partitions.move_to_end(service_date)
+                return current
+            pending = self._loading.get(service_date)
+            leader = pending is None
+            if leader:
+                pending = self._loading[service_date] = _PendingResult()
+        if not leader:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.value
+        try:
+            loaded_date, version, flights = self._load(service_date, today)
+            pending.value = (loaded_date, version, flights, build_query_engine(flights))
+        except Exception as error:
+            pending.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._loading[service_date]
+                if pending.error is None and service_date >= self._today:
+                    self._partitions[service_date] = pending.value
+                    while len(self._partitions) > self.max_partitions:
+                        self._partitions.popitem(last=False)
+            pending.done.set()
+        return pending.value
+
+    def snapshot(self, service_date=None):
+        """Return ``(version, flights)`` for a service date (today by default)."""
+        current = self.partition(service_date)
+        return current[1], current[2]
+
+    def query_engine(self, service_date=None):
+        """Return ``(version, engine)`` for a service date (today by default)."""
+        current = self.partition(service_date)
+        return current[1], current[3]
+
+    def service_snapshot(self, service_date=None):
+        """Return ``(service_date, version, engine)`` for a service date (today by default)."""
+        current = self.partition(service_date)
+        return current[0], current[1], current[3]
+
+    def schedule(self, service_date):
+        """``(version, flights)`` for a day without keeping it in memory, for batch jobs.
+
+        Raises ``KeyError`` for a date outside the booking horizon.
+        """
+        current = self._partitions.get(service_date)
+        if current is not None:
+            return current[1], current[2]
+        today = self.today()
+        if not today <= service_date <= today + timedelta(days=self.horizon_days):
+            raise KeyError(service_date)
+        return self._load(service_date, today)[1:]
+
+    @property
+    def version(self):
+        return self.snapshot()[0]
+
+    @property
+    def flights(self):
+        return self.snapshot()[1]
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS flight_schedule (
+                service_date TEXT PRIMARY KEY,
+                version TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                built_at TEXT NOT NULL
+            )
+            """
+        )
+        return conn
+
+    def _load(self, service_date, today):
+        key = service_date.isoformat()
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT version, payload FROM flight_schedule WHERE service_date = ?",
+                (key,),
+            ).fetchone()
+            if row is not None:
+                return service_date, row[0], json.loads(row[1])
+
+            flights = self._build(service_date)
+            # Another worker may have raced us here; keep whichever landed first
+            self._store(conn, 'INSERT OR IGNORE', service_date, flights)
+            conn.execute("DELETE FROM flight_schedule WHERE service_date < ?", (today.isoformat(),))
+            conn.commit()
+            row = conn.execute(
+                "SELECT version, payload FROM flight_schedule WHERE service_date = ?",
+                (key,),
+            ).fetchone()
+            return service_date, row[0], json.loads(row[1])
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _store(conn, verb, service_date, flights):
+        key = service_date.isoformat()
+        payload = json.dumps(flights, separators=(',', ':'))
+        version = f'{key}-{hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]}'
+        conn.execute(
+            f"{verb} INTO flight_schedule (service_date, version, payload, built_at) VALUES (?, ?, ?, ?)",
+            (key, version, payload, datetime.now().isoformat(timespec='seconds')),
+        )
+        return version
+
+    def reprice(self, pricing, service_date=None, origin='', destination=''):
+        """Re-run ``pricing`` over a day's schedule, or one route of it, and publish the result.
+
+        The repriced schedule gets a new version in ``flights.db`` and in this
+        worker's memory; other workers see it when they next load the day.
+        Returns ``(service_date, flights)`` for the flights whose fare changed.
+        """
+        service_date, _, flights, engine = self.partition(service_date)
+        rows = engine.candidates(origin=origin, destination=destination) if origin or destination else None
+        repriced, changed = pricing.reprice(flights, rows)
+        if changed:
+            conn = self._connect()
+            try:
+                version = self._store(conn, 'INSERT OR REPLACE', service_date, repriced)
+                conn.commit()
+            finally:
+                conn.close()
+            current = (service_date, version, repriced, build_query_engine(repriced))
+            with self._lock:
+                if service_date in self._partitions:
+                    self._partitions[service_date] = current
+        return service_date, [repriced[i] for i in changed]
+
+    def _build(self, service_date):
+        rng = random.Random(f'flight-schedule:{service_date.isoformat()}')
+        base_time = datetime.combine(service_date, datetime.min.time())
+        return generate_mock_flights(rng=rng, base_time=base_time)
+
+
+flight_inventory = FlightInventory(FLIGHTS_DB_PATH, refresh_hour=FLIGHT_SCHEDULE_REFRESH_HOUR)
+
+
+def format_duration(minutes):
+    return f'{minutes // 60}h {minutes % 60}m'
+
+
+class ConnectionGraph:
+    """Time-expanded view of a schedule for connection search.
+
+    Each airport keeps its departures sorted by minute, so the legs that can
+    follow an arrival are a bisect window ``[arrival + MCT, arrival + max
+    wait]``. Arrival minutes are absolute (departure + duration) and may run
+    past midnight.
+    """
+
+    def __init__(self, flights, min_connection=MIN_CONNECTION_MINUTES,
+                 max_connection=MAX_CONNECTION_MINUTES):
+        self.flights = flights
+        self.min_connection = min_connection
+        self.max_connection = max_connection
+        self.origin = [f['departure_airport']['code'] for f in flights]
+        self.destination = [f['arrival_airport']['code'] for f in flights]
+        self.price = [f['price'] for f in flights]
+        self.departure = [parse_clock_minutes(f['departure_time']) for f in flights]
+        self.arrival = [dep + parse_duration_minutes(f['duration'])
+                        for dep, f in zip(self.departure, flights)]
+
+        departures = defaultdict(list)
+        for i, code in enumerate(self.origin):
+            departures[code].append(i)
+        self.departures = {}
+        self.departure_minutes = {}
+        for code, legs in departures.items():
+            legs.sort(key=lambda i: (self.departure[i], i))
+            self.departures[code] = legs
+            self.departure_minutes[code] = [self.departure[i] for i in legs]
+
+    def connections_from(self, airport, arrival):
+        """Legs leaving ``airport`` that respect the connection window after ``arrival``."""
+        minutes = self.departure_minutes.get(airport)
+        if not minutes:
+            return []
+        lo = bisect_left(minutes, arrival + self.min_connection)
+        hi = bisect_right(minutes, arrival + self.max_connection)
+        return self.departures[airport][lo:hi]
+
+    @staticmethod
+    def _dominated(labels, first_departure, arrival, price):
+        return any(d >= first_departure and a <= arrival and p <= price for d, a, p in labels)
+
+    def itineraries(self, origin, destination, max_connections=MAX_ITINERARY_CONNECTIONS):
+        """Return Pareto-optimal (price, duration) leg sequences, cheapest first.
+
+        A breadth-first label expansion bounded by ``max_connections``: a
+        partial itinerary is dropped when another one at the same airport
+        left no earlier, arrived no later and cost no more.
+        """
+        complete = []
+        labels = defaultdict(list)
+        frontier = [((i,), self.arrival[i], self.price[i]) for i in self.departures.get(origin, [])]
+        for depth in range(max_connections + 1):
+            next_frontier = []
+            for legs, arrival, price in frontier:
+                airport = self.destination[legs[-1]]
+                if airport == destination:
+                    complete.append((legs, arrival - self.departure[legs[0]], price))
+                    continue
+                if depth == max_connections:
+                    continue
+                first_departure = self.departure[legs[0]]
+                if self._dominated(labels[airport], first_departure, arrival, price):
+                    continue
+                labels[airport].append((first_departure, arrival, price))
+                visited = {self.origin[leg] for leg in legs}
+                for leg in self.connections_from(airport, arrival):
+                    if self.destination[leg] in visited:
+                        continue
+                    next_frontier.append((legs + (leg,), self.arrival[leg], price + self.price[leg]))
+            frontier = next_frontier
+
+        pareto = []
+        best_duration = None
+        for legs, duration, price in sorted(complete, key=lambda c: (c[2], c[1], c[0])):
+            if best_duration is None or duration < best_duration:
+                pareto.append(legs)
+                best_duration = duration
+        return pareto
+
+    def describe(self, legs):
+        first, last = legs[0], legs[-1]
+        duration = self.arrival[last] - self.departure[first]
+        return {
+            'legs': [self.flights[leg] for leg in legs],
+            'connections': len(legs) - 1,
+            'layovers': [
+                {'airport': self.destination[a], 'minutes': self.departure[b] - self.arrival[a]}
+                for a, b in zip(legs, legs[1:])
+            ],
+            'price': sum(self.price[leg] for leg in legs),
+            'departure_time': self.flights[first]['departure_time'],
+            'arrival_time': self.flights[last]['arrival_time'],
+            'duration': format_duration(duration),
+            'duration_minutes': duration,
+        }
+
+
+class ItinerarySearch:
+    """Connection search over the flight inventory, cached per route and date."""
+
+    def __init__(self, inventory, max_entries=ITINERARY_CACHE_SIZE, max_graphs=ITINERARY_GRAPH_CACHE_SIZE):
+        self.inventory = inventory
+        self.max_entries = max_entries
+        self.max_graphs = max_graphs
+        self._lock = threading.Lock()
+        self._graphs = OrderedDict()  # schedule version -> ConnectionGraph, in LRU order
+        self._cache = OrderedDict()
+
+    def _graph_for(self, version, flights):
+        with self._lock:
+            graph = self._graphs.get(version)
+            if graph is not None:
+                self._graphs.move_to_end(version)
+                return graph
+        # Built outside the lock; if two threads race, the first one stored wins
+        graph = ConnectionGraph(flights)
+        with self._lock:
+            graph = self._graphs.setdefault(version, graph)
+            self._graphs.move_to_end(version)
+            while len(self._graphs) > self.max_graphs:
+                self._graphs.popitem(last=False)
+        return graph
+
+    def search(self, origin, destination, service_date=None, max_connections=MAX_ITINERARY_CONNECTIONS):
+        version, flights = self.inventory.snapshot(service_date)
+        key = (version, origin, destination, max_connections)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        graph = self._graph_for(version, flights)
+        result = [graph.describe(legs)
+                  for legs in graph.itineraries(origin, destination, max_connections)]
+        with self._lock:
+            self._cache[key] = result
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return result
+
+
+itinerary_search = ItinerarySearch(flight_inventory)
+
+
+class SearchCache:
+    """Bounded LRU of computed search results with a TTL and single-flight misses.
+
+    Entries are keyed by ``(scope, version, key)``, so a new schedule version
+    for a scope (a service date) simply misses, and entries for versions no
+    longer asked for age out through the LRU and TTL. Requests still holding
+    an older snapshot keep hitting their own entries without flushing the
+    newer ones. When several threads miss on the
+    same entry at once, one computes it and the rest wait for that result,
+    counted as ``coalesced``.
+    """
+
+    def __init__(self, max_entries=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (scope, version, key) -> (expires_at, value)
+        self._pending = {}
+        self.hits = self.misses = self.coalesced = 0
+
+    def get(self, scope, version, key, compute):
+        """The cached value for ``key``, calling ``compute()`` at most once per concurrent miss."""
+        entry_key = (scope, version, key)
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is not None and entry[0] > self.clock():
+                self._entries.move_to_end(entry_key)
+                self.hits += 1
+                return entry[1]
+            pending = self._pending.get(entry_key)
+            leader = pending is None
+            if leader:
+                pending = self._pending[entry_key] = _PendingResult()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.value
+        try:
+            pending.value = compute()
+        except Exception as error:
+            pending.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._pending[entry_key]
+                if pending.error is None:
+                    self._entries[entry_key] = (self.clock() + self.ttl, pending.value)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+            pending.done.set()
+        return pending.value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'hit_rate': (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            }
+
+
+search_cache = SearchCache()
+
+
+def dumps_bytes(value):
+    """Compact JSON as UTF-8 bytes, with orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+
+class FlightSerializer:
+    """Writes /api/flights bodies from pre-encoded JSON fragments.
+
+    Each airport is encoded once from the catalog. Everything else about a
+    scheduled flight is fixed for its schedule version, so a flight is
+    encoded once per query engine, up to its ``available_seats``, and a
+    response is those fragments joined with the live seat counts. The
+    normalized shape names airports by code and sends each one once in an
+    ``airports`` side table.
+    """
+
+    def __init__(self, airports=AIRPORTS):
+        self.airports = {airport['code']: dumps_bytes(airport) for airport in airports}
+        self._lock = threading.Lock()
+        # engine -> {normalized: [fragment or None per flight]}, gone with the engine
+        self._fragments = weakref.WeakKeyDictionary()
+
+    def _encode(self, flight, normalized):
+        origin, destination = flight['departure_airport']['code'], flight['arrival_airport']['code']
+        rest = dumps_bytes({key: value for key, value in flight.items()
+                            if key not in ('departure_airport', 'arrival_airport', 'available_seats')})
+        if normalized:
+            airports = b'"departure_airport":"%s","arrival_airport":"%s"' % (origin.encode(), destination.encode())
+        else:
+            airports = b'"departure_airport":%s,"arrival_airport":%s' % (
+                self.airports.get(origin) or dumps_bytes(flight['departure_airport']),
+                self.airports.get(destination) or dumps_bytes(flight['arrival_airport']))
+        return b'{' + airports + b',' + rest[1:-1] + b',"available_seats":'
+
+    def _cached(self, engine, normalized):
+        fragments = self._fragments.get(engine)
+        if fragments is None:
+            with self._lock:
+                fragments = self._fragments.setdefault(engine, {False: [None] * len(engine.flights),
+                                                                True: [None] * len(engine.flights)})
+        return fragments[normalized]
+
+    def flight(self, engine, i, available=None, normalized=False):
+        """One flight as JSON bytes; ``available`` overrides the schedule's seat count."""
+        fragments = self._cached(engine, normalized)
+        fragment = fragments[i]
+        if fragment is None:
+            fragment = fragments[i] = self._encode(engine.flights[i], normalized)
+        if available is None:
+            available = engine.flights[i]['available_seats']
+        return b'%s%d}' % (fragment, available)
+
+    def flights(self, engine, indices, seat_counts, normalized=False):
+        """JSON array of ``engine.flights[i]`` for ``indices`` with seat counts overlaid."""
+        flights = engine.flights
+        return b'[' + b','.join(self.flight(engine, i, seat_counts.get(flights[i]['id']), normalized)
+                                for i in indices) + b']'
+
+    def airport_table(self, engine, indices):
+        """JSON object of the airports ``indices`` touch, keyed by code."""
+        codes = {}
+        for i in indices:
+            flight = engine.flights[i]
+            for airport in (flight['departure_airport'], flight['arrival_airport']):
+                if airport['code'] not in codes:
+                    codes[airport['code']] = self.airports.get(airport['code']) or dumps_bytes(airport)
+        return b'{' + b','.join(b'%s:%s' % (dumps_bytes(code), body) for code, body in codes.items()) + b'}'
+
+
+flight_serializer = FlightSerializer()
+
+
+class FareCalendar:
+    """Lowest fare per route and service date, materialized in tables.db.
+
+    A day's rows are written in one pass over its schedule by a background
+    builder the first time a month view asks for it (or ahead of time by
+    ``flask build-fare-calendar``); until then the month leaves it out.
+    After that only the route of a flight whose seats or price changed is
+    recomputed, by :meth:`refresh` once that change has committed, so a
+    month is one primary-key range scan however many flights a route has.
+    """
+
+    def __init__(self, db, inventory):
+        self.db = db
+        self.inventory = inventory
+        # ISO date -> date still to be materialized, oldest request first
+        self._pending = OrderedDict()
+        self._pending_changed = threading.Condition()
+        self._builder_pid = None
+
+    @staticmethod
+    def _seats_left(conn, service_date, flight_ids=None):
+        sql = "SELECT flight_id, capacity - sold - held FROM flight_seats WHERE service_date = ?"
+        params = [service_date]
+        if flight_ids is not None:
+            sql += f" AND flight_id IN ({', '.join('?' * len(flight_ids))})"
+            params.extend(flight_ids)
+        return dict(conn.execute(sql, params).fetchall())
+
+    @staticmethod
+    def _fold(routes, flight, seats_left):
+        entry = routes.setdefault((flight['departure_airport']['code'], flight['arrival_airport']['code']), [None, 0])
+        entry[1] += 1
+        if seats_left.get(flight['id'], flight['available_seats']) > 0 and (entry[0] is None or flight['price'] < entry[0]):
+            entry[0] = flight['price']
+
+    def materialize(self, service_date):
+        """Fold one day's schedule into the calendar unless it already is. Returns whether it wrote."""
+        key = service_date.isoformat()
+        version, flights = self.inventory.schedule(service_date)
+        with self.db.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT 1 FROM fare_calendar_days WHERE service_date = ?", (key,)).fetchone():
+                conn.rollback()
+                return False
+            seats_left = self._seats_left(conn, key)
+            routes = {}
+            for flight in flights:
+                self._fold(routes, flight, seats_left)
+            conn.executemany(
+                "INSERT OR REPLACE INTO fare_calendar (origin, destination, service_date, min_price, flights) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(origin, destination, key, min_price, count)
+                 for (origin, destination), (min_price, count) in routes.items()],
+            )
+            conn.execute("INSERT INTO fare_calendar_days (service_date, version) VALUES (?, ?)", (key, version))
+            # Days behind the horizon go whenever a new one comes in
+            today = self.inventory.today().isoformat()
+            conn.execute("DELETE FROM fare_calendar_days WHERE service_date < ?", (today,))
+            conn.execute("DELETE FROM fare_calendar WHERE service_date < ?", (today,))
+            conn.commit()
+        return True
+
+    def refresh(self, service_date, flight_ids):
+        """Recompute the routes ``flight_ids`` fly on ``service_date`` (ISO).
+
+        Call it after those flights' seats or prices changed and the change
+        committed. The routes are looked up before taking the write lock,
+        which is only held to re-read their seats and write the rows. Days
+        that have not been materialized yet, or are outside the horizon, are
+        left alone.
+        """
+        with self.db.connection() as conn:
+            if conn.execute("SELECT 1 FROM fare_calendar_days WHERE service_date = ?",
+                            (service_date,)).fetchone() is None:
+                return
+        try:
+            _, _, engine = self.inventory.service_snapshot(datetime.fromisoformat(service_date).date())
+        except KeyError:
+            return
+        routes = {}
+        for flight_id in flight_ids:
+            index = engine.by_id.get(flight_id)
+            if index is None:
+                continue
+            flight = engine.flights[index]
+            route = (flight['departure_airport']['code'], flight['arrival_airport']['code'])
+            if route not in routes:
+                routes[route] = [engine.flights[i] for i in engine.candidates(origin=route[0], destination=route[1])]
+        if not routes:
+            return
+        with self.db.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = []
+            for legs in routes.values():
+                seats_left = self._seats_left(conn, service_date, [f['id'] for f in legs])
+                folded = {}
+                for leg in legs:
+                    self._fold(folded, leg, seats_left)
+                (origin, destination), (min_price, count) = next(iter(folded.items()))
+                rows.append((origin, destination, service_date, min_price, count))
+            conn.executemany(
+                "INSERT OR REPLACE INTO fare_calendar (origin, destination, service_date, min_price, flights) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.commit()
+
+    def build_later(self, days):
+        """Queue ``days`` for this process's background builder, starting it if it is idle."""
+        with self._pending_changed:
+            for day in days:
+                self._pending.setdefault(day.isoformat(), day)
+            if self._pending and self._builder_pid != os.getpid():
+                self._builder_pid = os.getpid()
+                threading.Thread(target=self._build_pending, name='fare-calendar-builder', daemon=True).start()
+
+    def _build_pending(self):
+        while True:
+            with self._pending_changed:
+                if not self._pending:
+                    self._builder_pid = None
+                    self._pending_changed.notify_all()
+                    return
+                day = next(iter(self._pending.values()))
+            try:
+                self.materialize(day)
+            except Exception:
+                # The day stays missing and is queued again by the next month view
+                app.logger.exception('Fare calendar build failed for %s', day)
+            with self._pending_changed:
+                self._pending.pop(day.isoformat(), None)
+
+    def wait(self, timeout=None):
+        """Block until every queued day is built; returns whether the queue emptied in time."""
+        with self._pending_changed:
+            return self._pending_changed.wait_for(lambda: not self._pending, timeout)
+
+    def month(self, origin, destination, first_day):
+        """``(days, pending)`` for ``first_day``'s month inside the horizon.
+
+        ``days`` is ``[{date, min_price, flights}]`` for the days already
+        materialized; the rest are queued with :meth:`build_later` and their
+        ISO dates returned in ``pending``, so a request never builds them.
+        """
+        today = self.inventory.today()
+        next_month = (first_day.replace(day=28) + timedelta(days=4)).replace(day=1)
+        start = max(first_day, today)
+        end = min(next_month - timedelta(days=1), today + timedelta(days=self.inventory.horizon_days))
+        if start > end:
+            return [], []
+        with self.db.connection() as conn:
+            done = {row[0] for row in conn.execute(
+                "SELECT service_date FROM fare_calendar_days WHERE service_date BETWEEN ? AND ?",
+                (start.isoformat(), end.isoformat()),
+            )}
+            fares = {row[0]: row[1:] for row in conn.execute(
+                "SELECT service_date, min_price, flights FROM fare_calendar "
+                "WHERE origin = ? AND destination = ? AND service_date BETWEEN ? AND ?",
+                (origin, destination, start.isoformat(), end.isoformat()),
+            )}
+        days = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+        missing = [day for day in days if day.isoformat() not in done]
+        self.build_later(missing)
+        result = []
+        for day in days:
+            if day.isoformat() in done:
+                min_price, count = fares.get(day.isoformat(), (None, 0))
+                result.append({'date': day.isoformat(), 'min_price': min_price, 'flights': count})
+        return result, [day.isoformat() for day in missing]
+
+
+fare_calendar = FareCalendar(table_db, flight_inventory)
+
+
+def reprice_schedule(service_date=None, origin='', destination=''):
+    """Reprice a day (or one route of it) with ``pricing_engine`` and refresh its fare calendar rows."""
+    service_date, changed = flight_inventory.reprice(pricing_engine, service_date, origin, destination)
+    routes = {(f['departure_airport']['code'], f['arrival_airport']['code']): f['id'] for f in changed}
+    if routes:
+        fare_calendar.refresh(service_date.isoformat(), routes.values())
+    return service_date, changed
+
+
+BOOKING_MAX_SEATS = 9
+SEAT_LETTERS = 'ABCDEF'
+# Bookings made without signing in are stored under this prefix plus the
+# typed email, so they never show up in that account's client area
+GUEST_BOOKING_PREFIX = 'guest:'
+
+
+class SeatConflict(Exception):
+    """A booking lost against the flight's current seat row."""
+
+    def __init__(self, reason, available, version):
+        super().__init__(reason)
+        self.reason = reason
+        self.available = available
+        self.version = version
+
+
+class SeatInventory:
+    """Seats sold and held per scheduled flight, stored in tables.db next to the bookings.
+
+    A flight's row starts from the schedule's ``available_seats`` the first
+    time it is held or booked, and availability is ``capacity - sold -
+    held``. Every change is one IMMEDIATE transaction around a conditional
+    ``UPDATE ... WHERE capacity - sold - held >= seats`` that also bumps the
+    row version, so a request that loses the race gets a ``SeatConflict``
+    rather than an oversold flight, and callers that pass the ``version``
+    they last read only succeed if nobody changed the row in between.
+
+    Holds reserve seats for a few minutes without keeping anything locked:
+    they are rows in ``seat_holds`` indexed by expiry, and a daemon thread
+    releases expired ones in batches every ``sweep_interval`` seconds.
+    """
+
+    def __init__(self, db, inventory, bookings, clock=time.time, sweep_interval=SEAT_HOLD_SWEEP_INTERVAL,
+                 fares=None):
+        self.db = db
+        self.inventory = inventory
+        self.bookings = bookings
+        self.fares = fares
+        self.clock = clock
+        self.sweep_interval = sweep_interval
+        self._sweeper_pid = None
+        self._sweeper_lock = threading.Lock()
+        # service_date -> (loaded_at, token, {flight_id: available}) for /api/flights
+        self._counts = {}
+
+    def _flight(self, flight_id, service_date=None):
+        try:
+            service_date, _, engine = self.inventory.service_snapshot(service_date)
+        except KeyError:
+            return None
+        index = engine.by_id.get(flight_id)
+        if index is None:
+            return None
+        return service_date.isoformat(), engine.flights[index]
+
+    def _seat_row(self, conn, key):
+        return conn.execute(
+            "SELECT capacity - sold - held, version FROM flight_seats WHERE service_date = ? AND flight_id = ?",
+            key,
+        ).fetchone()
+
+    def _take(self, conn, key, flight, seats, column, expected_version=None):
+        """Move ``seats`` free seats into ``column``; returns ``(available, sold, version)``."""
+        conn.execute(
+            "INSERT OR IGNORE INTO flight_seats (service_date, flight_id, capacity) VALUES (?, ?, ?)",
+            key + (flight['available_seats'],),
+        )
+        sql = (
+            f"UPDATE flight_seats SET {column} = {column} + ?, version = version + 1 "
+            "WHERE service_date = ? AND flight_id = ? AND capacity - sold - held >= ?"
+        )
+        params = [seats, *key, seats]
+        if expected_version is not None:
+            sql += " AND version = ?"
+            params.append(expected_version)
+        row = conn.execute(sql + " RETURNING capacity - sold - held, sold, version", params).fetchone()
+        if row is None:
+            available, version = self._seat_row(conn, key)
+            raise SeatConflict('sold_out' if available < seats else 'version', available, version)
+        return row
+
+    def _release_holds(self, conn, holds):
+        """Give held seats back; returns the keys of flights that were sold out until now."""
+        released = defaultdict(int)
+        for service_date, flight_id, seats in holds:
+            released[service_date, flight_id] += seats
+        reopened = []
+        for key, seats in released.items():
+            row = conn.execute(
+                "UPDATE flight_seats SET held = held - ?, version = version + 1 "
+                "WHERE service_date = ? AND flight_id = ? RETURNING capacity - sold - held",
+                (seats,) + key,
+            ).fetchone()
+            if row is not None and row[0] == seats:
+                reopened.append(key)
+        return reopened
+
+    def _refresh_fares(self, keys):
+        """Recompute the fare calendar for ``(service_date, flight_id)`` keys whose seats ran out or came back.
+
+        Runs after the seat change committed, so no pricing work happens
+        under the write lock.
+        """
+        if self.fares is None:
+            return
+        by_date = defaultdict(list)
+        for service_date, flight_id in keys:
+            by_date[service_date].append(flight_id)
+        for service_date, flight_ids in by_date.items():
+            self.fares.refresh(service_date, flight_ids)
+
+    def availability(self, flight_id, service_date=None):
+        """``{flight_id, available, version}``, or ``None`` for an unknown flight."""
+        found = self._flight(flight_id, service_date)
+        if found is None:
+            return None
+        service_date, flight = found
+        with self.db.connection() as conn:
+            row = self._seat_row(conn, (service_date, flight_id))
+        available, version = row if row is not None else (flight['available_seats'], 0)
+        return {'flight_id': flight_id, 'available': available, 'version': version}
+
+    def seat_counts(self, service_date=None):
+        """``(token, {flight_id: available})`` for a day's flights with seats taken.
+
+        The map is re-read at most every ``SEAT_COUNTS_MAX_AGE`` seconds, so
+        /api/flights pays one dict lookup per flight; ``token`` changes
+        whenever any count does.
+        """
+        service_date = (service_date or self.inventory.today()).isoformat()
+        loaded_at, token, counts = self._counts.get(service_date, (0.0, '', {}))
+        now = time.monotonic()
+        if now - loaded_at > SEAT_COUNTS_MAX_AGE:
+            with self.db.connection() as conn:
+                rows = conn.execute(
+                    "SELECT flight_id, capacity - sold - held, version FROM flight_seats WHERE service_date = ?",
+                    (service_date,),
+                ).fetchall()
+            counts = {flight_id: available for flight_id, available, _ in rows}
+            # Versions only grow and rows are never removed, so the sum moves on every change
+            token = f'{len(rows)}.{sum(version for _, _, version in rows)}'
+            if len(self._counts) >= self.inventory.max_partitions:
+                self._counts = {}
+            self._counts[service_date] = (now, token, counts)
+        return token, counts
+
+    def _counts_changed(self):
+        self._counts = {}
+
+    def _hold(self, key, flight, seats, user_email, minutes):
+        with self.db.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            available, _, version = self._take(conn, key, flight, seats, 'held')
+            token = secrets.token_urlsafe(16)
+            expires_at = self.clock() + minutes * 60
+            conn.execute(
+                "INSERT INTO seat_holds (token, service_date, flight_id, seats, user_email, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (token, *key, seats, user_email, expires_at),
+            )
+            conn.commit()
+        if available == 0:
+            # Sold out: the route's lowest fare may move up
+            self._refresh_fares([key])
+        return {
+            'hold_id': token,
+            'flight_id': key[1],
+            'seats': seats,
+            'expires_at': datetime.fromtimestamp(expires_at).isoformat(timespec='seconds'),
+            'available': available,
+            'version': version,
         }
-        bookings.append(booking)
-    
-    # Upcoming bookings
-    for i in range(random.randint(1, 2)):
-        departure_airport = random.choice(airports)
-        arrival_airport = random.choice([a for a in airports if a['code'] != departure_airport['code']])
-        
-        # Future date (within next 3 months)
-        days_ahead = random.randint(7, 90)
-        departure_date = datetime.now() + timedelta(days=days_ahead)
-        
-        # Flight duration between 1-6 hours
-        duration_hours = random.randint(1, 6)
-        duration_minutes = random.randint(0, 59)
-        
-        # Price between $150-$800
-        base_price = random.randint(150, 800)
-        
-        booking = {
-            'id': f'BK{random.randint(10000, 99999)}',
-            'type': 'upcoming',
-            'airline': random.choice(airlines),
-            'departure_airport': departure_airport,
-            'arrival_airport': arrival_airport,
-            'departure_date': departure_date.strftime('%Y-%m-%d'),
-            'departure_time': f'{random.randint(6, 22):02d}:{random.choice([0, 15, 30, 45]):02d}',
-            'duration': f'{duration_hours}h {duration_minutes}m',
-            'aircraft': random.choice(aircraft_types),
-            'price': base_price,
-            'stops': random.choice([0, 1]),
-            'status': 'confirmed',
-            'seat': f'{random.choice(["A", "B", "C", "D", "E", "F"])}{random.randint(1, 30)}',
-            'confirmation_number': f'AA{random.randint(100000, 999999)}'
+
+    def hold(self, flight_id, seats=1, user_email=None, minutes=SEAT_HOLD_MINUTES, service_date=None):
+        """Reserve ``seats`` for ``minutes``; raises ``KeyError``/``SeatConflict`` like ``book``."""
+        found = self._flight(flight_id, service_date)
+        if found is None:
+            raise KeyError(flight_id)
+        service_date, flight = found
+        self.start_sweeper()
+        try:
+            hold = self._hold((service_date, flight_id), flight, seats, user_email, minutes)
+        except SeatConflict:
+            # Expired holds count until they are swept; release them and retry once
+            if not self.sweep():
+                raise
+            hold = self._hold((service_date, flight_id), flight, seats, user_email, minutes)
+        self._counts_changed()
+        return hold
+
+    def release(self, hold_id):
+        """Give a hold's seats back early. Returns whether the hold existed."""
+        with self.db.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            holds = conn.execute(
+                "DELETE FROM seat_holds WHERE token = ? RETURNING service_date, flight_id, seats",
+                (hold_id,),
+            ).fetchall()
+            reopened = self._release_holds(conn, holds)
+            conn.commit()
+        self._refresh_fares(reopened)
+        self._counts_changed()
+        return bool(holds)
+
+    def renew(self, hold_id, minutes=SEAT_HOLD_MINUTES):
+        """Push a live hold's expiry out to ``minutes`` from now; ``None`` if it is gone or lapsed."""
+        expires_at = self.clock() + minutes * 60
+        with self.db.connection() as conn:
+            row = conn.execute(
+                "UPDATE seat_holds SET expires_at = ? WHERE token = ? AND expires_at > ? "
+                "RETURNING service_date, flight_id, seats",
+                (expires_at, hold_id, self.clock()),
+            ).fetchone()
+            conn.commit()
+        if row is None:
+            return None
+        return {
+            'hold_id': hold_id,
+            'flight_id': row[1],
+            'service_date': row[0],
+            'seats': row[2],
+            'expires_at': datetime.fromtimestamp(expires_at).isoformat(timespec='seconds'),
         }
-        bookings.append(booking)
-    
-    return bookings
 
-# Mock flight data
-def generate_mock_flights():
-    airports = [
-        {'code': 'JFK', 'name': 'New York (JFK)', 'city': 'New York'},
-        {'code': 'LAX', 'name': 'Los Angeles (LAX)', 'city': 'Los Angeles'},
-        {'code': 'ORD', 'name': 'Chicago (ORD)', 'city': 'Chicago'},
-        {'code': 'DFW', 'name': 'Dallas (DFW)', 'city': 'Dallas'},
-        {'code': 'ATL', 'name': 'Atlanta (ATL)', 'city': 'Atlanta'},
-        {'code': 'MIA', 'name': 'Miami (MIA)', 'city': 'Miami'},
-        {'code': 'SEA', 'name': 'Seattle (SEA)', 'city': 'Seattle'},
-        {'code': 'DEN', 'name': 'Denver (DEN)', 'city': 'Denver'},
-        {'code': 'SFO', 'name': 'San Francisco (SFO)', 'city': 'San Francisco'},
-        {'code': 'BOS', 'name': 'Boston (BOS)', 'city': 'Boston'},
-        {'code': 'LAS', 'name': 'Las Vegas (LAS)', 'city': 'Las Vegas'},
-        {'code': 'PHX', 'name': 'Phoenix (PHX)', 'city': 'Phoenix'},
-        {'code': 'IAH', 'name': 'Houston (IAH)', 'city': 'Houston'},
-        {'code': 'CLT', 'name': 'Charlotte (CLT)', 'city': 'Charlotte'},
-        {'code': 'MCO', 'name': 'Orlando (MCO)', 'city': 'Orlando'},
-        {'code': 'DTW', 'name': 'Detroit (DTW)', 'city': 'Detroit'},
-        {'code': 'FLL', 'name': 'Fort Lauderdale (FLL)', 'city': 'Fort Lauderdale'},
-        {'code': 'BWI', 'name': 'Baltimore (BWI)', 'city': 'Baltimore'},
-        {'code': 'IAD', 'name': 'Washington (IAD)', 'city': 'Washington'},
-        {'code': 'PHL', 'name': 'Philadelphia (PHL)', 'city': 'Philadelphia'}
-    ]
-    
-    airlines = ['American Airlines', 'American Eagle', 'American Connection']
-    aircraft_types = ['Boeing 737-800', 'Boeing 737 MAX 8', 'Boeing 777-200', 'Boeing 777-300ER', 'Boeing 787-8', 'Boeing 787-9', 'Airbus A320', 'Airbus A321', 'Airbus A321neo', 'Embraer E175', 'Embraer E190']
-    
-    # Common flight routes with realistic pricing
-    common_routes = {
-        ('JFK', 'LAX'): {'base_price': 350, 'duration_range': (5, 6), 'freq': 8},
-        ('JFK', 'SFO'): {'base_price': 380, 'duration_range': (6, 7), 'freq': 6},
-        ('JFK', 'MIA'): {'base_price': 220, 'duration_range': (3, 4), 'freq': 12},
-        ('JFK', 'ORD'): {'base_price': 180, 'duration_range': (2, 3), 'freq': 15},
-        ('LAX', 'ORD'): {'base_price': 280, 'duration_range': (4, 5), 'freq': 10},
-        ('LAX', 'DFW'): {'base_price': 250, 'duration_range': (3, 4), 'freq': 12},
-        ('ORD', 'DFW'): {'base_price': 160, 'duration_range': (2, 3), 'freq': 18},
-        ('ATL', 'LAX'): {'base_price': 320, 'duration_range': (4, 5), 'freq': 8},
-        ('ATL', 'SFO'): {'base_price': 350, 'duration_range': (5, 6), 'freq': 6},
-        ('MIA', 'LAX'): {'base_price': 300, 'duration_range': (5, 6), 'freq': 6},
-        ('SEA', 'JFK'): {'base_price': 400, 'duration_range': (5, 6), 'freq': 4},
-        ('DEN', 'JFK'): {'base_price': 280, 'duration_range': (3, 4), 'freq': 10},
-        ('BOS', 'LAX'): {'base_price': 380, 'duration_range': (6, 7), 'freq': 4},
-        ('LAS', 'JFK'): {'base_price': 320, 'duration_range': (4, 5), 'freq': 6},
-        ('PHX', 'JFK'): {'base_price': 300, 'duration_range': (4, 5), 'freq': 8}
+    def sweep(self, batch=SEAT_HOLD_SWEEP_BATCH):
+        """Release expired holds, oldest first, ``batch`` per transaction. Returns how many."""
+        released = 0
+        reopened = []
+        while True:
+            now = self.clock()
+            with self.db.connection() as conn:
+                if conn.execute("SELECT 1 FROM seat_holds WHERE expires_at <= ? LIMIT 1", (now,)).fetchone() is None:
+                    break
+                conn.execute("BEGIN IMMEDIATE")
+                holds = conn.execute(
+                    "DELETE FROM seat_holds WHERE id IN ("
+                    "SELECT id FROM seat_holds WHERE expires_at <= ? ORDER BY expires_at LIMIT ?"
+                    ") RETURNING service_date, flight_id, seats",
+                    (now, batch),
+                ).fetchall()
+                reopened += self._release_holds(conn, holds)
+                conn.commit()
+            released += len(holds)
+            if len(holds) < batch:
+                break
+        self._refresh_fares(reopened)
+        if released:
+            self._counts_changed()
+        return released
+
+    def start_sweeper(self):
+        """Start this process's expired-hold sweeper thread if it isn't running."""
+        if self.sweep_interval is None or self._sweeper_pid == os.getpid():
+            return
+        with self._sweeper_lock:
+            if self._sweeper_pid == os.getpid():
+                return
+            self._sweeper_pid = os.getpid()
+            threading.Thread(target=self._sweep_forever, name='seat-hold-sweeper', daemon=True).start()
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception:
+                # Keep the thread alive: expired holds are only freed by the next sweep
+                app.logger.exception('Seat hold sweep failed')
+
+    def book(self, user_email, flight_id, seats=1, expected_version=None, hold_id=None, service_date=None):
+        """Take ``seats`` on a flight and record them as bookings for ``user_email``.
+
+        The flight is looked up on ``service_date`` (today by default). A live ``hold_id`` for the same flight and seat count turns the held
+        seats into sold ones; an expired or mismatched hold is released and
+        the seats are taken afresh. Returns ``(bookings, availability)``.
+        Raises ``KeyError`` for an unknown flight and ``SeatConflict`` if the
+        seats are gone or the row moved past ``expected_version``.
+        """
+        found = self._flight(flight_id, service_date)
+        if found is None:
+            raise KeyError(flight_id)
+        service_date, flight = found
+        key = (service_date, flight_id)
+        with self.db.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            held = None
+            changed = []
+            if hold_id is not None:
+                held = conn.execute(
+                    "DELETE FROM seat_holds WHERE token = ? AND service_date = ? AND flight_id = ? "
+                    "RETURNING seats, expires_at",
+                    (hold_id, *key),
+                ).fetchone()
+            if held is not None and held[0] == seats and held[1] > self.clock():
+                available, sold, version = conn.execute(
+                    "UPDATE flight_seats SET held = held - ?, sold = sold + ?, version = version + 1 "
+                    "WHERE service_date = ? AND flight_id = ? RETURNING capacity - sold - held, sold, version",
+                    (seats, seats, *key),
+                ).fetchone()
+            else:
+                if held is not None:
+                    changed = self._release_holds(conn, [key + (held[0],)])
+                available, sold, version = self._take(conn, key, flight, seats, 'sold', expected_version)
+                if available == 0:
+                    changed.append(key)
+            confirmation_number = f'AA{random.randint(100000, 999999)}'
+            bookings = [{
+                'airline': flight['airline'],
+                'departure_airport': flight['departure_airport'],
+                'arrival_airport': flight['arrival_airport'],
+                'departure_date': service_date,
+                'departure_time': flight['departure_time'],
+                'duration': flight['duration'],
+                'aircraft': flight['aircraft'],
+                'price': flight['price'],
+                'stops': flight['stops'],
+                'status': 'confirmed',
+                'seat': f'{seat // len(SEAT_LETTERS) + 1}{SEAT_LETTERS[seat % len(SEAT_LETTERS)]}',
+                'confirmation_number': confirmation_number,
+            } for seat in range(sold - seats, sold)]
+            self.bookings._insert(conn, user_email, bookings)
+            last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+            conn.commit()
+        self._refresh_fares(changed)
+        self._counts_changed()
+        for booking_id, booking in zip(range(last_id - seats + 1, last_id + 1), bookings):
+            booking['id'] = f'BK{booking_id:05d}'
+            booking['type'] = 'upcoming'
+        return bookings, {'flight_id': flight_id, 'available': available, 'version': version}
+
+
+seat_inventory = SeatInventory(table_db, flight_inventory, booking_store, fares=fare_calendar)
+
+
+def run_booking_load_test(db_dir, workers=32, attempts=1000, capacity=None, optimistic=False):
+    """Hammer one flight with concurrent bookings and check nothing was lost.
+
+    Uses its own tables.db/flights.db under ``db_dir``. With ``optimistic``
+    each attempt reads the seat row first and books against that version,
+    retrying when it is stale. Returns a summary dict; ``consistent`` is
+    true when seats sold, booking rows and successful attempts all agree.
+    """
+    db_path = os.path.join(db_dir, 'tables.db')
+    pool = company_tables_pool(db_path, max_idle=workers)
+    inventory = FlightInventory(os.path.join(db_dir, 'flights.db'))
+    seats = SeatInventory(pool, inventory, BookingStore(pool), sweep_interval=None)
+    service_date, _, engine = inventory.service_snapshot()
+    flight_id = engine.flights[0]['id']
+    capacity = attempts // 2 if capacity is None else capacity
+    with pool.connection() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO flight_seats (service_date, flight_id, capacity) VALUES (?, ?, ?)",
+            (service_date.isoformat(), flight_id, capacity),
+        )
+        conn.commit()
+
+    counts = defaultdict(int)
+    counts_lock = threading.Lock()
+    remaining = queue.Queue()
+    for attempt in range(attempts):
+        remaining.put(attempt)
+
+    def worker():
+        while True:
+            try:
+                attempt = remaining.get_nowait()
+            except queue.Empty:
+                return
+            while True:
+                expected = seats.availability(flight_id)['version'] if optimistic else None
+                try:
+                    seats.book(f'load{attempt}@example.com', flight_id, expected_version=expected)
+                    outcome = 'booked'
+                except SeatConflict as conflict:
+                    if conflict.reason == 'version':
+                        with counts_lock:
+                            counts['retries'] += 1
+                        continue
+                    outcome = 'sold_out'
+                break
+            with counts_lock:
+                counts[outcome] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with pool.connection() as conn:
+        sold = conn.execute(
+            "SELECT sold FROM flight_seats WHERE service_date = ? AND flight_id = ?",
+            (service_date.isoformat(), flight_id),
+        ).fetchone()[0]
+        booked_rows = conn.execute("SELECT COUNT(*) FROM bookings").fetchone()[0]
+    return {
+        'flight_id': flight_id,
+        'capacity': capacity,
+        'attempts': attempts,
+        'booked': counts['booked'],
+        'sold_out': counts['sold_out'],
+        'retries': counts['retries'],
+        'sold': sold,
+        'booking_rows': booked_rows,
+        'seconds': elapsed,
+        'bookings_per_second': attempts / elapsed if elapsed else 0.0,
+        'consistent': sold == booked_rows == counts['booked'] == min(capacity, attempts),
     }
-    
-    flights = []
-    flight_id_counter = 1000
-    
-    # Generate flights for common routes
-    for (origin_code, dest_code), route_info in common_routes.items():
-        origin_airport = next(a for a in airports if a['code'] == origin_code)
-        dest_airport = next(a for a in airports if a['code'] == dest_code)
-        
-        # Generate multiple flights per route based on frequency
-        for flight_num in range(route_info['freq']):
-            # Generate departure time between 6 AM and 10 PM
-            departure_hour = random.randint(6, 22)
-            departure_minute = random.choice([0, 15, 30, 45])
-            
-            # Flight duration based on route
-            duration_hours = random.randint(*route_info['duration_range'])
-            duration_minutes = random.randint(0, 59)
-            
-            # Calculate arrival time
-            departure_time = datetime.now().replace(hour=departure_hour, minute=departure_minute, second=0, microsecond=0)
-            arrival_time = departure_time + timedelta(hours=duration_hours, minutes=duration_minutes)
-            
-            # Price variation based on time and demand
-            base_price = route_info['base_price']
-            time_multiplier = 1.0
-            if departure_hour in [6, 7, 8, 19, 20, 21]:  # Peak hours
-                time_multiplier = 1.2
-            elif departure_hour in [10, 11, 14, 15]:  # Off-peak hours
-                time_multiplier = 0.9
-            
-            # Random price variation
-            price_variation = random.uniform(0.8, 1.3)
-            final_price = int(base_price * time_multiplier * price_variation)
-            
-            # Stops (mostly nonstop for major routes, some with stops)
-            stops = 0 if random.random() > 0.2 else 1
-            
-            # Available seats
-            available_seats = random.randint(5, 50)
-            
-            flight = {
-                'id': f'AA{flight_id_counter}',
-                'airline': random.choice(airlines),
-                'departure_airport': origin_airport,
-                'arrival_airport': dest_airport,
-                'departure_time': departure_time.strftime('%H:%M'),
-                'arrival_time': arrival_time.strftime('%H:%M'),
-                'duration': f'{duration_hours}h {duration_minutes}m',
-                'aircraft': random.choice(aircraft_types),
-                'price': final_price,
-                'stops': stops,
-                'available_seats': available_seats,
-                'route_type': 'major'
-            }
-            flights.append(flight)
-            flight_id_counter += 1
-    
-    # Generate additional random flights for variety
-    for i in range(100):
-        origin_airport = random.choice(airports)
-        dest_airport = random.choice([a for a in airports if a['code'] != origin_airport['code']])
-        
-        # Skip if this route already exists
-        route_key = (origin_airport['code'], dest_airport['code'])
-        if route_key in common_routes:
-            continue
-        
-        # Generate departure time
-        departure_hour = random.randint(6, 22)
-        departure_minute = random.choice([0, 15, 30, 45])
-        departure_time = datetime.now().replace(hour=departure_hour, minute=departure_minute, second=0, microsecond=0)
-        
-        # Flight duration based on distance (estimate)
-        # Calculate rough distance for pricing
-        duration_hours = random.randint(1, 6)
-        duration_minutes = random.randint(0, 59)
-        arrival_time = departure_time + timedelta(hours=duration_hours, minutes=duration_minutes)
-        
-        # Price based on duration and random factors
-        base_price = 150 + (duration_hours * 50) + random.randint(-30, 50)
-        final_price = max(120, base_price)  # Minimum price of $120
-        
-        # Stops (more likely for longer flights)
-        stops = 0 if duration_hours <= 3 or random.random() > 0.3 else 1
-        
-        # Available seats
-        available_seats = random.randint(5, 50)
-        
-        flight = {
-            'id': f'AA{flight_id_counter}',
-            'airline': random.choice(airlines),
-            'departure_airport': origin_airport,
-            'arrival_airport': dest_airport,
-            'departure_time': departure_time.strftime('%H:%M'),
-            'arrival_time': arrival_time.strftime('%H:%M'),
-            'duration': f'{duration_hours}h {duration_minutes}m',
-            'aircraft': random.choice(aircraft_types),
-            'price': final_price,
-            'stops': stops,
-            'available_seats': available_seats,
-            'route_type': 'regional'
-        }
-        flights.append(flight)
-        flight_id_counter += 1
-    
-    return flights
 
 @app.route('/')
 def index():
@@ -502,14 +3696,32 @@ def search():
 @app.route('/signin', methods=['GET', 'POST'])
 def signin():
     if request.method == 'POST':
-        email = request.form.get('email')
-        password = request.form.get('password')
+        email = (request.form.get('email') or '').strip().lower()
+        password = request.form.get('password') or ''
+        
+        # Throttle before hashing so repeated guesses can't tie up the hash pool
+        account_key = (email, request.remote_addr)
+        retry_after = max(login_ip_failures.retry_after(request.remote_addr),
+                          login_failures.retry_after(account_key))
+        if retry_after:
+            error = 'Too many sign-in attempts. Please try again later.'
+            return render_template('signin.html', error=error), 429, {'Retry-After': str(retry_after)}
         
-        if email in MOCK_USERS and MOCK_USERS[email]['password'] == password:
+        user = MOCK_USERS.get(email)
+        try:
+            valid = password_hasher.verify(password, user and user['password_hash'])
+        except HasherBusy:
+            return render_template('signin.html', error='Sign-in is busy. Please try again.'), 503
+        
+        if valid:
+            login_failures.reset(account_key)
+            session.regenerate()
             session['user_email'] = email
             session['user_name'] = MOCK_USERS[email]['name']
             return redirect(url_for('client_area'))
         else:
+            login_failures.hit(account_key)
+            login_ip_failures.hit(request.remote_addr)
             return render_template('signin.html', error='Invalid email or password')
     
     return render_template('signin.html')
@@ -525,130 +3737,429 @@ def client_area():
         return redirect(url_for('signin'))
     
     user = MOCK_USERS[session['user_email']]
-    bookings = generate_mock_bookings(session['user_email'])
+    booking_store.ensure_seeded(session['user_email'])
+    past_page = max(request.args.get('past_page', 1, type=int), 1)
     
-    return render_template('client_area.html', user=user, bookings=bookings)
+    return render_template(
+        'client_area.html',
+        user=user,
+        booking_counts=booking_store.counts(session['user_email']),
+        upcoming_bookings=booking_store.page(session['user_email'], 'upcoming'),
+        past_bookings=booking_store.page(
+            session['user_email'], 'past', offset=(past_page - 1) * BOOKING_PAGE_SIZE
+        ),
+        past_page=past_page,
+        booking_page_size=BOOKING_PAGE_SIZE,
+    )
 
-@app.route('/api/flights')
-def get_flights():
-    origin = request.args.get('origin', '')
-    destination = request.args.get('destination', '')
-    date = request.args.get('date', '')
-    min_price = request.args.get('min_price', '')
-    max_price = request.args.get('max_price', '')
-    stops = request.args.get('stops', '')
-    airline = request.args.get('airline', '')
-    departure_time = request.args.get('departure_time', '')
-    sort_by = request.args.get('sort_by', 'price')
-    limit = request.args.get('limit', '50')
-    
-    all_flights = generate_mock_flights()
-    
-    # Filter flights based on search criteria
-    filtered_flights = all_flights.copy()
-    
-    # Origin and destination filter
-    if origin and destination:
-        filtered_flights = [
-            f for f in filtered_flights 
-            if (f['departure_airport']['code'] == origin.upper() and 
-                f['arrival_airport']['code'] == destination.upper())
-        ]
-    elif origin:
-        filtered_flights = [
-            f for f in filtered_flights 
-            if f['departure_airport']['code'] == origin.upper()
-        ]
-    elif destination:
-        filtered_flights = [
-            f for f in filtered_flights 
-            if f['arrival_airport']['code'] == destination.upper()
-        ]
-    
-    # Price filter
-    if min_price:
+
+@app.route('/api/bookings')
+def get_bookings():
+    """Signed-in user's bookings: ``type`` (upcoming|past) paged by ``limit``/``offset``."""
+    if 'user_email' not in session:
+        return jsonify({'error': 'Not signed in'}), 401
+    kind = request.args.get('type', 'upcoming')
+    limit = request.args.get('limit', BOOKING_PAGE_SIZE, type=int)
+    offset = request.args.get('offset', 0, type=int)
+    if kind not in BOOKING_TYPES or not 0 < limit <= BOOKING_PAGE_MAX or offset < 0:
+        return jsonify({'error': 'Invalid booking query'}), 400
+    user_email = session['user_email']
+    booking_store.ensure_seeded(user_email)
+    return jsonify({
+        'bookings': booking_store.page(user_email, kind, limit=limit, offset=offset),
+        'total': booking_store.counts(user_email)[kind],
+    })
+
+
+@app.route('/api/bookings', methods=['POST'])
+def create_booking():
+    """Book ``seats`` on ``flight_id`` for the signed-in user, or as a guest under ``email``.
+
+    An optional ``version`` from ``/api/flights/<id>/seats`` makes the
+    booking conditional on the seat row not having changed. Answers 409
+    with the current ``available``/``version`` when it loses.
+    """
+    payload = request.get_json(silent=True) or {}
+    user_email = booking_owner(payload)
+    flight_id = payload.get('flight_id')
+    seats = payload.get('seats', 1)
+    expected_version = payload.get('version')
+    hold_id = payload.get('hold_id')
+    if not isinstance(user_email, str) or not user_email or not isinstance(flight_id, str) \
+            or not _valid_seat_count(seats) \
+            or (expected_version is not None and type(expected_version) is not int) \
+            or (hold_id is not None and not isinstance(hold_id, str)):
+        return jsonify({'error': 'email, flight_id and 1-%d seats are required' % BOOKING_MAX_SEATS}), 400
+    try:
+        service_date = parse_service_date(payload.get('date'))
+    except ValueError:
+        return _service_date_error()
+    try:
+        bookings, seat_state = seat_inventory.book(user_email, flight_id, seats, expected_version, hold_id,
+                                                   service_date)
+    except KeyError:
+        return jsonify({'error': 'Unknown flight'}), 404
+    except SeatConflict as conflict:
+        return _seat_conflict_response(conflict)
+    return jsonify({'bookings': bookings, **seat_state}), 201
+
+
+def booking_owner(payload):
+    """The signed-in user's email, else ``GUEST_BOOKING_PREFIX`` + the payload's ``email``, else ``None``."""
+    if 'user_email' in session:
+        return session['user_email']
+    email = payload.get('email')
+    if not isinstance(email, str) or not email.strip():
+        return None
+    return GUEST_BOOKING_PREFIX + email.strip().lower()
+
+
+def _valid_seat_count(seats):
+    return type(seats) is int and 0 < seats <= BOOKING_MAX_SEATS
+
+
+def _seat_conflict_response(conflict):
+    message = 'Not enough seats left' if conflict.reason == 'sold_out' else 'Seat availability changed'
+    return jsonify({'error': message, 'reason': conflict.reason,
+                    'available': conflict.available, 'version': conflict.version}), 409
+
+
+def parse_service_date(value):
+    """A ``YYYY-MM-DD`` request value as a service date, or ``None`` (today) when blank.
+
+    Raises ``ValueError`` if it is malformed or outside the booking horizon.
+    """
+    if not value:
+        return None
+    if not isinstance(value, str):
+        raise ValueError(value)
+    service_date = datetime.strptime(value, '%Y-%m-%d').date()
+    if not flight_inventory.in_horizon(service_date):
+        raise ValueError(value)
+    return service_date
+
+
+def _service_date_error():
+    return jsonify({'error': 'date must be YYYY-MM-DD, from today up to %d days ahead'
+                             % flight_inventory.horizon_days}), 400
+
+
+def _multi_arg(args, name):
+    """Collect a filter given as repeated parameters and/or comma-separated values."""
+    values = []
+    for raw in args.getlist(name):
+        values.extend(value.strip() for value in raw.split(','))
+    return [value for value in values if value]
+
+
+def _float_arg(args, name):
+    try:
+        return float(args.get(name, ''))
+    except ValueError:
+        return None
+
+
+def parse_flight_query(args):
+    """Turn /api/flights query parameters into query engine arguments."""
+    stops = []
+    for value in _multi_arg(args, 'stops'):
         try:
-            min_price_val = float(min_price)
-            filtered_flights = [f for f in filtered_flights if f['price'] >= min_price_val]
+            stops.append(int(value))
         except ValueError:
             pass
+    try:
+        limit = int(args.get('limit', '50'))
+    except ValueError:
+        limit = 50
+    return {
+        'origin': args.get('origin', '').upper(),
+        'destination': args.get('destination', '').upper(),
+        'min_price': _float_arg(args, 'min_price'),
+        'max_price': _float_arg(args, 'max_price'),
+        'stops': stops,
+        'airlines': _multi_arg(args, 'airline'),
+        'departure_times': _multi_arg(args, 'departure_time'),
+        'sort_by': args.get('sort_by', 'price'),
+        'limit': limit,
+    }
+
+
+def flight_query_key(query, sort_by, limit, cursor, facets):
+    """Hashable, order-independent form of a parsed /api/flights query for the search cache."""
+    return (
+        query['origin'], query['destination'], query['min_price'], query['max_price'],
+        tuple(sorted(set(query['stops']))),
+        tuple(sorted({airline.lower() for airline in query['airlines']})),
+        tuple(sorted(set(query['departure_times']))),
+        sort_by, limit, cursor or '', facets,
+    )
+
+
+def encode_flight_cursor(version, sort_by, engine, index):
+    key, _ = engine.sort_key(index, sort_by)
+    payload = json.dumps([version, sort_by, key, engine.flights[index]['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_flight_cursor(cursor, version, sort_by, engine):
+    """Return the ``sort_key`` position a cursor points at, or ``None`` if it is stale.
+
+    Raises ``ValueError`` for anything that is not a cursor this API issued.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        fields = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise ValueError('malformed cursor') from None
+    if not (isinstance(fields, list) and len(fields) == 4
+            and all(isinstance(field, str) for field in (fields[0], fields[1], fields[3]))
+            and isinstance(fields[2], (int, float)) and not isinstance(fields[2], bool)):
+        raise ValueError('malformed cursor')
+    cursor_version, cursor_sort, key, flight_id = fields
+    if cursor_version != version or cursor_sort != sort_by:
+        return None
+    index = engine.by_id.get(flight_id)
+    # A cursor's key is its flight's own sort key, so anything else was not issued here
+    if index is None or engine.sort_key(index, sort_by) != (key, index):
+        return None
+    return key, index
+
+
+@app.route('/api/flights/<flight_id>/seats')
+def get_flight_seats(flight_id):
+    try:
+        service_date = parse_service_date(request.args.get('date'))
+    except ValueError:
+        return _service_date_error()
+    seats = seat_inventory.availability(flight_id, service_date)
+    if seats is None:
+        return jsonify({'error': 'Unknown flight'}), 404
+    return jsonify(seats)
+
+
+@app.route('/api/flights/<flight_id>/holds', methods=['POST'])
+def create_seat_hold(flight_id):
+    """Hold ``seats`` on a flight for ``SEAT_HOLD_MINUTES`` while the traveller books."""
+    payload = request.get_json(silent=True) or {}
+    seats = payload.get('seats', 1)
+    if not _valid_seat_count(seats):
+        return jsonify({'error': '1-%d seats can be held' % BOOKING_MAX_SEATS}), 400
+    try:
+        service_date = parse_service_date(payload.get('date'))
+    except ValueError:
+        return _service_date_error()
+    try:
+        hold = seat_inventory.hold(flight_id, seats, booking_owner(payload), service_date=service_date)
+    except KeyError:
+        return jsonify({'error': 'Unknown flight'}), 404
+    except SeatConflict as conflict:
+        return _seat_conflict_response(conflict)
+    return jsonify(hold), 201
+
+
+@app.route('/api/holds/<hold_id>', methods=['DELETE'])
+def release_seat_hold(hold_id):
+    if not seat_inventory.release(hold_id):
+        return jsonify({'error': 'Unknown or expired hold'}), 404
+    return '', 204
+
+
+@app.route('/api/holds/<hold_id>', methods=['PATCH'])
+def renew_seat_hold(hold_id):
+    """Extend a live hold by another ``SEAT_HOLD_MINUTES``, e.g. when its booking page reloads."""
+    hold = seat_inventory.renew(hold_id)
+    if hold is None:
+        return jsonify({'error': 'Unknown or expired hold'}), 404
+    return jsonify(hold)
+
+
+def cheapest_per_day(filters, center, days):
+    """The cheapest flight with seats left matching ``filters`` on each day within ``days`` of ``center``.
+
+    Returns ``(days, tags)``: one ``{date, matched, cheapest}`` entry per
+    day inside the booking horizon (``cheapest`` is ``None`` when nothing
+    matches or everything is sold out), and the partition/seat versions the
+    answer depends on, for the ETag.
+    """
+    center = center or flight_inventory.today()
+    result, tags = [], []
+    for offset in range(-days, days + 1):
+        day = center + timedelta(days=offset)
+        if not flight_inventory.in_horizon(day):
+            continue
+        version, engine = flight_inventory.query_engine(day)
+        seat_token, seat_counts = seat_inventory.seat_counts(day)
+        candidates = engine.candidates(**filters)
+        cheapest = None
+        for i in engine.order(candidates, sort_by='price', limit=None):
+            flight = engine.flights[i]
+            available = seat_counts.get(flight['id'], flight['available_seats'])
+            if available > 0:
+                cheapest = {**flight, 'available_seats': available}
+                break
+        result.append({'date': day.isoformat(), 'matched': len(candidates), 'cheapest': cheapest})
+        tags.append(f'{version}/{seat_token}')
+    return result, tags
+
+
+@app.route('/api/flights')
+def get_flights():
+    query = parse_flight_query(request.args)
+    sort_by = query.pop('sort_by')
+    limit = query.pop('limit')
+    stream = request.args.get('format') == 'ndjson'
+    if stream and 'limit' not in request.args:
+        limit = None
+    elif limit < 0:
+        limit = 0
+    try:
+        service_date = parse_service_date(request.args.get('date'))
+    except ValueError:
+        return _service_date_error()
     
-    if max_price:
+    if 'flex' in request.args:
+        # Flexible dates: the cheapest option on each day of a +/- window
         try:
-            max_price_val = float(max_price)
-            filtered_flights = [f for f in filtered_flights if f['price'] <= max_price_val]
+            days = int(request.args['flex'])
         except ValueError:
-            pass
+            days = -1
+        if not 0 <= days <= FLEXIBLE_DATE_MAX_DAYS:
+            return jsonify({'error': 'flex must be 0-%d days' % FLEXIBLE_DATE_MAX_DAYS}), 400
+        result, tags = cheapest_per_day(query, service_date, days)
+        response = jsonify({'date': (service_date or flight_inventory.today()).isoformat(),
+                            'flex': days, 'days': result})
+        response.set_etag(hashlib.sha1(
+            f'{",".join(tags)}?{request.query_string.decode("latin-1")}'.encode('utf-8')
+        ).hexdigest())
+        return response.make_conditional(request)
+    
+    inventory_version, engine = flight_inventory.query_engine(service_date)
+    seat_token, seat_counts = seat_inventory.seat_counts(service_date)
+    normalized = request.args.get('shape') == 'normalized'
     
-    # Stops filter
-    if stops:
+    after = None
+    if request.args.get('cursor'):
         try:
-            stops_val = int(stops)
-            filtered_flights = [f for f in filtered_flights if f['stops'] == stops_val]
+            after = decode_flight_cursor(request.args['cursor'], inventory_version, sort_by, engine)
         except ValueError:
-            pass
+            return jsonify({'error': 'cursor is malformed'}), 400
+        if after is None:
+            return jsonify({'error': 'Cursor is invalid or the flight schedule has changed'}), 410
+    
+    if stream:
+        ordered = engine.order(engine.candidates(**query), sort_by=sort_by, limit=limit, after=after)
+        
+        def generate():
+            for i in ordered:
+                yield flight_serializer.flight(engine, i, seat_counts.get(engine.flights[i]['id'])) + b'\n'
+        
+        response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+        response.headers['X-Inventory-Version'] = inventory_version
+        return response
     
-    # Airline filter
-    if airline:
-        filtered_flights = [f for f in filtered_flights if airline.lower() in f['airline'].lower()]
+    want_facets = bool(request.args.get('facets'))
     
-    # Departure time filter
-    if departure_time:
-        if departure_time == 'morning':
-            filtered_flights = [f for f in filtered_flights if 6 <= int(f['departure_time'].split(':')[0]) < 12]
-        elif departure_time == 'afternoon':
-            filtered_flights = [f for f in filtered_flights if 12 <= int(f['departure_time'].split(':')[0]) < 18]
-        elif departure_time == 'evening':
-            filtered_flights = [f for f in filtered_flights if 18 <= int(f['departure_time'].split(':')[0]) <= 22]
+    def search():
+        candidates = engine.candidates(**query)
+        # Fetch one extra row to learn whether another page exists
+        page = engine.order(candidates, sort_by=sort_by, limit=limit + 1, after=after)
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            if page:
+                next_cursor = encode_flight_cursor(inventory_version, sort_by, engine, page[-1])
+        summary = None
+        if want_facets:
+            # Facets describe the whole route so filter options don't vanish as they're checked
+            route = engine.candidates(origin=query['origin'], destination=query['destination'])
+            summary = {'total': len(route), 'matched': len(candidates), 'facets': engine.facets(route)}
+        return page, next_cursor, summary
     
-    # Sort flights
-    if sort_by == 'price':
-        filtered_flights.sort(key=lambda x: x['price'])
-    elif sort_by == 'duration':
-        filtered_flights.sort(key=lambda x: int(x['duration'].split('h')[0]))
-    elif sort_by == 'departure':
-        filtered_flights.sort(key=lambda x: x['departure_time'])
-    elif sort_by == 'arrival':
-        filtered_flights.sort(key=lambda x: x['arrival_time'])
-    elif sort_by == 'stops':
-        filtered_flights.sort(key=lambda x: x['stops'])
+    # Seat counts change far more often than the schedule, so they are
+    # overlaid on the cached page rather than cached with it
+    page, next_cursor, summary = search_cache.get(
+        (service_date or flight_inventory.today()).isoformat(), inventory_version,
+        flight_query_key(query, sort_by, limit, request.args.get('cursor'), want_facets), search)
+    # Flights nobody has held or booked keep the schedule's count
+    body = flight_serializer.flights(engine, page, seat_counts, normalized)
     
-    # Limit results
+    if normalized or want_facets or request.args.get('paginate') or 'cursor' in request.args:
+        if normalized:
+            body += b',"airports":' + flight_serializer.airport_table(engine, page)
+        extra = dumps_bytes({'next_cursor': next_cursor, **(summary or {})})
+        body = b'{"flights":' + body + b',' + extra[1:]
+    response = Response(body + b'\n', mimetype='application/json')
+    response.headers['X-Inventory-Version'] = inventory_version
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    response.set_etag(hashlib.sha1(
+        f'{inventory_version}/{seat_token}?{request.query_string.decode("latin-1")}'.encode('utf-8')
+    ).hexdigest())
+    return response.make_conditional(request)
+
+@app.route('/api/search-cache')
+def get_search_cache_stats():
+    """Hit, miss and coalesced-miss counters for this worker's /api/flights cache."""
+    return jsonify(search_cache.stats())
+
+@app.route('/api/fare-calendar')
+def get_fare_calendar():
+    """Lowest fare with seats left on each day of a month for one route.
+
+    Days still being built are listed in ``pending``; ask again shortly.
+    """
+    origin = request.args.get('origin', '').upper()
+    destination = request.args.get('destination', '').upper()
+    if not origin or not destination or origin == destination:
+        return jsonify({'error': 'origin and destination are required and must differ'}), 400
+    month = request.args.get('month') or flight_inventory.today().strftime('%Y-%m')
     try:
-        limit_val = int(limit)
-        filtered_flights = filtered_flights[:limit_val]
+        first_day = datetime.strptime(month, '%Y-%m').date()
     except ValueError:
-        filtered_flights = filtered_flights[:50]
-    
-    return jsonify(filtered_flights)
+        return jsonify({'error': 'month must be YYYY-MM'}), 400
+    days, pending = fare_calendar.month(origin, destination, first_day)
+    return jsonify({
+        'origin': origin,
+        'destination': destination,
+        'month': first_day.strftime('%Y-%m'),
+        'days': days,
+        'pending': pending,
+    })
+
+@app.route('/api/itineraries')
+def get_itineraries():
+    origin = request.args.get('origin', '').upper()
+    destination = request.args.get('destination', '').upper()
+    if not origin or not destination or origin == destination:
+        return jsonify({'error': 'origin and destination are required and must differ'}), 400
+    try:
+        max_connections = int(request.args.get('max_connections', MAX_ITINERARY_CONNECTIONS))
+    except ValueError:
+        max_connections = MAX_ITINERARY_CONNECTIONS
+    max_connections = min(max(max_connections, 0), MAX_ITINERARY_CONNECTIONS)
+    try:
+        service_date = parse_service_date(request.args.get('date'))
+    except ValueError:
+        return _service_date_error()
+    itineraries = itinerary_search.search(origin, destination, service_date, max_connections)
+    return jsonify(itineraries)
 
 @app.route('/api/airports')
+@precomputed_json
 def get_airports():
-    airports = [
-        {'code': 'JFK', 'name': 'New York (JFK)', 'city': 'New York'},
-        {'code': 'LAX', 'name': 'Los Angeles (LAX)', 'city': 'Los Angeles'},
-        {'code': 'ORD', 'name': 'Chicago (ORD)', 'city': 'Chicago'},
-        {'code': 'DFW', 'name': 'Dallas (DFW)', 'city': 'Dallas'},
-        {'code': 'ATL', 'name': 'Atlanta (ATL)', 'city': 'Atlanta'},
-        {'code': 'MIA', 'name': 'Miami (MIA)', 'city': 'Miami'},
-        {'code': 'SEA', 'name': 'Seattle (SEA)', 'city': 'Seattle'},
-        {'code': 'DEN', 'name': 'Denver (DEN)', 'city': 'Denver'},
-        {'code': 'SFO', 'name': 'San Francisco (SFO)', 'city': 'San Francisco'},
-        {'code': 'BOS', 'name': 'Boston (BOS)', 'city': 'Boston'},
-        {'code': 'LAS', 'name': 'Las Vegas (LAS)', 'city': 'Las Vegas'},
-        {'code': 'PHX', 'name': 'Phoenix (PHX)', 'city': 'Phoenix'},
-        {'code': 'IAH', 'name': 'Houston (IAH)', 'city': 'Houston'},
-        {'code': 'CLT', 'name': 'Charlotte (CLT)', 'city': 'Charlotte'},
-        {'code': 'MCO', 'name': 'Orlando (MCO)', 'city': 'Orlando'},
-        {'code': 'DTW', 'name': 'Detroit (DTW)', 'city': 'Detroit'},
-        {'code': 'FLL', 'name': 'Fort Lauderdale (FLL)', 'city': 'Fort Lauderdale'},
-        {'code': 'BWI', 'name': 'Baltimore (BWI)', 'city': 'Baltimore'},
-        {'code': 'IAD', 'name': 'Washington (IAD)', 'city': 'Washington'},
-        {'code': 'PHL', 'name': 'Philadelphia (PHL)', 'city': 'Philadelphia'}
-    ]
-    return jsonify(airports)
+    return AIRPORTS
+
+@app.route('/api/airports/suggest')
+def suggest_airports():
+    try:
+        limit = int(request.args.get('limit', AIRPORT_SUGGEST_LIMIT))
+    except ValueError:
+        limit = AIRPORT_SUGGEST_LIMIT
+    limit = min(max(limit, 1), 50)
+    return jsonify(airport_index.suggest(request.args.get('q', ''), limit))
 
 @app.route('/api/popular-routes')
+@precomputed_json
 def get_popular_routes():
     """Get popular flight routes with sample pricing"""
     popular_routes = [
@@ -701,9 +4212,10 @@ def get_popular_routes():
             'popularity': 'Medium'
         }
     ]
-    return jsonify(popular_routes)
+    return popular_routes
 
 @app.route('/api/flight-suggestions')
+@precomputed_json
 def get_flight_suggestions():
     """Get flight suggestions based on current search trends"""
     suggestions = [
@@ -735,11 +4247,43 @@ def get_flight_suggestions():
             ]
         }
     ]
-    return jsonify(suggestions)
+    return suggestions
 
 @app.route('/booking/<flight_id>')
 def booking(flight_id):
-    return render_template('booking.html', flight_id=flight_id)
+    # The selected flight travels in the server-side session and the page,
+    # rather than only in the browser's sessionStorage
+    try:
+        _, engine = flight_inventory.query_engine(parse_service_date(request.args.get('date')))
+        index = engine.by_id.get(flight_id)
+    except ValueError:
+        index = None
+    flight = engine.flights[index] if index is not None else None
+    if flight is not None and session.get('selected_flight') != flight_id:
+        session['selected_flight'] = flight_id
+    return render_template('booking.html', flight_id=flight_id, flight=flight)
+
+@app.route('/assets/<path:filename>')
+def serve_asset(filename):
+    """Built assets, precompressed when the client accepts it and cached for a year.
+
+    The names are content hashes, so a response never goes stale.
+    """
+    path = safe_join(ASSET_DIST_DIR, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    encoding = None
+    for candidate, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[candidate] and os.path.isfile(path + suffix):
+            path, encoding = path + suffix, candidate
+            break
+    response = send_file(path, mimetype=mimetypes.guess_type(filename)[0], max_age=ASSET_MAX_AGE)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 @app.route('/images')
 def images():
@@ -768,42 +4312,89 @@ def data_page():
         'data.html',
         data_items_per_page=DATA_ITEMS_PER_PAGE,
         data_total_pages=DATA_LAZY_TOTAL_PAGES,
+        data_page_batch_max=DATA_PAGE_BATCH_MAX,
     )
 
 
-@app.route('/api/data-page')
-def api_data_page():
-    try:
-        page = int(request.args.get('page', 1))
-    except (TypeError, ValueError):
-        page = 1
-    if page < 1 or page > DATA_LAZY_TOTAL_PAGES:
-        return jsonify({
-            'items': [],
-            'page': page,
-            'hasMore': False,
-            'totalPages': DATA_LAZY_TOTAL_PAGES,
-        })
-    time.sleep(2)
+def data_page_items(page):
+    """The deterministic cards on ``page``; each item only depends on its index."""
     items = []
     start = (page - 1) * DATA_ITEMS_PER_PAGE
     for i in range(DATA_ITEMS_PER_PAGE):
         global_idx = start + i
         rng = random.Random(global_idx * 9973 + page * 131)
-        image_url = rng.choice(DATA_IMAGE_POOL)
+        image_url = asset_url(rng.choice(DATA_IMAGE_POOL))
         label = f'{rng.choice(DATA_LABEL_PREFIXES)} {global_idx + 1}'
         items.append({
             'id': global_idx + 1,
             'image': image_url,
             'text': label,
         })
-    has_more = page < DATA_LAZY_TOTAL_PAGES
-    return jsonify({
-        'items': items,
+    return items
+
+
+@lru_cache(maxsize=DATA_PAGE_CACHE_SIZE)
+def data_page_body(page):
+    """``(payload, body, etag)`` for /api/data-page, built once per page."""
+    in_range = 1 <= page <= DATA_LAZY_TOTAL_PAGES
+    payload = {
+        'items': data_page_items(page) if in_range else [],
         'page': page,
-        'hasMore': has_more,
+        'hasMore': in_range and page < DATA_LAZY_TOTAL_PAGES,
         'totalPages': DATA_LAZY_TOTAL_PAGES,
-    })
+    }
+    body = json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return payload, body, hashlib.sha1(body).hexdigest()
+
+
+def simulate_data_latency():
+    if DATA_PAGE_LATENCY > 0:
+        time.sleep(DATA_PAGE_LATENCY)
+
+
+def data_page_response(body, etag):
+    response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={CATALOG_MAX_AGE}'
+    return response
+
+
+@app.route('/api/data-page')
+def api_data_page():
+    try:
+        page = int(request.args.get('page', 1))
+    except (TypeError, ValueError):
+        page = 1
+    _, body, etag = data_page_body(page)
+    # Pages never change, so a revalidation skips the simulated latency too
+    if request.if_none_match.contains(etag):
+        return data_page_response(b'', etag).make_conditional(request)
+    if 1 <= page <= DATA_LAZY_TOTAL_PAGES:
+        simulate_data_latency()
+    return data_page_response(body, etag)
+
+
+@app.route('/api/data-pages')
+def api_data_pages():
+    """Several consecutive /api/data-page payloads in one round trip."""
+    try:
+        first = max(int(request.args.get('from', 1)), 1)
+        count = min(max(int(request.args.get('count', 2)), 1), DATA_PAGE_BATCH_MAX)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'from and count must be integers'}), 400
+    last = min(first + count - 1, DATA_LAZY_TOTAL_PAGES)
+    pages = [data_page_body(page) for page in range(first, last + 1)]
+    etag = hashlib.sha1(''.join(entry[2] for entry in pages).encode('ascii')).hexdigest()
+    if request.if_none_match.contains(etag):
+        return data_page_response(b'', etag).make_conditional(request)
+    if pages:
+        simulate_data_latency()
+    body = json.dumps({
+        'pages': [entry[0] for entry in pages],
+        'hasMore': last < DATA_LAZY_TOTAL_PAGES,
+        'totalPages': DATA_LAZY_TOTAL_PAGES,
+    }, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return data_page_response(body, etag)
 
 
 if __name__ == '__main__':
@@ -1,6 +1,7 @@
 // Booking Page JavaScript for American Airlines
 
 let selectedFlight = null;
+let seatHold = null;
 let currentPrice = 0;
 let additionalCosts = {
     seatSelection: 0,
@@ -22,6 +23,14 @@ document.addEventListener('DOMContentLoaded', function() {
     calculateTotalPrice();
 });
 
+// The hold outlives reloads and the back/forward cache, where it is renewed;
+// "Back to Search" gives it up, and a closed tab lets it expire on the server
+window.addEventListener('pageshow', function(event) {
+    if (event.persisted && selectedFlight) {
+        holdSeat();
+    }
+});
+
 function initializeBookingPage() {
     console.log('Booking page initialized');
     
@@ -61,17 +70,29 @@ function setupBookingEventListeners() {
         confirmBookingBtn.addEventListener('click', handleConfirmBooking);
     }
     
+    const backToSearchBtn = document.getElementById('backToSearch');
+    if (backToSearchBtn) {
+        backToSearchBtn.addEventListener('click', function() {
+            releaseSeatHold();
+            history.back();
+        });
+    }
+    
     // Form validation
     setupFormValidation();
 }
 
 function loadFlightDetails() {
-    // Get flight data from session storage
-    const flightData = sessionStorage.getItem('selectedFlight');
-    if (flightData) {
-        selectedFlight = JSON.parse(flightData);
+    // The server renders the selected flight into the page; session storage
+    // is only a fallback for flights that have left the schedule
+    const serverData = document.getElementById('selectedFlightData');
+    const serverFlight = serverData ? JSON.parse(serverData.textContent) : null;
+    const flightData = serverFlight ? null : sessionStorage.getItem('selectedFlight');
+    if (serverFlight || flightData) {
+        selectedFlight = serverFlight || JSON.parse(flightData);
         displayFlightSummary();
         displayPriceSummary();
+        holdSeat();
     } else {
         showError('No flight selected. Please search for flights again.');
         setTimeout(() => {
@@ -348,18 +369,90 @@ function handleBookFlight() {
     if (validateAllFields()) {
         // Show confirmation dialog
         if (confirm('Are you sure you want to proceed with this booking?')) {
-            showSuccess('Flight booking successful! Redirecting to confirmation...');
-            setTimeout(() => {
-                // In a real application, this would submit to a payment processor
-                // For demo purposes, we'll just show a success message
-                showSuccess('Thank you for your booking! Your confirmation has been sent to your email.');
-            }, 2000);
+            submitBooking();
         }
     } else {
         showError('Please fill in all required fields correctly.');
     }
 }
 
+function seatHoldKey() {
+    return `seatHold:${selectedFlight.id}:${selectedFlight.departure_date || ''}`;
+}
+
+async function holdSeat() {
+    // Keep a seat for this traveller while they fill in the form; the hold
+    // expires on the server if the booking is abandoned. A hold this tab
+    // still has for the flight is renewed rather than taking another seat.
+    try {
+        const stored = JSON.parse(sessionStorage.getItem(seatHoldKey()) || 'null');
+        if (stored) {
+            const renewed = await fetch(`/api/holds/${encodeURIComponent(stored.hold_id)}`, { method: 'PATCH' });
+            if (renewed.ok) {
+                seatHold = await renewed.json();
+                sessionStorage.setItem(seatHoldKey(), JSON.stringify(seatHold));
+                return;
+            }
+            sessionStorage.removeItem(seatHoldKey());
+        }
+        
+        const response = await fetch(`/api/flights/${encodeURIComponent(selectedFlight.id)}/holds`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ seats: 1, date: selectedFlight.departure_date })
+        });
+        const result = await response.json();
+        if (response.ok) {
+            seatHold = result;
+            sessionStorage.setItem(seatHoldKey(), JSON.stringify(seatHold));
+        } else if (response.status === 409) {
+            showError('Sorry, this flight is sold out. Please choose another flight.');
+        }
+    } catch (error) {
+        console.error('Error holding seat:', error);
+    }
+}
+
+function releaseSeatHold() {
+    if (!seatHold) return;
+    // keepalive lets the request outlive the page that sent it
+    fetch(`/api/holds/${encodeURIComponent(seatHold.hold_id)}`, { method: 'DELETE', keepalive: true })
+        .catch(error => console.error('Error releasing seat hold:', error));
+    sessionStorage.removeItem(seatHoldKey());
+    seatHold = null;
+}
+
+async function submitBooking() {
+    // The server takes the seat atomically and answers 409 if it is gone
+    try {
+        const response = await fetch('/api/bookings', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                flight_id: selectedFlight.id,
+                email: document.getElementById('email')?.value || '',
+                seats: 1,
+                date: selectedFlight.departure_date,
+                hold_id: seatHold ? seatHold.hold_id : undefined
+            })
+        });
+        const result = await response.json();
+        if (response.ok) {
+            seatHold = null;
+            sessionStorage.removeItem(seatHoldKey());
+            const booking = result.bookings[0];
+            showSuccess(`Thank you for your booking! Confirmation ${booking.confirmation_number}, seat ${booking.seat}.`);
+        } else if (response.status === 409) {
+            showError(`Sorry, this flight no longer has enough seats (${result.available} left).`);
+        } else {
+            showError(result.error || 'Booking failed. Please try again.');
+        }
+    } catch (error) {
+        console.error('Error submitting booking:', error);
+        showError('Booking failed. Please try again.');
+    }
+}
+
 function handleConfirmBooking() {
     handleBookFlight();
 }
@@ -8,6 +8,10 @@
     let loading = false;
     let done = false;
     let totalPages = parseInt(body.dataset.totalPages || '10', 10);
+    const batchMax = parseInt(body.dataset.pageBatchMax || '10', 10);
+
+    // Page number -> in-flight request started ahead of the scroll
+    const prefetched = new Map();
 
     function syncBrowserUrlToPage(pageNum) {
         const u = new URL(window.location.href);
@@ -37,31 +41,82 @@
         grid.appendChild(card);
     }
 
+    function requestPage(pageNum) {
+        return fetch(`/api/data-page?page=${pageNum}`).then((res) => {
+            if (!res.ok) {
+                throw new Error(res.statusText);
+            }
+            return res.json();
+        });
+    }
+
+    function fetchPage(pageNum) {
+        const pending = prefetched.get(pageNum);
+        if (pending) {
+            prefetched.delete(pageNum);
+            return pending;
+        }
+        return requestPage(pageNum);
+    }
+
+    function prefetchPage(pageNum) {
+        if (done || pageNum > totalPages || prefetched.has(pageNum)) return;
+        const pending = requestPage(pageNum);
+        // A failed prefetch is simply requested again when it is needed
+        pending.catch(() => prefetched.delete(pageNum));
+        prefetched.set(pageNum, pending);
+    }
+
+    function applyPage(data) {
+        if (typeof data.totalPages === 'number') {
+            totalPages = data.totalPages;
+        }
+        (data.items || []).forEach(renderCard);
+        if (typeof data.page === 'number') {
+            syncBrowserUrlToPage(data.page);
+        }
+        if (!data.hasMore) {
+            done = true;
+            observer.disconnect();
+            statusEl.textContent = 'All pages loaded.';
+        } else {
+            statusEl.textContent = '';
+        }
+        nextPage += 1;
+    }
+
     async function loadNextPage() {
         if (loading || done || nextPage > totalPages) return;
         loading = true;
         statusEl.textContent = 'Loading…';
         try {
-            const res = await fetch(`/api/data-page?page=${nextPage}`);
+            applyPage(await fetchPage(nextPage));
+            // Start the following page while this one renders
+            prefetchPage(nextPage);
+        } catch (e) {
+            console.error(e);
+            statusEl.textContent = 'Could not load the next page. Scroll again to retry.';
+            return false;
+        } finally {
+            loading = false;
+        }
+    }
+
+    async function loadPageBatch(count) {
+        loading = true;
+        statusEl.textContent = 'Loading…';
+        try {
+            const res = await fetch(`/api/data-pages?from=${nextPage}&count=${count}`);
             if (!res.ok) {
                 throw new Error(res.statusText);
             }
             const data = await res.json();
-            if (typeof data.totalPages === 'number') {
-                totalPages = data.totalPages;
-            }
-            (data.items || []).forEach(renderCard);
-            if (typeof data.page === 'number') {
-                syncBrowserUrlToPage(data.page);
-            }
-            if (!data.hasMore) {
+            if (!data.pages || data.pages.length === 0) {
                 done = true;
-                observer.disconnect();
                 statusEl.textContent = 'All pages loaded.';
-            } else {
-                statusEl.textContent = '';
+                return;
             }
-            nextPage += 1;
+            data.pages.forEach(applyPage);
         } catch (e) {
             console.error(e);
             statusEl.textContent = 'Could not load the next page. Scroll again to retry.';
@@ -101,10 +156,12 @@
             target = 1;
         }
         target = Math.min(Math.max(target, 1), totalPages);
+        // Deep links fetch every page up to the target in batched round trips
         while (nextPage <= target && !done) {
-            const failed = await loadNextPage();
+            const failed = await loadPageBatch(Math.min(target - nextPage + 1, batchMax));
             if (failed === false) break;
         }
+        prefetchPage(nextPage);
     }
 
     document.addEventListener('DOMContentLoaded', async () => {
@@ -3,6 +3,8 @@
 let allFlights = [];
 let filteredFlights = [];
 let currentFilters = {};
+let resultTotals = null;
+let flightFacets = null;
 
 document.addEventListener('DOMContentLoaded', function() {
     // Initialize the search page
@@ -100,6 +102,44 @@ function displaySearchSummary() {
     }
 }
 
+function buildFlightParams(search, filters) {
+    const params = new URLSearchParams({
+        origin: search.origin,
+        destination: search.destination,
+        date: search.departDate,
+        limit: String(filters.limit || 100),
+        facets: '1'  // Counts for the filter sidebar come back with the results
+    });
+    
+    // Multi-valued filters are sent as repeated parameters
+    if (filters.minPrice) params.append('min_price', filters.minPrice);
+    if (filters.maxPrice) params.append('max_price', filters.maxPrice);
+    (filters.stops || []).forEach(stop => params.append('stops', stop));
+    (filters.airlines || []).forEach(airline => params.append('airline', airline));
+    (filters.departureTimes || []).forEach(time => params.append('departure_time', time));
+    
+    const sortSelect = document.getElementById('sortBy');
+    if (sortSelect) {
+        params.append('sort_by', sortSelect.value);
+    }
+    
+    return params;
+}
+
+function fetchFlights(params) {
+    // Rejects with the API's own message for bad requests, such as a date
+    // outside the booking window
+    return fetch(`/api/flights?${params.toString()}`)
+        .then(response => response.json().then(result => {
+            if (!response.ok) {
+                const error = new Error(result.error || 'Error loading flight results. Please try again.');
+                error.fromApi = true;
+                throw error;
+            }
+            return result;
+        }));
+}
+
 function loadFlightResults() {
     const searchData = sessionStorage.getItem('flightSearch');
     if (!searchData) {
@@ -110,32 +150,18 @@ function loadFlightResults() {
     const search = JSON.parse(searchData);
     showLoadingSpinner();
     
-    // Build API query parameters with enhanced filtering
-    const params = new URLSearchParams({
-        origin: search.origin,
-        destination: search.destination,
-        date: search.departDate,
-        limit: '100'  // Get more results for better filtering
-    });
+    // One request returns the filtered results plus facet counts
+    const params = buildFlightParams(search, currentFilters);
     
-    fetch(`/api/flights?${params.toString()}`)
-        .then(response => response.json())
-        .then(flights => {
-            allFlights = flights;
-            filteredFlights = [...flights];
-            hideLoadingSpinner();
-            displayFlightResults();
-            updateResultCount();
-            
-            // Apply any existing filters
-            if (Object.keys(currentFilters).length > 0) {
-                applyFilters();
-            }
+    fetchFlights(params)
+        .then(result => {
+            allFlights = result.flights;
+            showFlightResult(result);
         })
         .catch(error => {
             console.error('Error loading flights:', error);
             hideLoadingSpinner();
-            showError('Error loading flight results. Please try again.');
+            showError(error.fromApi ? error.message : 'Error loading flight results. Please try again.');
         });
 }
 
@@ -276,7 +302,8 @@ function updateFilters() {
         airlines: selectedAirlines,
         stops: selectedStops,
         departureTimes: selectedTimes,
-        routeTypes: selectedRouteTypes
+        routeTypes: selectedRouteTypes,
+        limit: currentFilters.limit  // Set by the results-per-page selector
     };
 }
 
@@ -318,6 +345,16 @@ function handleResultsPerPageChange() {
     }
 }
 
+function showFlightResult(result) {
+    filteredFlights = result.flights;
+    resultTotals = { total: result.total, matched: result.matched };
+    flightFacets = result.facets;
+    hideLoadingSpinner();
+    displayFlightResults();
+    updateResultCount();
+    updateFacetCounts();
+}
+
 function applyFilters() {
     updateFilters();
     
@@ -326,40 +363,21 @@ function applyFilters() {
     if (!searchData) return;
     
     const search = JSON.parse(searchData);
-    const params = new URLSearchParams({
-        origin: search.origin,
-        destination: search.destination,
-        date: search.departDate,
-        limit: '100'
-    });
-    
-    // Add filter parameters
-    if (currentFilters.minPrice) params.append('min_price', currentFilters.minPrice);
-    if (currentFilters.maxPrice) params.append('max_price', currentFilters.maxPrice);
-    if (currentFilters.stops.length > 0) params.append('stops', currentFilters.stops[0]); // API supports single value
-    if (currentFilters.airlines.length > 0) params.append('airline', currentFilters.airlines[0]); // API supports single value
-    if (currentFilters.departureTimes.length > 0) params.append('departure_time', currentFilters.departureTimes[0]); // API supports single value
-    
-    // Add sorting
-    const sortSelect = document.getElementById('sortBy');
-    if (sortSelect) {
-        params.append('sort_by', sortSelect.value);
-    }
+    const params = buildFlightParams(search, currentFilters);
     
     showLoadingSpinner();
     
-    fetch(`/api/flights?${params.toString()}`)
-        .then(response => response.json())
-        .then(flights => {
-            filteredFlights = flights;
-            hideLoadingSpinner();
-            displayFlightResults();
-            updateResultCount();
-        })
+    fetchFlights(params)
+        .then(showFlightResult)
         .catch(error => {
             console.error('Error applying filters:', error);
             hideLoadingSpinner();
+            if (error.fromApi) {
+                showError(error.message);
+                return;
+            }
             // Fallback to client-side filtering
+            resultTotals = null;
             filterFlights();
             displayFlightResults();
             updateResultCount();
@@ -423,8 +441,8 @@ function sortFlights(sortBy) {
 function updateResultCount() {
     const resultCountElement = document.getElementById('resultCount');
     if (resultCountElement) {
-        const total = allFlights.length;
-        const filtered = filteredFlights.length;
+        const total = resultTotals ? resultTotals.total : allFlights.length;
+        const filtered = resultTotals ? resultTotals.matched : filteredFlights.length;
         
         if (filtered === total) {
             resultCountElement.textContent = `${total} flight${total !== 1 ? 's' : ''} found`;
@@ -434,12 +452,38 @@ function updateResultCount() {
     }
 }
 
+function updateFacetCounts() {
+    if (!flightFacets) return;
+    
+    const facetGroups = {
+        stops: flightFacets.stops,
+        airline: flightFacets.airlines,
+        departureTime: flightFacets.departure_times
+    };
+    
+    Object.entries(facetGroups).forEach(([name, counts]) => {
+        document.querySelectorAll(`input[name="${name}"]`).forEach(checkbox => {
+            const label = document.querySelector(`label[for="${checkbox.id}"]`);
+            if (!label) return;
+            
+            let badge = label.querySelector('.facet-count');
+            if (!badge) {
+                badge = document.createElement('span');
+                badge.className = 'facet-count text-muted ms-1';
+                label.appendChild(badge);
+            }
+            badge.textContent = `(${counts[checkbox.value] || 0})`;
+        });
+    });
+}
+
 function bookFlight(flightId) {
     // Store selected flight in session storage
-    const selectedFlight = allFlights.find(f => f.id === flightId);
+    const selectedFlight = filteredFlights.find(f => f.id === flightId) ||
+        allFlights.find(f => f.id === flightId);
     if (selectedFlight) {
         sessionStorage.setItem('selectedFlight', JSON.stringify(selectedFlight));
-        window.location.href = `/booking/${flightId}`;
+        window.location.href = `/booking/${flightId}?date=${encodeURIComponent(selectedFlight.departure_date || '')}`;
     }
 }
 
@@ -490,27 +534,3 @@ function showError(message) {
         }
     }, 5000);
 }
-
-// Initialize filters on page load
-document.addEventListener('DOMContentLoaded', function() {
-    // Set up filter checkboxes with proper names
-    const airlineCheckboxes = document.querySelectorAll('input[id^="aa"], input[id^="ae"], input[id^="ac"]');
-    airlineCheckboxes.forEach(checkbox => {
-        checkbox.name = 'airline';
-    });
-    
-    const stopCheckboxes = document.querySelectorAll('input[id="nonstop"], input[id="onestop"]');
-    stopCheckboxes.forEach(checkbox => {
-        checkbox.name = 'stops';
-    });
-    
-    const timeCheckboxes = document.querySelectorAll('input[id="morning"], input[id="afternoon"], input[id="evening"]');
-    timeCheckboxes.forEach(checkbox => {
-        checkbox.name = 'departureTime';
-    });
-    
-    const routeTypeCheckboxes = document.querySelectorAll('input[id="major"], input[id="regional"]');
-    routeTypeCheckboxes.forEach(checkbox => {
-        checkbox.name = 'routeType';
-    });
-});
@@ -1,6 +1,42 @@
 #!/usr/bin/env python
 
-from app import generate_mock_flights
+import os
+import base64
+import gzip
+import json
+import re
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from datetime import datetime, timedelta
+
+import random
+
+import pytest
+from werkzeug.datastructures import MultiDict
+
+import app as flight_app
+from app import generate_mock_flights, FlightInventory, FlightQueryEngine, FlightColumnStore, ConnectionGraph
+
+def use_tmp_stores(tmp_path, monkeypatch, **inventory_options):
+    """Point the app's module-level databases and stores at fresh files under ``tmp_path``.
+
+    ``inventory_options`` go to the ``FlightInventory``.
+    """
+    pool = flight_app.company_tables_pool(os.path.join(str(tmp_path), 'tables.db'))
+    inventory = FlightInventory(os.path.join(str(tmp_path), 'flights.db'), **inventory_options)
+    bookings = flight_app.BookingStore(pool)
+    fares = flight_app.FareCalendar(pool, inventory)
+    for name, value in (('table_db', pool), ('flight_inventory', inventory), ('booking_store', bookings),
+                        ('fare_calendar', fares), ('search_cache', flight_app.SearchCache()),
+                        ('seat_inventory', flight_app.SeatInventory(pool, inventory, bookings,
+                                                                    sweep_interval=None, fares=fares))):
+        monkeypatch.setattr(flight_app, name, value)
+    monkeypatch.setattr(flight_app.app, 'session_interface',
+                        flight_app.ServerSessionInterface(flight_app.SQLiteSessionStore(pool)))
+    return pool, inventory
+
 
 def test_flight_generation():
     print("Testing enhanced mock flight generation...")
@@ -41,5 +77,684 @@ def test_flight_generation():
     
     print("Unique routes: {}".format(len(unique_routes)))
 
+def test_flight_inventory_is_stable(tmp_path):
+    db_path = os.path.join(str(tmp_path), 'flights.db')
+    clock = lambda: datetime(2025, 6, 1, 9, 30)
+    inventory = FlightInventory(db_path, clock=clock)
+    version, flights = inventory.snapshot()
+    assert flights
+    assert inventory.snapshot() == (version, flights)
+
+    # A second worker loads the same schedule from SQLite
+    other = FlightInventory(db_path, clock=clock)
+    assert other.snapshot() == (version, flights)
+
+    # Crossing the refresh boundary produces a new schedule version
+    other.clock = lambda: datetime(2025, 6, 2, 0, 5)
+    assert other.version != version
+
+
+def test_query_engine_matches_linear_scan():
+    flights = generate_mock_flights(rng=random.Random(7), base_time=datetime(2025, 6, 1))
+    engine = FlightQueryEngine(flights)
+
+    def reference(origin='', min_price=None, max_price=None, stops=(),
+                  airlines=(), departure_times=()):
+        result = []
+        for f in flights:
+            hour = int(f['departure_time'].split(':')[0])
+            if origin and f['departure_airport']['code'] != origin:
+                continue
+            if min_price is not None and f['price'] < min_price:
+                continue
+            if max_price is not None and f['price'] > max_price:
+                continue
+            if stops and f['stops'] not in stops:
+                continue
+            if airlines and not any(a.lower() in f['airline'].lower() for a in airlines):
+                continue
+            if departure_times and not (
+                    ('morning' in departure_times and 6 <= hour < 12)
+                    or ('evening' in departure_times and 18 <= hour <= 22)):
+                continue
+            result.append(f)
+        return sorted(result, key=lambda f: f['price'])
+
+    queries = [
+        {},
+        {'origin': 'JFK'},
+        {'origin': 'JFK', 'max_price': 400.0, 'departure_times': ['morning']},
+        {'min_price': 200.0, 'stops': [1], 'airlines': ['eagle']},
+        {'airlines': ['American'], 'departure_times': ['evening']},
+        {'stops': [0, 1], 'airlines': ['eagle', 'connection'],
+         'departure_times': ['morning', 'evening']},
+    ]
+    for query in queries:
+        expected = reference(**query)
+        assert engine.search(limit=len(flights), **query) == expected
+        assert engine.search(limit=5, **query) == expected[:5]
+
+
+def test_column_store_matches_query_engine():
+    pytest.importorskip('numpy')
+    flights = generate_mock_flights(rng=random.Random(11), base_time=datetime(2025, 6, 1))
+    engine = FlightQueryEngine(flights)
+    store = FlightColumnStore(flights)
+
+    queries = [
+        {},
+        {'origin': 'ORD', 'destination': 'DFW'},
+        {'destination': 'XXX'},
+        {'min_price': 150.0, 'max_price': 350.0, 'sort_by': 'duration'},
+        {'airlines': ['connection'], 'departure_times': ['afternoon'], 'sort_by': 'departure'},
+        {'stops': [0], 'sort_by': 'arrival', 'limit': 7},
+        {'airlines': ['eagle', 'connection'], 'departure_times': ['morning', 'evening']},
+        {'sort_by': 'unknown', 'limit': 3},
+    ]
+    for query in queries:
+        assert store.search(**query) == engine.search(**query)
+
+    route = engine.candidates(origin='JFK')
+    assert store.facets(store.candidates(origin='JFK')) == engine.facets(route)
+    assert sum(engine.facets(route)['airlines'].values()) == len(route)
+
+
+def test_flights_cursor_pages_cover_results(tmp_path, monkeypatch):
+    use_tmp_stores(tmp_path, monkeypatch, clock=lambda: datetime(2025, 6, 1, 12, 0))
+    client = flight_app.app.test_client()
+
+    for sort_by in ('price', 'duration', 'departure'):
+        everything = client.get('/api/flights?origin=JFK&limit=1000&sort_by=' + sort_by).get_json()
+        pages, cursor = [], None
+        while True:
+            url = '/api/flights?origin=JFK&limit=4&paginate=1&sort_by=' + sort_by
+            body = client.get(url + ('&cursor=' + cursor if cursor else '')).get_json()
+            pages.extend(body['flights'])
+            cursor = body['next_cursor']
+            if not cursor:
+                break
+        assert pages == everything
+
+    streamed = client.get('/api/flights?origin=JFK&format=ndjson&sort_by=departure')
+    assert streamed.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in streamed.get_data(as_text=True).splitlines()]
+    assert lines == everything
+
+    def cursor(fields):
+        return base64.urlsafe_b64encode(json.dumps(fields).encode('utf-8')).decode('ascii')
+
+    assert client.get('/api/flights?cursor=bogus').status_code == 400
+    version = flight_app.flight_inventory.query_engine()[0]
+    flight_id = everything[0]['id']
+    for crafted in ([version, 'departure', 0, ['AA1']], [version, 'departure', 0, {'id': 1}], {'a': 1},
+                    [version, 'departure', [0], flight_id], [version, 'departure', 0]):
+        assert client.get('/api/flights?sort_by=departure&cursor=' + cursor(crafted)).status_code == 400
+    for stale in (['old', 'departure', 0, flight_id], [version, 'departure', 10 ** 30, flight_id]):
+        assert client.get('/api/flights?sort_by=departure&cursor=' + cursor(stale)).status_code == 410
+
+
+def test_schedule_partitions_by_date_and_flexible_search(tmp_path, monkeypatch):
+    now = [datetime(2025, 6, 1, 9, 30)]
+    _, inventory = use_tmp_stores(tmp_path, monkeypatch, clock=lambda: now[0], horizon_days=30, max_partitions=3)
+    first = inventory.partition()
+    later = inventory.partition(first[0] + timedelta(days=10))
+    assert first[1] != later[1] and later[2][0]['departure_date'] == '2025-06-11'
+    assert inventory.partition(first[0]) is first
+    with pytest.raises(KeyError):
+        inventory.partition(first[0] + timedelta(days=31))
+
+    # Rolling over drops yesterday's partition from memory and from flights.db
+    now[0] += timedelta(days=1)
+    inventory.partition(first[0] + timedelta(days=5))
+    assert first[0] not in inventory._partitions
+    with closing(sqlite3.connect(inventory.db_path)) as conn:
+        assert '2025-06-01' not in [row[0] for row in conn.execute("SELECT service_date FROM flight_schedule")]
+
+    client = flight_app.app.test_client()
+    assert client.get('/api/flights?date=2025-06-01').status_code == 400
+    assert client.get('/api/flights?date=2025-06-03&flex=99').status_code == 400
+    body = client.get('/api/flights?origin=JFK&destination=LAX&date=2025-06-03&flex=2').get_json()
+    assert [day['date'] for day in body['days']] == ['2025-06-02', '2025-06-03', '2025-06-04', '2025-06-05']
+    for day in body['days']:
+        listed = client.get('/api/flights?origin=JFK&destination=LAX&limit=1&date=' + day['date']).get_json()
+        engine = inventory.partition(datetime.strptime(day['date'], '%Y-%m-%d').date())[3]
+        assert day['cheapest'] == listed[0]
+        assert day['matched'] == len(engine.candidates(origin='JFK', destination='LAX'))
+
+    # A cold day loads without holding up days that are already in memory
+    building, release = threading.Event(), threading.Event()
+    build, builds = inventory._build, []
+
+    def slow_build(service_date):
+        builds.append(service_date)
+        building.set()
+        release.wait(5)
+        return build(service_date)
+
+    monkeypatch.setattr(inventory, '_build', slow_build)
+    cold = first[0] + timedelta(days=20)
+    loaders = [threading.Thread(target=inventory.partition, args=(cold,)) for _ in range(2)]
+    for loader in loaders:
+        loader.start()
+    assert building.wait(5)
+    warm = body['days'][-1]['date']
+    assert client.get('/api/flights?origin=JFK&destination=LAX&date=' + warm).status_code == 200
+    release.set()
+    for loader in loaders:
+        loader.join()
+    assert builds == [cold] and cold in inventory._partitions
+
+
+def test_fare_calendar_tracks_sold_out_flights(tmp_path, monkeypatch):
+    pool = flight_app.company_tables_pool(os.path.join(str(tmp_path), 'tables.db'))
+    inventory = FlightInventory(os.path.join(str(tmp_path), 'flights.db'),
+                                clock=lambda: datetime(2025, 6, 20, 9, 30), horizon_days=30)
+    fares = flight_app.FareCalendar(pool, inventory)
+    seats = flight_app.SeatInventory(pool, inventory, flight_app.BookingStore(pool), sweep_interval=None, fares=fares)
+    monkeypatch.setattr(flight_app, 'flight_inventory', inventory)
+    monkeypatch.setattr(flight_app, 'fare_calendar', fares)
+    monkeypatch.setattr(flight_app, 'seat_inventory', seats)
+    client = flight_app.app.test_client()
+
+    # A cold month answers at once and builds its days in the background
+    cold = client.get('/api/fare-calendar?origin=JFK&destination=LAX&month=2025-06').get_json()
+    assert len(cold['days']) + len(cold['pending']) == 11
+    client.get('/api/fare-calendar?origin=JFK&destination=LAX&month=2025-07')
+    assert fares.wait(30)
+    june = client.get('/api/fare-calendar?origin=JFK&destination=LAX&month=2025-06').get_json()
+    assert [day['date'] for day in june['days']] == ['2025-06-%02d' % d for d in range(20, 31)]
+    assert june['pending'] == []
+    june = june['days']
+    july = client.get('/api/fare-calendar?origin=JFK&destination=LAX&month=2025-07').get_json()['days']
+    assert july[-1]['date'] == '2025-07-20'
+    assert client.get('/api/fare-calendar?origin=JFK&destination=LAX&month=2025-13').status_code == 400
+
+    day = june[3]
+    listed = client.get('/api/flights?origin=JFK&destination=LAX&limit=100&date=' + day['date']).get_json()
+    assert day['min_price'] == listed[0]['price'] and day['flights'] == len(listed)
+
+    # Selling out the cheapest flight moves the day's fare up; releasing the seats moves it back
+    cheapest = listed[0]
+    hold = seats.hold(cheapest['id'], seats=cheapest['available_seats'], service_date=inventory.today() + timedelta(days=3))
+    moved = client.get('/api/fare-calendar?origin=JFK&destination=LAX&month=2025-06').get_json()['days'][3]
+    assert moved['min_price'] == min(f['price'] for f in listed[1:])
+    assert seats.release(hold['hold_id'])
+    assert client.get('/api/fare-calendar?origin=JFK&destination=LAX&month=2025-06').get_json()['days'][3] == day
+
+
+def test_pricing_engine_reprices_a_route_slice(tmp_path, monkeypatch):
+    inventory = FlightInventory(os.path.join(str(tmp_path), 'flights.db'),
+                                clock=lambda: datetime(2025, 6, 1, 9, 30))
+    version, flights = inventory.snapshot()
+    engine = flight_app.PricingEngine()
+    columns = engine.columns(flights)
+    assert engine.prices(columns) == [f['price'] for f in flights]
+    base_fares, floor = flight_app.FARE_RULES['route_base_fares'], flight_app.FARE_RULES['floor']
+    regional = [f for f in flights
+                if f"{f['departure_airport']['code']}-{f['arrival_airport']['code']}" not in base_fares]
+    assert regional and min(f['price'] for f in regional) >= floor
+    # The floor is for duration-priced routes only; a listed route can fare below it
+    cheap = dict(flight_app.FARE_RULES, route_base_fares={'JFK-LAX': 50})
+    jfk_lax = [f for f in flights if f['departure_airport']['code'] == 'JFK' and f['arrival_airport']['code'] == 'LAX']
+    for fast in (True, False):
+        if not fast:
+            monkeypatch.setattr(flight_app, 'np', None)
+        pricing = flight_app.PricingEngine(cheap)
+        assert max(pricing.prices(pricing.columns(jfk_lax))) < floor
+    monkeypatch.undo()
+    monkeypatch.setattr(flight_app, 'np', None)
+    assert engine.prices(engine.columns(flights)) == [f['price'] for f in flights]
+    monkeypatch.undo()
+
+    rules = dict(flight_app.FARE_RULES, route_base_fares=dict(flight_app.FARE_RULES['route_base_fares'], **{'JFK-LAX': 700}))
+    _, changed = inventory.reprice(flight_app.PricingEngine(rules), origin='JFK', destination='LAX')
+    route = {f['id'] for f in flights if f['departure_airport']['code'] == 'JFK' and f['arrival_airport']['code'] == 'LAX'}
+    assert changed and {f['id'] for f in changed} == route
+    new_version, repriced = inventory.snapshot()
+    assert new_version != version
+    assert [f for f in repriced if f['id'] not in route] == [f for f in flights if f['id'] not in route]
+    assert FlightInventory(inventory.db_path, clock=inventory.clock).snapshot() == (new_version, repriced)
+    assert engine.stats()['legs'] == 2 * len(flights) and engine.stats()['legs_per_second'] > 0
+
+
+def test_search_cache_coalesces_and_invalidates(tmp_path, monkeypatch):
+    now = [0.0]
+    cache = flight_app.SearchCache(max_entries=2, ttl=30, clock=lambda: now[0])
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return 'result'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get('d', 'v1', 'q', slow))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    while cache.stats()['coalesced'] < 7:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert results == ['result'] * 8 and len(calls) == 1
+
+    assert cache.get('d', 'v1', 'q', lambda: 'other') == 'result'
+    now[0] += 31
+    assert cache.get('d', 'v1', 'q', lambda: 'expired') == 'expired'
+    assert cache.get('d', 'v2', 'q', lambda: 'new version') == 'new version'
+    # An older snapshot still hits its own entry and leaves the newer one alone
+    assert cache.get('d', 'v1', 'q', lambda: 'recomputed') == 'expired'
+    assert cache.get('d', 'v2', 'q', lambda: 'recomputed') == 'new version'
+    assert cache.stats()['entries'] == 2
+    assert cache.stats() == dict(cache.stats(), hits=3, misses=3, coalesced=7)
+
+    use_tmp_stores(tmp_path, monkeypatch)
+    client = flight_app.app.test_client()
+    key = flight_app.flight_query_key
+    query = flight_app.parse_flight_query(MultiDict({'origin': 'jfk', 'airline': 'Eagle,american', 'stops': '1,0'}))
+    same = flight_app.parse_flight_query(MultiDict([('origin', 'JFK'), ('airline', 'american'), ('airline', 'eagle'),
+                                                    ('stops', '0'), ('stops', '1')]))
+    assert key(query, 'price', 50, None, False) == key(same, 'price', 50, None, False)
+    before = client.get('/api/search-cache').get_json()
+    first = client.get('/api/flights?origin=JFK&destination=LAX&facets=1').get_json()
+    assert client.get('/api/flights?destination=lax&origin=jfk&facets=1').get_json() == first
+    after = client.get('/api/search-cache').get_json()
+    assert after['hits'] - before['hits'] >= 1
+
+
+@pytest.mark.parametrize('fast', [True, False])
+def test_flight_serializer_splices_fragments(tmp_path, monkeypatch, fast):
+    if not fast:
+        monkeypatch.setattr(flight_app, 'orjson', None)
+    serializer = flight_app.FlightSerializer()
+    flights = generate_mock_flights(rng=random.Random(5), base_time=datetime(2025, 6, 1))
+    engine = FlightQueryEngine(flights)
+    page = list(range(0, len(flights), 7))
+    counts = {flights[page[1]]['id']: 0}
+    expected = [dict(flights[i], available_seats=counts.get(flights[i]['id'], flights[i]['available_seats']))
+                for i in page]
+    assert json.loads(serializer.flights(engine, page, counts)) == expected
+    assert json.loads(serializer.flights(engine, page, counts)) == expected  # from cached fragments
+
+    normalized = json.loads(serializer.flights(engine, page, counts, normalized=True))
+    airports = json.loads(serializer.airport_table(engine, page))
+    for flight in normalized:
+        flight['departure_airport'] = airports[flight['departure_airport']]
+        flight['arrival_airport'] = airports[flight['arrival_airport']]
+    assert normalized == expected
+
+    use_tmp_stores(tmp_path, monkeypatch)
+    client = flight_app.app.test_client()
+    full = client.get('/api/flights?origin=JFK&limit=5&paginate=1').get_json()
+    body = client.get('/api/flights?origin=JFK&limit=5&shape=normalized').get_json()
+    assert body['next_cursor'] == full['next_cursor'] and set(body['airports']) >= {'JFK'}
+    assert [f['id'] for f in body['flights']] == [f['id'] for f in full['flights']]
+    assert body['flights'][0]['departure_airport'] == 'JFK'
+
+
+def make_leg(flight_id, origin, dest, departure, duration, price):
+    return {
+        'id': flight_id,
+        'departure_airport': {'code': origin},
+        'arrival_airport': {'code': dest},
+        'departure_time': departure,
+        'arrival_time': '00:00',
+        'duration': duration,
+        'price': price,
+    }
+
+
+def test_connection_graph_respects_mct_and_pareto():
+    flights = [
+        make_leg('D1', 'BOS', 'SEA', '08:00', '6h 0m', 600),   # direct: fastest, dearest
+        make_leg('A1', 'BOS', 'ORD', '08:00', '2h 0m', 150),   # lands 10:00
+        make_leg('B1', 'ORD', 'SEA', '10:20', '4h 0m', 150),   # 20 min connection: too tight
+        make_leg('B2', 'ORD', 'SEA', '11:00', '4h 0m', 200),   # one stop: 350, 7h
+        make_leg('B3', 'ORD', 'SEA', '15:00', '4h 0m', 250),   # dominated by A1+B2
+        make_leg('C1', 'ORD', 'DEN', '11:00', '1h 0m', 50),
+        make_leg('C2', 'DEN', 'SEA', '14:00', '2h 0m', 50),    # two stops: 250, 8h
+    ]
+    graph = ConnectionGraph(flights)
+    ids = [[flights[i]['id'] for i in legs] for legs in graph.itineraries('BOS', 'SEA')]
+    assert ids == [['A1', 'C1', 'C2'], ['A1', 'B2'], ['D1']]
+    assert graph.itineraries('BOS', 'SEA', max_connections=0) == [(0,)]
+    assert graph.describe((1, 3))['layovers'] == [{'airport': 'ORD', 'minutes': 60}]
+
+
+def test_itinerary_search_keeps_a_graph_per_date(tmp_path, monkeypatch):
+    inventory = FlightInventory(os.path.join(str(tmp_path), 'flights.db'),
+                                clock=lambda: datetime(2025, 6, 1, 9, 30))
+    search = flight_app.ItinerarySearch(inventory, max_graphs=2)
+    built = []
+
+    class CountingGraph(ConnectionGraph):
+        def __init__(self, flights):
+            built.append(flights[0]['departure_date'])
+            super().__init__(flights)
+
+    monkeypatch.setattr(flight_app, 'ConnectionGraph', CountingGraph)
+    days = [inventory.today() + timedelta(days=offset) for offset in (1, 2)]
+    for origin in ('JFK', 'BOS', 'ORD'):
+        for day in days:
+            search.search(origin, 'SEA', service_date=day)
+    assert built == [day.isoformat() for day in days]
+
+
+def test_catalog_endpoints_answer_if_none_match():
+    client = flight_app.app.test_client()
+    for url in ('/api/airports', '/api/popular-routes', '/api/flight-suggestions'):
+        first = client.get(url)
+        assert first.status_code == 200 and first.get_json()
+        assert 'max-age' in first.headers['Cache-Control']
+        again = client.get(url, headers={'If-None-Match': first.headers['ETag']})
+        assert again.status_code == 304 and not again.data
+
+        packed = client.get(url, headers={'Accept-Encoding': 'gzip'})
+        assert packed.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(packed.data) == first.data
+        # A gzip ETag only revalidates a gzip response
+        assert packed.headers['ETag'] != first.headers['ETag']
+        plain = client.get(url, headers={'If-None-Match': packed.headers['ETag']})
+        assert plain.status_code == 200 and plain.data == first.data
+        again = client.get(url, headers={'If-None-Match': packed.headers['ETag'], 'Accept-Encoding': 'gzip'})
+        assert again.status_code == 304 and 'Accept-Encoding' in again.vary
+
+
+def test_airport_suggest_prefix_and_typos():
+    client = flight_app.app.test_client()
+
+    def codes(q):
+        return [a['code'] for a in client.get('/api/airports/suggest?q=' + q).get_json()]
+
+    assert codes('jfk') == ['JFK']
+    assert codes('new y') == ['JFK']
+    assert codes('ph') == ['PHX', 'PHL']  # ranked by traffic
+    assert codes('chcago') == ['ORD']
+    assert codes('seatle') == ['SEA']
+    assert codes('zzzz') == []
+
+
+def test_search_page_filters_carry_the_names_search_js_reads():
+    with open(os.path.join(flight_app.BASE_DIR, 'static', 'js', 'search.js')) as source:
+        script = source.read()
+    expected = set(re.findall(r'input\[name="(\w+)"\]', script))
+    assert expected >= {'airline', 'stops', 'departureTime', 'routeType'}
+    page = flight_app.app.test_client().get('/search').get_data(as_text=True)
+    named = re.findall(r'<input[^>]*type="checkbox"[^>]*name="(\w+)"', page)
+    assert set(named) == expected
+    # updateFacetCounts finds each facet group's checkboxes by name too
+    assert set(re.findall(r'(\w+): flightFacets\.', script)) <= set(named)
+
+
+def test_company_table_server_side_query(tmp_path, monkeypatch):
+    use_tmp_stores(tmp_path, monkeypatch)
+    client = flight_app.app.test_client()
+    everything = client.get('/api/company-table').get_json()
+
+    by_size = sorted(everything, key=lambda r: -r['employeeCount'])
+    first = client.get('/api/company-table?sort=employeeCount&dir=desc&limit=4').get_json()
+    assert first['total'] == len(everything)
+    second = client.get('/api/company-table?sort=employeeCount&dir=desc&limit=4&after='
+                        + first['next_after']).get_json()
+    assert first['rows'] + second['rows'] == by_size
+
+    filtered = client.get('/api/company-table?company=LINE&city=o').get_json()
+    expected = [r for r in everything if 'line' in r['company'].lower() and 'o' in r['city'].lower()]
+    assert filtered['rows'] == sorted(expected, key=lambda r: r['company'].lower())
+    assert filtered['total'] == len(expected)
+
+
+def test_company_seed_is_idempotent(tmp_path):
+    with closing(sqlite3.connect(os.path.join(str(tmp_path), 'tables.db'))) as conn:
+        assert flight_app.init_company_tables(conn) == ['company_table', 'company_custom_table']
+        assert flight_app.init_company_tables(conn) == []
+        count = conn.execute("SELECT COUNT(*) FROM company_table").fetchone()[0]
+        assert count == len(flight_app.COMPANY_TABLE_ROWS)
+        assert flight_app.init_company_tables(conn, force=True) == ['company_table', 'company_custom_table']
+
+
+def test_data_pages_batch_and_revalidate(monkeypatch):
+    monkeypatch.setattr(flight_app, 'DATA_PAGE_LATENCY', 0)
+    client = flight_app.app.test_client()
+    singles = [client.get('/api/data-page?page=%d' % page) for page in (2, 3, 4)]
+    batch = client.get('/api/data-pages?from=2&count=3').get_json()
+    assert batch['pages'] == [r.get_json() for r in singles]
+    assert batch['hasMore']
+
+    etag = singles[0].headers['ETag']
+    assert client.get('/api/data-page?page=2', headers={'If-None-Match': etag}).status_code == 304
+    assert flight_app.app.view_functions['data_page'] is flight_app.data_page
+
+
+def test_booking_store_pages_past_and_upcoming(tmp_path):
+    pool = flight_app.company_tables_pool(os.path.join(str(tmp_path), 'tables.db'))
+    now = datetime(2024, 6, 1, 12, 0)
+    store = flight_app.BookingStore(pool, clock=lambda: now)
+    assert store.ensure_seeded('demo@example.com')
+    assert not store.ensure_seeded('demo@example.com')
+    seeded = store.counts('demo@example.com')
+
+    history = flight_app.generate_mock_bookings('x', rng=random.Random(7), now=now - timedelta(days=400))
+    store.add('demo@example.com', history * 10)
+    counts = store.counts('demo@example.com')
+    assert counts['past'] == seeded['past'] + len(history) * 10
+    assert counts['upcoming'] == seeded['upcoming']
+
+    past = []
+    for offset in range(0, counts['past'], 7):
+        past.extend(store.page('demo@example.com', 'past', limit=7, offset=offset))
+    assert len(past) == counts['past']
+    assert all(b['type'] == 'past' and b['departure_date'] < '2024-06-01' for b in past)
+    dates = [b['departure_date'] for b in past]
+    assert dates == sorted(dates, reverse=True)
+    upcoming = store.page('demo@example.com', 'upcoming')
+    assert [b['type'] for b in upcoming] == ['upcoming'] * seeded['upcoming']
+    assert upcoming[0]['departure_airport']['code'] in flight_app.AIRPORTS_BY_CODE
+
+
+@pytest.mark.parametrize('optimistic', [False, True])
+def test_concurrent_bookings_never_oversell(tmp_path, optimistic):
+    result = flight_app.run_booking_load_test(str(tmp_path), workers=16, attempts=120, capacity=50,
+                                              optimistic=optimistic)
+    assert result['booked'] == result['sold'] == result['booking_rows'] == 50
+    assert result['sold_out'] == 70
+    assert result['consistent']
+
+
+def test_booking_api_conflicts(tmp_path, monkeypatch):
+    pool = flight_app.company_tables_pool(os.path.join(str(tmp_path), 'tables.db'))
+    inventory = FlightInventory(os.path.join(str(tmp_path), 'flights.db'))
+    store = flight_app.BookingStore(pool)
+    monkeypatch.setattr(flight_app, 'seat_inventory', flight_app.SeatInventory(pool, inventory, store))
+    flight = inventory.flights[0]
+    client = flight_app.app.test_client()
+
+    seats = client.get('/api/flights/%s/seats' % flight['id']).get_json()
+    assert seats == {'flight_id': flight['id'], 'available': flight['available_seats'], 'version': 0}
+    booked = client.post('/api/bookings', json={'flight_id': flight['id'], 'email': 'a@example.com',
+                                                'version': 0})
+    assert booked.status_code == 201
+    assert booked.get_json()['available'] == flight['available_seats'] - 1
+    # Anonymous bookings stay out of the account with that email
+    assert store.counts('a@example.com')['total'] == 0
+    assert store.counts(flight_app.GUEST_BOOKING_PREFIX + 'a@example.com')['total'] == 1
+    stale = client.post('/api/bookings', json={'flight_id': flight['id'], 'email': 'b@example.com',
+                                               'version': 0})
+    assert stale.status_code == 409 and stale.get_json()['reason'] == 'version'
+    with pool.connection() as conn:
+        conn.execute("UPDATE flight_seats SET capacity = sold + 1")
+        conn.commit()
+    sold_out = client.post('/api/bookings', json={'flight_id': flight['id'], 'email': 'b@example.com',
+                                                  'seats': 2})
+    assert sold_out.status_code == 409 and sold_out.get_json()['available'] == 1
+    assert client.post('/api/bookings', json={'flight_id': 'nope', 'email': 'b@example.com'}).status_code == 404
+    assert client.post('/api/bookings', json={'flight_id': flight['id']}).status_code == 400
+
+
+def test_seat_holds_expire_and_show_in_search(tmp_path, monkeypatch):
+    pool = flight_app.company_tables_pool(os.path.join(str(tmp_path), 'tables.db'))
+    inventory = FlightInventory(os.path.join(str(tmp_path), 'flights.db'))
+    clock = [1000000.0]
+    seats = flight_app.SeatInventory(pool, inventory, flight_app.BookingStore(pool),
+                                     clock=lambda: clock[0], sweep_interval=None)
+    monkeypatch.setattr(flight_app, 'flight_inventory', inventory)
+    monkeypatch.setattr(flight_app, 'seat_inventory', seats)
+    flight = inventory.flights[0]
+    capacity = flight['available_seats']
+    client = flight_app.app.test_client()
+
+    kept = client.post('/api/flights/%s/holds' % flight['id'], json={'seats': 2}).get_json()
+    clock[0] += 60
+    lapsed = seats.hold(flight['id'], seats=1, minutes=1)
+    assert lapsed['available'] == capacity - 3
+
+    route = '/api/flights?origin=%s&destination=%s' % (flight['departure_airport']['code'],
+                                                       flight['arrival_airport']['code'])
+    listed = {f['id']: f for f in client.get(route).get_json()}
+    assert listed[flight['id']]['available_seats'] == capacity - 3
+
+    clock[0] += 61
+    assert seats.sweep() == 1
+    assert seats.availability(flight['id'])['available'] == capacity - 2
+
+    booked = client.post('/api/bookings', json={'flight_id': flight['id'], 'email': 'a@example.com',
+                                                'seats': 2, 'hold_id': kept['hold_id']})
+    assert booked.status_code == 201 and booked.get_json()['available'] == capacity - 2
+    assert client.delete('/api/holds/%s' % kept['hold_id']).status_code == 404
+    other = seats.hold(flight['id'], minutes=1)
+    clock[0] += 50
+    renewed = client.patch('/api/holds/%s' % other['hold_id']).get_json()
+    assert renewed['seats'] == 1 and renewed['expires_at'] > other['expires_at']
+    clock[0] += 60
+    assert seats.sweep() == 0
+    assert client.delete('/api/holds/%s' % other['hold_id']).status_code == 204
+    assert client.patch('/api/holds/%s' % other['hold_id']).status_code == 404
+    assert seats.availability(flight['id'])['available'] == capacity - 2
+
+
+@pytest.mark.parametrize('backend', ['sqlite', 'memory'])
+def test_server_side_sessions(tmp_path, monkeypatch, backend):
+    pool, inventory = use_tmp_stores(tmp_path, monkeypatch)
+    if backend == 'sqlite':
+        store = flight_app.SQLiteSessionStore(pool)
+    else:
+        store = flight_app.MemorySessionStore(max_entries=2)
+    monkeypatch.setattr(flight_app.app, 'session_interface', flight_app.ServerSessionInterface(store))
+    client = flight_app.app.test_client()
+    cookie_name = flight_app.app.config['SESSION_COOKIE_NAME']
+
+    flight_id = inventory.flights[0]['id']
+    client.get('/booking/%s' % flight_id)
+    anonymous = client.get_cookie(cookie_name).value
+    response = client.post('/signin', data={'email': 'demo@example.com', 'password': 'demo123'})
+    assert response.status_code == 302
+    sid = client.get_cookie(cookie_name).value
+    assert sid != anonymous and store.get(anonymous) is None
+    payload, _ = store.get(sid)
+    assert 'demo@example.com' in payload and len(sid) < 64
+    page = client.get('/client-area')
+    assert page.status_code == 200 and 'Cookie' in page.vary
+    assert 'Cookie' not in client.get('/api/airports').vary
+
+    client.get('/signout')
+    assert store.get(sid) is None and client.get_cookie(cookie_name) is None
+    assert client.get('/client-area').status_code == 302
+
+    store.save('stale', '{}', 0)
+    assert store.purge() == 1
+
+
+def test_password_hashing_and_login_throttle(tmp_path, monkeypatch):
+    hasher = flight_app.PasswordHasher(workers=1, max_pending=0, n=2 ** 10)
+    encoded = hasher.hash('s3cret')
+    assert encoded.startswith('scrypt$1024$') and hasher.verify('s3cret', encoded)
+    assert not hasher.verify('wrong', encoded) and not hasher.verify('s3cret', None)
+
+    clock = [1200.0]
+    limiter = flight_app.SlidingWindowLimiter(3, 60, clock=lambda: clock[0])
+    for _ in range(3):
+        assert limiter.retry_after('a') == 0
+        limiter.hit('a')
+    assert limiter.retry_after('a') > 0
+    clock[0] += 60  # the previous window still fully overlaps
+    assert limiter.retry_after('a') > 0
+    clock[0] += 30  # now only half of it does
+    assert limiter.retry_after('a') == 0
+    clock[0] += 200
+    limiter.hit('b')
+    assert len(limiter) == 1
+
+    use_tmp_stores(tmp_path, monkeypatch)
+    monkeypatch.setattr(flight_app, 'login_failures', flight_app.SlidingWindowLimiter(2, 300))
+    monkeypatch.setattr(flight_app, 'login_ip_failures', flight_app.SlidingWindowLimiter(3, 300))
+    client = flight_app.app.test_client()
+
+    def sign_in(email, password, ip='10.0.0.1'):
+        return client.post('/signin', data={'email': email, 'password': password},
+                           environ_base={'REMOTE_ADDR': ip})
+
+    for _ in range(2):
+        assert sign_in('demo@example.com', 'nope').status_code == 200
+    throttled = sign_in('demo@example.com', 'demo123')
+    assert throttled.status_code == 429 and 'Retry-After' in throttled.headers
+    # The same account from another address, and another account behind the same one, still work
+    assert sign_in('demo@example.com', 'demo123', ip='10.0.0.2').status_code == 302
+    assert sign_in('other@example.com', 'nope').status_code == 200
+    # ...until that address has failed too often across accounts
+    assert sign_in('third@example.com', 'nope').status_code == 429
+
+
+def test_minifiers_keep_literals():
+    js = "var a = b / c; // note\nvar r = /\\/\\/x/g;\nvar t = `a ${b ? `c - ${d}` : 'e'}  f`;\nreturn a + +b\n"
+    assert flight_app.minify_js(js) == "var a=b/c;var r=/\\/\\/x/g;var t=`a ${b ? `c - ${d}` : 'e'}  f`;return a+ +b\n"
+    css = "/* c */ .a  .b:hover , c > d { color : red ; content: 'x  ;}' ; }"
+    assert flight_app.minify_css(css) == ".a .b:hover,c>d{color : red;content: 'x  ;}'}\n"
+
+
+def test_built_assets_are_fingerprinted_and_precompressed(tmp_path, monkeypatch):
+    manifest = flight_app.build_assets(dist_dir=str(tmp_path))
+    built = manifest['js/tables.js']
+    assert built.startswith('js/tables.') and (tmp_path / (built + '.gz')).exists()
+    monkeypatch.setattr(flight_app, 'ASSET_DIST_DIR', str(tmp_path))
+    monkeypatch.setattr(flight_app, 'asset_manifest', manifest)
+
+    client = flight_app.app.test_client()
+    page = client.get('/tables').get_data(as_text=True)
+    assert '/assets/%s' % built in page and 'js/booking' not in page
+    response = client.get('/assets/%s' % built, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'immutable' in response.headers['Cache-Control']
+    assert gzip.decompress(response.get_data()) == (tmp_path / built).read_bytes()
+    assert client.get('/assets/js/missing.js').status_code == 404
+
+
+def test_built_images_have_responsive_variants(tmp_path, monkeypatch):
+    svg = '<?xml version="1.0" encoding="UTF-8"?>\n<!-- c -->\n<svg>\n  <path d="M 0.50 10.0 L -3.250, 4 Z"/>\n  <text> a  b </text>\n</svg>\n'
+    assert flight_app.minify_svg(svg) == '<svg><path d="M.5 10L-3.25, 4Z"/><text> a  b </text></svg>\n'
+
+    images = flight_app.build_images(dist_dir=str(tmp_path))
+    manifest = json.loads((tmp_path / 'manifest.json').read_text())
+    assert manifest['images/WB.svg'].startswith('images/WB.') and (tmp_path / (manifest['images/WB.svg'] + '.gz')).exists()
+    monkeypatch.setattr(flight_app, 'ASSET_DIST_DIR', str(tmp_path))
+    monkeypatch.setattr(flight_app, 'asset_manifest', manifest)
+    monkeypatch.setattr(flight_app, 'image_manifest', images)
+    client = flight_app.app.test_client()
+    page = client.get('/images').get_data(as_text=True)
+    assert '/assets/%s' % manifest['images/svg4.svg'] in page
+    if flight_app.Image is None:
+        return
+
+    entry = images['images/gplaypattern.jpg']
+    assert [w for w, _ in entry['srcset']['image/jpeg']] == [160, entry['width']]
+    webp = entry['srcset']['image/webp'][-1][1]
+    assert (tmp_path / webp).stat().st_size < (tmp_path / manifest['images/gplaypattern.jpg']).stat().st_size
+    assert images['images/Toolsqa.jpg']['type'] == 'image/webp'
+    logo = images['images/download3.jpeg']
+    assert 'srcset="/assets/%s 160w, ' % logo['srcset']['image/jpeg'][0][1] in page
+    assert 'width="%d" height="%d"' % (logo['width'], logo['height']) in page
+    assert client.get('/assets/%s' % webp).mimetype == 'image/webp'
+
+
 if __name__ == "__main__":
     test_flight_generation()